@@ -0,0 +1,232 @@
+import asyncio
+import inspect
+import logging
+import time
+import urllib.parse
+from .. import APILibError
+from ..route import Router, Context, DeadlineExceeded
+from ..admission import AdmissionRejected
+from .common import RawResponse, dump_json, decode_arguments, RequestHandleFailed
+
+__all__ = ['ASGIAdapter']
+
+logger = logging.getLogger(__name__)
+
+
+class ASGIRequest:
+    '''对一个 ASGI HTTP 请求的简单封装，提供与 tornado RequestHandler 类似的接口，使 output_formatter 可以在两种 adapter 间通用
+
+    Attributes:
+
+    * scope: ASGI scope
+    * method: 大写的 HTTP method
+    * path: URL path
+    * headers: dict(小写的 header 名: 值)
+    * query_arguments: dict(name: [value, ...])
+    * body: bytes
+    * status: 要返回给客户端的 HTTP 状态码
+    * deadline: 由 adapter 根据 timeout 设置为此次请求计算出的截止时间
+    '''
+    def __init__(self, scope, body):
+        self.scope = scope
+        self.method = scope['method'].upper()
+        self.path = scope['path']
+        self.headers = {
+            name.decode('latin-1').lower(): value.decode('latin-1')
+            for name, value in scope.get('headers', [])
+        }
+        self.query_arguments = urllib.parse.parse_qs(
+            scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True)
+        self.body = body
+        self.status = 200
+        self.deadline = None
+        self._response_headers = {}
+
+    def set_status(self, status):
+        self.status = status
+
+    def set_header(self, name, value):
+        self._response_headers[name] = str(value)
+
+    def get_argument(self, name, default=None):
+        '''与 tornado 的 RequestHandler.get_argument() 类似，从 urlencoded POST body 或 query string 中取值'''
+        if self.headers.get('content-type', '').startswith('application/x-www-form-urlencoded'):
+            body_arguments = urllib.parse.parse_qs(self.body.decode('latin-1'), keep_blank_values=True)
+            if name in body_arguments:
+                return body_arguments[name][-1]
+        if name in self.query_arguments:
+            return self.query_arguments[name][-1]
+        return default
+
+
+class ASGIContext(Context):
+    '''
+    Attributes:
+
+    * request: 与当前 HTTP Request 对应的 `ASGIRequest` 实例
+    '''
+    def __init__(self, router, request):
+        self.request = request
+        super().__init__(router)
+        self.deadline = getattr(request, 'deadline', None)
+
+
+class ASGIAdapter:
+    '''把 router 转换成一个 ASGI application，可以部署在任意 ASGI server（uvicorn、hypercorn 等）之上。
+
+    HTTP 请求的格式约定与 `TornadoAdapter` 相同：
+    route path 通过 URL 指定（path_prefix 之后的部分），arguments 通过 JSON POST body、POST field 或 query string 指定。
+
+        adapter = ASGIAdapter(path_prefix='/api/')
+
+        @adapter.router.register('a.b.c')
+        def fn(context):
+            return dict(result=True)
+
+        # uvicorn module:adapter
+        # GET /api/a.b.c  => Response: {"result": true}
+
+    此 adapter 只响应 GET 和 POST 请求。
+    '''
+    def __init__(self, router=None, output_formatter=dump_json, path_prefix='/',
+                 default_timeout=None, timeout_header=None):
+        '''
+        :arg router: 指定要把 adapter 绑定到哪个 router。若未指定此参数，adapter 会自己创建一个。
+          注意，adapter 要求与它绑定的 router 的 Context 类型能够接收一个 `ASGIRequest` 实例作为 context data
+
+        :arg output_formatter: 对 interface 的返回值进行格式化的函数，与 `TornadoAdapter` 的 output_formatter 接口相同。
+          它会接收到两个参数： call result 和 `ASGIRequest` 对象，返回值可以是 str 或 bytes
+
+        :arg string path_prefix: URL path 中 route path 之前的部分
+        :arg float default_timeout: 每个请求的默认超时时间（秒），None 代表不限制
+        :arg string timeout_header: 若指定，客户端可以通过这个 HTTP Header 指定请求的超时时间（秒）
+        '''
+        self.router = router or Router(ASGIContext)
+        self.output_formatter = output_formatter
+        self.path_prefix = path_prefix
+        self.default_timeout = default_timeout
+        self.timeout_header = timeout_header
+
+    def bind_router(self, router):
+        '''将 adapter 绑定到另一个 router 上'''
+        self.router = router
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.handle_lifespan(receive, send)
+        elif scope['type'] == 'http':
+            body = await self.read_body(receive)
+            if body is None:
+                return
+            request = ASGIRequest(scope, body)
+            output = await self.handle_request(request)
+            await self.send_response(send, request, output)
+
+    async def handle_lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def read_body(self, receive):
+        '''读取完整的 request body。若客户端在此期间断开连接，返回 None'''
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body', False):
+                return b''.join(chunks)
+
+    async def handle_request(self, request):
+        '''进行 HTTP Request 与 interface Call 之间的转换，返回要输出给客户端的内容'''
+        if request.method not in ['GET', 'POST']:
+            return self.error(request, 405, 'Method Not Allowed')
+        if not request.path.startswith(self.path_prefix) or len(request.path) == len(self.path_prefix):
+            return self.error(request, 404, 'Not Found')
+        route_path = urllib.parse.unquote(request.path[len(self.path_prefix):])
+
+        try:
+            arguments = self.extract_arguments(request)
+            timeout = self.get_timeout(request)
+            if timeout is None:
+                result = await self.call_interface(request, route_path, arguments)
+            else:
+                request.deadline = time.monotonic() + timeout
+                try:
+                    result = await asyncio.wait_for(self.call_interface(request, route_path, arguments), timeout)
+                except asyncio.TimeoutError:
+                    if time.monotonic() < request.deadline:
+                        raise
+                    raise DeadlineExceeded('interface 执行超时')
+        except RequestHandleFailed as e:
+            return self.error(request, 400, str(e))
+        except AdmissionRejected as e:
+            return self.error(request, e.status_code, str(e))
+        except DeadlineExceeded as e:
+            return self.error(request, 504, str(e))
+        except APILibError as e:
+            # 参数不合法、route 不存在等由调用方引起的错误
+            return self.error(request, 400, str(e))
+        except Exception:
+            logger.exception('interface 调用失败: %s', route_path)
+            return self.error(request, 500, 'Internal Server Error')
+
+        if isinstance(result, RawResponse):
+            request.set_header('Content-Type', result.content_type)
+            return result.body
+        return self.output_formatter(result, request)
+
+    async def call_interface(self, request, route_path, arguments):
+        '''这里把对 interface 的调用单独拆分出一个方法，是为了让使用者能方便地对此行为进行扩展'''
+        ret_val = self.router.call(route_path, request, arguments)
+        if inspect.isawaitable(ret_val):
+            ret_val = await ret_val
+        return ret_val
+
+    def error(self, request, status, message):
+        request.set_status(status)
+        request.set_header('Content-Type', 'text/plain; charset=utf-8')
+        return message
+
+    async def send_response(self, send, request, output):
+        if isinstance(output, str):
+            output = output.encode()
+        elif output is None:
+            output = b''
+        headers = [(name.encode('latin-1'), value.encode('latin-1'))
+                   for name, value in request._response_headers.items()]
+        headers.append((b'content-length', str(len(output)).encode()))
+        await send({'type': 'http.response.start', 'status': request.status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': output})
+
+    def extract_arguments(self, request):
+        '''从 HTTP Request 中提取出 arguments，规则与 `TornadoAdapter.extract_arguments()` 相同
+
+        注意：POST field 只支持 application/x-www-form-urlencoded 格式的 body，不支持 multipart/form-data'''
+        raw_arguments = request.get_argument('arguments', default='')
+        if raw_arguments == '' and request.headers.get('content-type', '').startswith('application/json'):
+            try:
+                raw_arguments = request.body.strip().decode()
+            except UnicodeDecodeError:
+                raise RequestHandleFailed('arguments 中包含非法字符')
+        return decode_arguments(raw_arguments)
+
+    def get_timeout(self, request):
+        '''根据 default_timeout 和 timeout_header 计算此次请求的超时时间（秒），None 代表不限制'''
+        timeout = self.default_timeout
+        if self.timeout_header is not None:
+            raw_timeout = request.headers.get(self.timeout_header.lower())
+            if raw_timeout is not None:
+                try:
+                    header_timeout = float(raw_timeout)
+                except ValueError:
+                    header_timeout = float('nan')
+                if header_timeout != header_timeout or header_timeout < 0:
+                    raise RequestHandleFailed('{} 的值不合法'.format(self.timeout_header))
+                timeout = header_timeout if timeout is None else min(timeout, header_timeout)
+        return timeout
@@ -0,0 +1,98 @@
+'''各 adapter 共用的 HTTP 请求处理逻辑'''
+import json
+import inspect
+import logging
+from .. import APILibError
+from ..route import DeadlineExceeded
+from ..admission import AdmissionRejected
+
+__all__ = ['RawResponse', 'dump_json', 'decode_arguments', 'parse_call_message', 'call_for_message',
+           'RequestHandleFailed']
+
+logger = logging.getLogger(__name__)
+
+
+class RawResponse:
+    '''interface 返回此类型的对象时，adapter 不再调用 output_formatter，而是把 body 原样输出给客户端'''
+    def __init__(self, body, content_type='text/plain; charset=utf-8'):
+        self.body = body
+        self.content_type = content_type
+
+
+def dump_json(result, req_handler):
+    '''默认的 output formatter，把 interface 的返回值转换成 JSON
+
+    :arg req_handler: 代表当前请求的对象，各 adapter 提供的对象都有 set_header() 方法'''
+    req_handler.set_header('Content-Type', 'application/json')
+    return json.dumps(result)
+
+
+def decode_arguments(raw_arguments):
+    '''把客户端提交的 arguments JSON 字符串解析成 dict。空字符串代表没有提供 arguments
+
+    :arg string raw_arguments: 从 POST body、POST field 或 query string 中取得的 arguments JSON'''
+    if len(raw_arguments):
+        try:
+            arguments = json.loads(raw_arguments)
+            if type(arguments) is not dict:
+                raise ValueError()
+        except ValueError:
+            # Python 3.5 里，json 抛出的异常变成了 JSONDecodeError，不过它貌似是 ValueError 的子类，所以依然可以这样捕获
+            raise RequestHandleFailed('arguments 格式不合法: ' + raw_arguments)
+    else:
+        arguments = {}
+    return arguments
+
+
+def parse_call_message(raw_message):
+    '''解析以消息形式发起的调用（WebSocket、socket adapter 等）。
+    消息是一个 JSON object：{"id": 调用 id, "path": route path, "arguments": {...}}
+
+    :return: (call_id, route_path, arguments)'''
+    try:
+        message = json.loads(raw_message)
+        if type(message) is not dict or type(message.get('path')) is not str:
+            raise ValueError()
+        arguments = message.get('arguments', {})
+        if type(arguments) is not dict:
+            raise ValueError()
+    except ValueError:
+        raise RequestHandleFailed('消息格式不合法')
+    return message.get('id'), message['path'], arguments
+
+
+async def call_for_message(router, context, call_id, route_path, arguments):
+    '''执行以消息形式发起的调用，返回要回复给客户端的消息（dict）：
+    成功时为 {"id": 调用 id, "result": 返回值}
+    失败时为 {"id": 调用 id, "error": 错误信息, "status": 与 HTTP 状态码含义相同的错误码}
+
+    同一个连接上的各条消息共用一个 context，每条消息相当于一次请求，处理完毕后会清除 context 中只在一次请求中有效的状态'''
+    try:
+        ret_val = router.call(route_path, context, arguments)
+        if inspect.isawaitable(ret_val):
+            ret_val = await ret_val
+        return dict(id=call_id, result=ret_val)
+    except AdmissionRejected as e:
+        return dict(id=call_id, error=str(e), status=e.status_code)
+    except DeadlineExceeded as e:
+        return dict(id=call_id, error=str(e), status=504)
+    except APILibError as e:
+        return dict(id=call_id, error=str(e), status=400)
+    except Exception:
+        logger.exception('interface 调用失败: %s', route_path)
+        return dict(id=call_id, error='Internal Server Error', status=500)
+    finally:
+        context.end_request()
+
+
+def dump_message(response):
+    '''把要回复给客户端的消息转换成 JSON。若 interface 的返回值无法转换成 JSON，改为回复一条错误消息'''
+    try:
+        return json.dumps(response)
+    except (TypeError, ValueError):
+        logger.exception('interface 的返回值无法转换成 JSON')
+        return json.dumps(dict(id=response['id'], error='Internal Server Error', status=500))
+
+
+class RequestHandleFailed(APILibError):
+    pass
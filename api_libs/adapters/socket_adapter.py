@@ -0,0 +1,239 @@
+'''
+通过 TCP 或 Unix domain socket 提供 interface 调用，用于内部服务之间的 RPC。
+
+与 HTTP 相比，省去了请求解析、header 处理等开销；同一个连接上可以流水线式（pipelined）地连续发送多个调用，
+服务端会并发执行它们，并按完成的先后顺序返回结果。
+
+协议：每一帧由 4 字节的 big-endian 无符号整数（payload 的长度）和 UTF-8 编码的 JSON payload 组成。
+调用消息与回复消息的格式与 `TornadoAdapter` 的 WebSocketHandler 相同：
+    请求：{"id": 调用 id, "path": route path, "arguments": {...}}
+    回复：{"id": 调用 id, "result": 返回值} 或 {"id": 调用 id, "error": 错误信息, "status": 错误码}
+
+    adapter = SocketAdapter()
+
+    @adapter.router.register('a.b.c')
+    def fn(context):
+        return dict(result=True)
+
+    server = await adapter.start_server('127.0.0.1', 9000)
+
+    client = await SocketClient.connect('127.0.0.1', 9000)
+    await client.call('a.b.c')      # {'result': True}
+'''
+import asyncio
+import itertools
+import json
+import struct
+from .. import APILibError
+from ..route import Router, Context
+from .common import parse_call_message, call_for_message, dump_message, RequestHandleFailed
+
+__all__ = ['SocketAdapter', 'SocketClient', 'RemoteCallFailed']
+
+
+_header = struct.Struct('>I')
+
+DEFAULT_MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+
+async def read_frame(reader, max_frame_size=DEFAULT_MAX_FRAME_SIZE):
+    '''读取一帧，返回 payload（bytes）。连接已正常关闭时返回 None'''
+    try:
+        header = await reader.readexactly(_header.size)
+    except asyncio.IncompleteReadError as e:
+        if len(e.partial) == 0:
+            return None
+        raise FrameError('连接在帧头传输过程中断开')
+    size, = _header.unpack(header)
+    if size > max_frame_size:
+        raise FrameError('帧的长度（{}）超出了限制（{}）'.format(size, max_frame_size))
+    try:
+        return await reader.readexactly(size)
+    except asyncio.IncompleteReadError:
+        raise FrameError('连接在帧内容传输过程中断开')
+
+
+def write_frame(writer, payload):
+    if isinstance(payload, str):
+        payload = payload.encode()
+    writer.write(_header.pack(len(payload)) + payload)
+
+
+class SocketContext(Context):
+    '''
+    Attributes:
+
+    * connection: 当前调用所在连接的 `asyncio.StreamWriter`，可以通过它取得 peername 等信息
+    '''
+    def __init__(self, router, connection):
+        self.connection = connection
+        super().__init__(router)
+
+
+class SocketAdapter:
+    '''把 router 通过 TCP / Unix domain socket 提供出来
+
+    每个连接只会创建一个 context 对象，此连接上的所有调用共享它。
+    不过每条消息都相当于一次单独的请求：memoize 记录的结果等只在一次请求中有效的状态，会在每条消息处理完毕后被清除。
+    '''
+    def __init__(self, router=None, max_concurrency=64, max_frame_size=DEFAULT_MAX_FRAME_SIZE):
+        '''
+        :arg router: 指定要把 adapter 绑定到哪个 router。若未指定此参数，adapter 会自己创建一个。
+          注意，adapter 要求与它绑定的 router 的 Context 类型能够接收一个 `asyncio.StreamWriter` 实例作为 context data
+        :arg int max_concurrency: 每个连接上同时执行的调用数上限。达到上限后，会暂停读取此连接上的新消息
+        :arg int max_frame_size: 每一帧的最大长度（字节）。收到超出此长度的帧时，会直接关闭连接
+        '''
+        self.router = router or Router(SocketContext)
+        self.max_concurrency = max_concurrency
+        self.max_frame_size = max_frame_size
+
+    def bind_router(self, router):
+        '''将 adapter 绑定到另一个 router 上'''
+        self.router = router
+
+    async def start_server(self, host=None, port=None, **kwargs):
+        '''开始监听 TCP 端口，返回 `asyncio.Server`。额外的 kwargs 会原样传给 `asyncio.start_server()`'''
+        return await asyncio.start_server(self.handle_connection, host, port, **kwargs)
+
+    async def start_unix_server(self, path, **kwargs):
+        '''开始监听 Unix domain socket，返回 `asyncio.Server`'''
+        return await asyncio.start_unix_server(self.handle_connection, path, **kwargs)
+
+    async def handle_connection(self, reader, writer):
+        context = self.router.context_cls(self.router, writer)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        pending_tasks = set()
+
+        def on_done(task):
+            pending_tasks.discard(task)
+            semaphore.release()
+
+        try:
+            while True:
+                payload = await read_frame(reader, self.max_frame_size)
+                if payload is None:
+                    break
+
+                try:
+                    call_id, route_path, arguments = parse_call_message(payload)
+                except RequestHandleFailed as e:
+                    write_frame(writer, dump_message(dict(id=None, error=str(e), status=400)))
+                    continue
+
+                await semaphore.acquire()
+                task = asyncio.ensure_future(self._call(writer, context, call_id, route_path, arguments))
+                pending_tasks.add(task)
+                task.add_done_callback(on_done)
+        except (FrameError, ConnectionError):
+            pass
+        finally:
+            for task in list(pending_tasks):
+                task.cancel()
+            writer.close()
+
+    async def _call(self, writer, context, call_id, route_path, arguments):
+        response = await call_for_message(self.router, context, call_id, route_path, arguments)
+        if writer.is_closing():
+            return
+        try:
+            write_frame(writer, dump_message(response))
+            await writer.drain()
+        except ConnectionError:
+            # 等待写出的过程中客户端断开了连接，回复无法送达，直接丢弃
+            pass
+
+
+class SocketClient:
+    '''SocketAdapter 的客户端。
+    同一个 client 上的多个调用可以并发进行，它们会流水线式地通过同一个连接发送出去'''
+    def __init__(self, reader, writer, max_frame_size=DEFAULT_MAX_FRAME_SIZE):
+        self.reader = reader
+        self.writer = writer
+        self.max_frame_size = max_frame_size
+        self._ids = itertools.count()
+        self._waiters = {
+            # call_id: future
+        }
+        self._read_task = asyncio.ensure_future(self._read_loop())
+
+    @classmethod
+    async def connect(cls, host, port, **kwargs):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer, **kwargs)
+
+    @classmethod
+    async def connect_unix(cls, path, **kwargs):
+        reader, writer = await asyncio.open_unix_connection(path)
+        return cls(reader, writer, **kwargs)
+
+    async def call(self, route_path, arguments={}):
+        '''调用服务端的 interface，返回它的返回值。调用失败时抛出 RemoteCallFailed'''
+        if self._read_task.done():
+            raise RemoteCallFailed('连接已关闭', None)
+        call_id = next(self._ids)
+        waiter = self._waiters[call_id] = asyncio.get_running_loop().create_future()
+        try:
+            try:
+                write_frame(self.writer, dump_message(dict(id=call_id, path=route_path, arguments=arguments)))
+                await self.writer.drain()
+            except ConnectionError as e:
+                raise RemoteCallFailed('连接出错: {}'.format(e), None)
+            response = await waiter
+        finally:
+            self._waiters.pop(call_id, None)
+
+        if 'error' in response:
+            raise RemoteCallFailed(response['error'], response.get('status'))
+        return response['result']
+
+    async def _read_loop(self):
+        error = RemoteCallFailed('连接已关闭', None)
+        try:
+            while True:
+                payload = await read_frame(self.reader, self.max_frame_size)
+                if payload is None:
+                    break
+                response = parse_response(payload)
+                waiter = self._waiters.get(response.get('id'))
+                if waiter is not None and not waiter.done():
+                    waiter.set_result(response)
+        except (FrameError, ConnectionError, ValueError) as e:
+            error = RemoteCallFailed('连接出错: {}'.format(e), None)
+        finally:
+            for waiter in self._waiters.values():
+                if not waiter.done():
+                    waiter.set_exception(error)
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+        self._read_task.cancel()
+        try:
+            await self._read_task
+        except asyncio.CancelledError:
+            pass
+
+
+def parse_response(payload):
+    response = json.loads(payload)
+    if type(response) is not dict:
+        raise ValueError('回复消息格式不合法')
+    return response
+
+
+class FrameError(APILibError):
+    pass
+
+
+class RemoteCallFailed(APILibError):
+    '''
+    Attributes:
+
+    * status: 服务端返回的错误码（含义与 HTTP 状态码相同），连接出错时为 None
+    '''
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
@@ -1,9 +1,14 @@
-from tornado.web import RequestHandler
+from tornado.web import RequestHandler, HTTPError
+from tornado.websocket import WebSocketHandler, WebSocketClosedError
 import tornado.concurrent
-import json
+import time
+import random
 import asyncio
-from .. import APILibError
-from ..route import Router, Context
+from ..route import Router, Context, DeadlineExceeded
+from ..admission import AdmissionRejected
+from .. import timing, tracing
+from .common import RawResponse, dump_json, decode_arguments, parse_call_message, call_for_message, dump_message, \
+    RequestHandleFailed
 
 __all__ = ['TornadoAdapter']
 
@@ -13,15 +18,12 @@ class TornadoContext(Context):
     Attributes:
 
     * req_handler: 与当前 HTTP Request 对应的 `tornado.web.RequestHandler` 实例
+    * deadline: 由 adapter 根据 timeout 设置为此次请求计算出的截止时间
     '''
     def __init__(self, router, req_handler):
         self.req_handler = req_handler
         super().__init__(router)
-
-
-def dump_json(result, req_handler):
-    req_handler.set_header('Content-Type', 'application/json')
-    return json.dumps(result)
+        self.deadline = getattr(req_handler, 'deadline', None)
 
 
 class TornadoAdapter:
@@ -40,9 +42,20 @@ class TornadoAdapter:
 
       此 RequestHandler 只响应 GET 和 POST 请求
 
+    * WebSocketHandler: 通过一个持久的 WebSocket 连接并发地调用多个 interface。
+      它的 url pattern 中不需要 regex group，例如: (r'/api-ws', WebSocketHandler)
+
+      客户端发送的每一条消息都是一个 JSON object：{"id": 调用 id, "path": route path, "arguments": {...}}
+      同一个连接上的各个调用会并发执行，调用完成后按完成顺序返回：{"id": 调用 id, "result": 返回值}
+      调用失败时返回：{"id": 调用 id, "error": 错误信息, "status": 与 HTTP 状态码含义相同的错误码}
+      每个连接只会创建一个 context 对象，此连接上的所有调用共享它；返回值总是以 JSON 格式输出，不经过 output_formatter
+
     adapter 的使用方法见 README.md 中的示例代码
     '''
-    def __init__(self, router=None, output_formatter=dump_json):
+    def __init__(self, router=None, output_formatter=dump_json,
+                 default_timeout=None, timeout_header=None, cancel_on_close=False, ws_max_concurrency=16,
+                 server_timing=False, phase_hook=None, profiler=None, allocation_sample_rate=0, recorder=None,
+                 tracer=None, slow_log=None):
         '''
         :arg router: 指定要把 adapter 绑定到哪个 router。
           若未指定此此参数，adapter 会自己创建一个。
@@ -51,23 +64,151 @@ class TornadoAdapter:
         :arg output_formatter: RequestHandler 会调用此函数对 interface 的返回值进行格式化后，再把得到的内容输出给客户端。
           默认是转换成 JSON，你可以自己指定一个函数，来转换成其他格式。
           此函数会接收到两个参数： call result 和 RequestHandler 对象。第二个参数用来输出自定义的 HTTP Header
+
+        :arg float default_timeout: 每个请求的默认超时时间（秒），None 代表不限制
+        :arg string timeout_header: 若指定，客户端可以通过这个 HTTP Header 指定请求的超时时间（秒），
+          例如 ``X-Request-Timeout: 1.5``。它不能比 default_timeout 更长。
+        :arg bool cancel_on_close: 客户端断开连接时，是否 cancel 正在执行的 interface coroutine
+
+        请求的截止时间会被设置到 RequestHandler 和 `TornadoContext` 的 deadline 属性上，对嵌套调用同样有效。
+        超过截止时间后，正在执行的 interface coroutine 会被 cancel，并向客户端返回 HTTP 504。
+        注意：同步 interface 以及在线程池 / 进程池中执行的 interface 无法被中途打断。
+
+        :arg int ws_max_concurrency: 每个 WebSocket 连接上同时执行的调用数上限。
+          达到上限后，会暂停读取此连接上的新消息，直到有调用完成
+
+        :arg bool server_timing: 是否通过 Server-Timing HTTP Header 输出此次请求各阶段（parse / validate / execute / serialize）的耗时
+        :arg phase_hook: 若指定，每个请求处理完毕后（无论成功与否）都会调用此函数，
+          它会接收到 RequestHandler、route path 和记录了各阶段耗时的 `api_libs.timing.PhaseTimer` 三个参数
+
+        server_timing、phase_hook、slow_log 以及 router 的 metrics 中任一项启用时，adapter 都会记录各阶段的耗时，
+        并在 router 指定了 metrics 时把它们记录进去
+
+        :arg profiler: 若指定，可以按需对单个请求进行 profiling，详见 `api_libs.request_profiling`
+        :type profiler: ``api_libs.request_profiling.RequestProfiler`` or ``None``
+
+        :arg float allocation_sample_rate: 随机选取这个比例（0 ~ 1）的请求，通过 tracemalloc 记录它们各阶段的内存分配情况。
+          被选中的请求会以 `api_libs.timing.AllocationTracker` 代替 PhaseTimer，结果同样交给 phase_hook 和 router 的 metrics。
+          tracemalloc 开启期间整个进程都会变慢，同一时间也最多只会记录一个请求，因此这个比例应该设得很小
+
+        :arg recorder: 若指定，会按它的设置抽样录制请求的 route path、arguments 与耗时，用于离线回放，详见 `api_libs.recording`
+        :type recorder: ``api_libs.recording.TrafficRecorder`` or ``None``
+
+        :arg tracer: 若指定，会按它的采样设置为请求创建 span，记录请求、各 interface 调用（包括嵌套调用）与参数检查的耗时，
+          并支持通过 traceparent Header 传递 trace context，详见 `api_libs.tracing`
+        :type tracer: ``api_libs.tracing.Tracer`` or ``None``
+
+        :arg slow_log: 若指定，耗时超过阈值的请求会连同参数摘要、各阶段耗时、嵌套调用的耗时和响应大小一起被记录下来，
+          详见 `api_libs.slow_log`
+        :type slow_log: ``api_libs.slow_log.SlowRequestLog`` or ``None``
         '''
         self.output_formatter = output_formatter
         self.router = router or Router(TornadoContext)
+        self.default_timeout = default_timeout
+        self.timeout_header = timeout_header
+        self.cancel_on_close = cancel_on_close
+        self.ws_max_concurrency = ws_max_concurrency
+        self.server_timing = server_timing
+        self.phase_hook = phase_hook
+        self.profiler = profiler
+        self.allocation_sample_rate = allocation_sample_rate
+        self.recorder = recorder
+        self.tracer = tracer
+        self.slow_log = slow_log
+        # 正在处理中的 HTTP 请求数，用于在关闭服务时等待它们处理完毕
+        self.in_flight = 0
 
         class AdaptedRequestHandler(RequestHandler):
             '''
             为了支持异步行为，handler 以 async 函数的方式运行。
             不过 interface 并不要求非得是 async 函数，即使是普通函数，handler 也能正常处理。
             '''
+            deadline = None
+            interface_task = None
+            connection_closed = False
+            # 以下几项供慢请求日志使用（只在指定了 slow_log 时才会被设置）
+            route_path = None
+            phase_timer = None
+            call_arguments = None
+            response_size = None
+
             async def get(handler_self, route_path):
-                await self.handle_request(handler_self, route_path)
+                await handler_self.handle(route_path)
 
             async def post(handler_self, route_path):
-                await self.handle_request(handler_self, route_path)
+                await handler_self.handle(route_path)
+
+            async def handle(handler_self, route_path):
+                self.in_flight += 1
+                timer = span = token = span_token = None
+                # timer（可能是占用着全局 tracemalloc 的 AllocationTracker）与 span 都在 try 中创建，
+                # 这样即使后续的准备工作出错，finally 也能把它们结束掉
+                try:
+                    timer = self.create_timer(route_path)
+                    if self.slow_log is not None:
+                        handler_self.route_path = route_path
+                        handler_self.phase_timer = timer
+                    if timer is not None:
+                        token = timing.activate(timer)
+                        timer.start()
+                    if self.tracer is not None:
+                        span = self.start_span(handler_self, route_path)
+                    if span is not None:
+                        span_token = tracing.activate(span)
+
+                    coro = self.handle_request(handler_self, route_path)
+                    if self.profiler is not None:
+                        coro = self.profiler.wrap(handler_self, self.router.route_name(route_path), coro)
+                    await coro
+                except Exception as e:
+                    if span is not None:
+                        span.set_error(e)
+                        span.set_attribute('http.status_code', getattr(e, 'status_code', 500))
+                    raise
+                finally:
+                    self.in_flight -= 1
+                    if span_token is not None:
+                        tracing.deactivate(span_token)
+                    if span is not None:
+                        span.attributes.setdefault('http.status_code', handler_self.get_status())
+                        span.finish()
+                    if timer is not None:
+                        timer.stop()
+                        if token is not None:
+                            timing.deactivate(token)
+                        self.report_phases(handler_self, route_path, timer)
+
+            def on_finish(handler_self):
+                if self.slow_log is not None and handler_self.route_path is not None:
+                    self.slow_log.observe(
+                        self.router.route_name(handler_self.route_path), handler_self.request.request_time(),
+                        handler_self.phase_timer, handler_self.call_arguments, handler_self.get_status(),
+                        handler_self.response_size)
+
+            def on_connection_close(handler_self):
+                handler_self.connection_closed = True
+                if self.cancel_on_close and handler_self.interface_task is not None:
+                    handler_self.interface_task.cancel()
 
         self.RequestHandler = AdaptedRequestHandler
 
+        class AdaptedWebSocketHandler(WebSocketHandler):
+            '''每个连接对应一个 handler 实例，也对应一个 context 对象'''
+            def open(handler_self):
+                handler_self.context = self.router.context_cls(self.router, handler_self)
+                handler_self.semaphore = asyncio.Semaphore(self.ws_max_concurrency)
+                handler_self.pending_tasks = set()
+
+            async def on_message(handler_self, message):
+                await self.handle_ws_message(handler_self, message)
+
+            def on_close(handler_self):
+                # 连接已断开，没有人会再读取这些调用的结果了
+                for task in list(handler_self.pending_tasks):
+                    task.cancel()
+
+        self.WebSocketHandler = AdaptedWebSocketHandler
+
     def bind_router(self, router):
         '''将 adapter 绑定到另一个 router 上
         注意，与新的 router 绑定后，原来的 router 中注册的 interfaces，并不会转移到新的 router 里。
@@ -88,22 +229,149 @@ class TornadoAdapter:
             - context data 会被设置为当前的 tornado RequestHandler，不需要手动指定
             - arguments 通过 query string 或 POST body 指定，详见 `extract_arguments()` 方法
         '''
+        timer = timing.current_timer()
+        started = timer.begin() if timer is not None else None
         arguments = self.extract_arguments(req_handler)
-        result = await self.call_interface(req_handler, route_path, arguments)
+        if timer is not None:
+            timer.add('parse', started)
+        if self.slow_log is not None:
+            req_handler.call_arguments = arguments
+
+        coro = self.dispatch_request(req_handler, route_path, arguments)
+        if self.recorder is not None:
+            coro = self.recorder.wrap(req_handler, route_path, arguments, coro)
+        await coro
+
+    async def dispatch_request(self, req_handler, route_path, arguments):
+        '''调用 interface（按需设置超时时间），并输出调用结果'''
+        timeout = self.get_timeout(req_handler)
+        if timeout is None and not self.cancel_on_close:
+            result = await self.call_interface(req_handler, route_path, arguments)
+        else:
+            if timeout is not None:
+                req_handler.deadline = time.monotonic() + timeout
+            # 把调用放到单独的 task 中执行，这样才能在超时或客户端断开连接时 cancel 它
+            task = req_handler.interface_task = asyncio.ensure_future(
+                self.call_interface(req_handler, route_path, arguments))
+            try:
+                result = await asyncio.wait_for(task, timeout)
+            except asyncio.TimeoutError:
+                if req_handler.deadline is not None and time.monotonic() >= req_handler.deadline:
+                    raise HTTPError(504, 'interface 执行超时')
+                raise
+            except asyncio.CancelledError:
+                if req_handler.connection_closed:
+                    # 客户端已断开连接，没有必要再输出任何内容
+                    return
+                raise
         self.finish_request(req_handler, result)
 
+    def get_timeout(self, req_handler):
+        '''根据 default_timeout 和 timeout_header 计算此次请求的超时时间（秒），None 代表不限制'''
+        timeout = self.default_timeout
+        if self.timeout_header is not None:
+            raw_timeout = req_handler.request.headers.get(self.timeout_header)
+            if raw_timeout is not None:
+                try:
+                    header_timeout = float(raw_timeout)
+                except ValueError:
+                    raise HTTPError(400, '%s 的值不合法', self.timeout_header)
+                if header_timeout != header_timeout or header_timeout < 0:
+                    raise HTTPError(400, '%s 的值不合法', self.timeout_header)
+                timeout = header_timeout if timeout is None else min(timeout, header_timeout)
+        return timeout
+
     async def call_interface(self, req_handler, route_path, arguments):
         '''这里把对 interface 的调用单独拆分出一个方法，是为了让使用者能方便地对此行为进行扩展
-        例如在执行调用前进行一些准备操作'''
-        ret_val = self.router.call(route_path, req_handler, arguments)
-        if asyncio.iscoroutine(ret_val) or isinstance(ret_val, tornado.concurrent.Future):
-            ret_val = await ret_val
+        例如在执行调用前进行一些准备操作
+
+        被准入控制拒绝的调用（见 `api_libs.admission`）会转换成 HTTP 503 / 429 响应；
+        超过截止时间的调用会转换成 HTTP 504 响应'''
+        try:
+            ret_val = self.router.call(route_path, req_handler, arguments)
+            if asyncio.iscoroutine(ret_val) or isinstance(ret_val, tornado.concurrent.Future):
+                ret_val = await ret_val
+        except AdmissionRejected as e:
+            raise HTTPError(e.status_code, '%s', e)
+        except DeadlineExceeded as e:
+            raise HTTPError(504, '%s', e)
         return ret_val
 
+    async def handle_ws_message(self, ws_handler, raw_message):
+        '''解析 WebSocket 消息，并在后台发起 interface 调用。
+        若此连接上执行中的调用数已达到上限，会一直等到有调用完成才返回（此期间 tornado 不会继续读取新的消息）'''
+        try:
+            call_id, route_path, arguments = parse_call_message(raw_message)
+        except RequestHandleFailed as e:
+            self.write_ws_message(ws_handler, dict(id=None, error=str(e), status=400))
+            return
+
+        await ws_handler.semaphore.acquire()
+        task = asyncio.ensure_future(
+            self.call_ws_interface(ws_handler, call_id, route_path, arguments))
+        ws_handler.pending_tasks.add(task)
+
+        def on_done(done_task):
+            ws_handler.pending_tasks.discard(done_task)
+            ws_handler.semaphore.release()
+        task.add_done_callback(on_done)
+
+    async def call_ws_interface(self, ws_handler, call_id, route_path, arguments):
+        response = await call_for_message(self.router, ws_handler.context, call_id, route_path, arguments)
+        self.write_ws_message(ws_handler, response)
+
+    def write_ws_message(self, ws_handler, response):
+        try:
+            ws_handler.write_message(dump_message(response))
+        except WebSocketClosedError:
+            pass
+
     def finish_request(self, req_handler, result):
-        output = self.output_formatter(result, req_handler)
+        timer = timing.current_timer()
+        started = timer.begin() if timer is not None else None
+        if isinstance(result, RawResponse):
+            req_handler.set_header('Content-Type', result.content_type)
+            output = result.body
+        else:
+            output = self.output_formatter(result, req_handler)
+
+        if timer is not None:
+            timer.add('serialize', started)
+            if self.server_timing:
+                req_handler.set_header('Server-Timing', timer.server_timing())
+        if self.slow_log is not None and isinstance(output, (str, bytes)):
+            req_handler.response_size = len(output) if isinstance(output, bytes) or output.isascii() \
+                else len(output.encode())
         req_handler.write(output)
 
+    def create_timer(self, route_path):
+        '''为此次请求创建记录各阶段耗时（以及内存分配）的对象，不需要记录时返回 None'''
+        route = self.router.route_name(route_path)
+        if self.allocation_sample_rate and random.random() < self.allocation_sample_rate:
+            tracker = timing.AllocationTracker.create(route)
+            if tracker is not None:
+                return tracker
+        if self.server_timing or self.phase_hook is not None or self.router.metrics is not None \
+                or self.slow_log is not None:
+            return timing.PhaseTimer(route)
+        return None
+
+    def start_span(self, req_handler, route_path):
+        '''为此次请求创建根 span，请求没有被采样时返回 None'''
+        request = req_handler.request
+        return self.tracer.start_trace(
+            '{} {}'.format(request.method, self.router.route_name(route_path)), request.headers.get('traceparent'),
+            attributes={'http.method': request.method, 'route': self.router.route_name(route_path)})
+
+    def report_phases(self, req_handler, route_path, timer):
+        '''请求处理完毕后，把各阶段的耗时（以及内存分配）交给 router 的 metrics 和 phase_hook'''
+        if self.router.metrics is not None:
+            self.router.metrics.record_phases(timer)
+            if isinstance(timer, timing.AllocationTracker):
+                self.router.metrics.record_allocations(timer)
+        if self.phase_hook is not None:
+            self.phase_hook(req_handler, route_path, timer)
+
     def extract_arguments(self, req_handler):
         '''从 HTTP Request 中提取出 arguments
 
@@ -136,18 +404,4 @@ class TornadoAdapter:
                 # request body 中包含了无法识别的字符（例如二进制数据）
                 raise RequestHandleFailed('arguments 中包含非法字符')
 
-        if len(raw_arguments):
-            try:
-                arguments = json.loads(raw_arguments)
-                if type(arguments) is not dict:
-                    raise ValueError()
-            except ValueError:
-                # Python 3.5 里，json 抛出的异常变成了 JSONDecodeError，不过它貌似是 ValueError 的子类，所以依然可以这样捕获
-                raise RequestHandleFailed('arguments 格式不合法: ' + raw_arguments)
-        else:
-            arguments = {}
-        return arguments
-
-
-class RequestHandleFailed(APILibError):
-    pass
+        return decode_arguments(raw_arguments)
@@ -0,0 +1,170 @@
+'''
+准入控制（admission control）：限制每个 route 的并发数与调用频率，在过载时尽早拒绝请求。
+
+所有 route 共享同一个 event loop，过载时慢的 route 会拖累快的 route，最终所有请求一起超时。
+为 route 指定一个 `RouteLimiter` 后：
+
+* 同时执行中的调用数不会超过 max_concurrency，超出的调用进入等待队列
+* 等待队列已满、或者预计在 queue_timeout 内等不到执行机会时，立即以 `Overloaded` 拒绝（HTTP 503）
+* 指定了 rate 时，按令牌桶算法限制调用频率，超出频率的调用以 `RateLimited` 拒绝（HTTP 429）
+
+    @router.register('item.detail', [Int('id')], limiter=RouteLimiter(max_concurrency=20, max_queue=100, queue_timeout=0.5))
+    async def item_detail(context, args):
+        ...
+
+同一个 RouteLimiter 对象可以同时指定给多个 route，此时这些 route 共享同一份限额。
+'''
+import asyncio
+import collections
+import inspect
+import time
+from . import APILibError
+
+__all__ = ['RouteLimiter', 'TokenBucket', 'AdmissionRejected', 'Overloaded', 'RateLimited']
+
+
+class TokenBucket:
+    '''令牌桶。每秒补充 rate 个令牌，最多存放 burst 个'''
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self.tokens = self.burst
+        self.updated_at = time.monotonic()
+
+    def try_acquire(self, tokens=1):
+        '''尝试取走令牌，成功返回 True，令牌不足返回 False'''
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+
+class RouteLimiter:
+    '''
+    Attributes:
+
+    * in_flight: 当前正在执行的调用数
+    * queued: 当前在等待队列中的调用数
+    '''
+    def __init__(self, max_concurrency=None, max_queue=0, queue_timeout=None, rate=None, burst=None):
+        '''
+        :arg int max_concurrency: 同时执行中的调用数上限，None 代表不限制
+        :arg int max_queue: 等待队列的长度上限。为 0 时，超出并发上限的调用会被直接拒绝
+        :arg float queue_timeout: 调用在等待队列中最多等待多少秒，None 代表不限制
+        :arg float rate: 每秒允许的调用数，None 代表不限制
+        :arg float burst: 令牌桶的容量，即允许的瞬时突发调用数，默认等于 rate
+        '''
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.bucket = TokenBucket(rate, burst) if rate is not None else None
+
+        self.in_flight = 0
+        self._waiters = collections.deque()
+        # 调用耗时的指数移动平均值，用来预估排队时间
+        self.avg_duration = None
+
+        self.admitted = 0
+        self.rejected_overloaded = 0
+        self.rejected_rate_limited = 0
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    def stats(self):
+        return dict(
+            in_flight=self.in_flight,
+            queued=self.queued,
+            admitted=self.admitted,
+            rejected_overloaded=self.rejected_overloaded,
+            rejected_rate_limited=self.rejected_rate_limited,
+        )
+
+    async def run(self, call, deadline=None):
+        '''在限额允许时执行 call
+
+        :arg call: 无参数的函数，返回值可以是普通值，也可以是 coroutine / future
+        :arg float deadline: 调用的截止时间（time.monotonic() 的值）。若在排队期间超过截止时间，调用会被拒绝
+        '''
+        if self.bucket is not None and not self.bucket.try_acquire():
+            self.rejected_rate_limited += 1
+            raise RateLimited('调用过于频繁，请稍后再试')
+
+        await self._acquire(deadline)
+        self.admitted += 1
+        started = time.monotonic()
+        try:
+            ret_val = call()
+            if inspect.isawaitable(ret_val):
+                ret_val = await ret_val
+            return ret_val
+        finally:
+            duration = time.monotonic() - started
+            self.avg_duration = duration if self.avg_duration is None else self.avg_duration * 0.8 + duration * 0.2
+            self._release()
+
+    async def _acquire(self, deadline):
+        if self.max_concurrency is None or self.in_flight < self.max_concurrency:
+            self.in_flight += 1
+            return
+
+        timeout = self.queue_timeout
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            timeout = remaining if timeout is None else min(timeout, remaining)
+
+        if self.queued >= self.max_queue:
+            self._reject('等待队列已满')
+        if timeout is not None and (timeout <= 0 or self._estimated_wait() > timeout):
+            self._reject('预计无法在时限内执行')
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # 已经分配到了执行名额，但调用者放弃了，把名额交给下一个等待者
+                self._release()
+            else:
+                waiter.cancel()
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject('排队等待超时')
+            raise
+
+    def _release(self):
+        '''释放一个执行名额。若有等待者，直接把名额交给它（in_flight 保持不变）'''
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def _estimated_wait(self):
+        if self.avg_duration is None:
+            return 0
+        return (self.queued + 1) * self.avg_duration / self.max_concurrency
+
+    def _reject(self, message):
+        self.rejected_overloaded += 1
+        raise Overloaded(message)
+
+
+class AdmissionRejected(APILibError):
+    '''调用被准入控制拒绝。status_code 是 adapter 应该返回给客户端的 HTTP 状态码'''
+    status_code = 503
+
+
+class Overloaded(AdmissionRejected):
+    status_code = 503
+
+
+class RateLimited(AdmissionRejected):
+    status_code = 429
@@ -0,0 +1,146 @@
+'''
+把同一个请求中对同一个 route 的多次调用合并成一次对批量 interface 的调用（类似 DataLoader），解决 N+1 问题。
+
+    @router.register('user.get', [Int('id')], batch=Batch('user.get_many', key='id', bulk_key='ids'))
+    def get_user(context, args):
+        ...     # 通过 context.call() 调用，或无法合并时（例如不在 event loop 中）才会被调用
+
+    @router.register('user.get_many', [List('ids', type=Int())])
+    async def get_users(context, args):
+        users = await db.fetch_users(args.ids)
+        return {user.id: user for user in users}
+
+    @router.register('order.list')
+    async def list_orders(context):
+        orders = await db.fetch_orders()
+        # 这 200 次调用会被合并成一次 user.get_many 调用
+        users = await asyncio.gather(*[context.call_async('user.get', dict(id=order.user_id)) for order in orders])
+        # 也可以写成 await context.gather([('user.get', dict(id=order.user_id)) for order in orders])
+
+* 只有在有正在运行的 event loop 时，通过 `Context.call_async()` / `Context.gather()` 发起的调用才会被合并，
+  在同一个 event loop tick 中发起的调用会在下一个 tick 被合并发送。
+  `Context.call()` 发起的调用不会被合并，因此同步 interface 中原有的 context.call() 不会因为 route 指定了 batch 而改为返回 awaitable
+* 发起调用时，会先按原 route 的参数定义检查参数值，参数不合法时直接抛出异常，不会进入批量调用
+* 除了 key 之外的其他参数值相同的调用才会被合并到一起，这些参数会原样传给批量 interface
+* 批量 interface 可以返回与 keys 顺序一一对应的 list，也可以返回 dict(key: 结果)（不存在的 key 的结果为 None）。
+  结果是 Exception 实例时，对应的调用会抛出这个异常
+* 同一个 context（也就是同一个请求）中，参数值完全相同的调用只会执行一次，所有调用者共享同一个结果；
+  失败的调用不会被记录，之后再以相同参数调用会重新执行
+* `Context.end_request()` 被调用时（例如 WebSocket 连接上的一条消息处理完毕），还没完成的批量调用会被取消
+* 注意：在循环中逐个 await 的调用无法被合并，应先发起全部调用，再一起 await（例如通过 asyncio.gather()）
+'''
+import asyncio
+import inspect
+from . import APILibError
+
+__all__ = ['Batch', 'BatchFailed']
+
+
+class Batch:
+    def __init__(self, bulk_route, key='id', bulk_key=None, max_size=None):
+        '''
+        :arg string bulk_route: 批量 interface 的 route path
+        :arg string key: 原 interface 中，要被合并成列表的那个参数
+        :arg string bulk_key: 批量 interface 接收 key 列表的参数名，默认为 key + 's'
+        :arg int max_size: 每次批量调用最多包含多少个 key，None 代表不限制
+        '''
+        self.bulk_route = bulk_route
+        self.key = key
+        self.bulk_key = bulk_key or key + 's'
+        self.max_size = max_size
+
+
+class BatchLoader:
+    '''在一个 context 中，收集对某个 route 的调用，并把它们合并成批量调用'''
+    def __init__(self, context, batch):
+        self.context = context
+        self.batch = batch
+        self.futures = {
+            # 调用的 arguments key: future
+        }
+        self._queue = []
+        self._scheduled = False
+        # 正在执行的批量调用。event loop 只持有 task 的弱引用，需要在这里保存它们，以免执行中途被回收
+        self._tasks = set()
+
+    def load(self, cache_key, key, group_key, rest_arguments):
+        '''加入一个调用，返回可以 await 的结果。
+
+        :arg cache_key: 用于识别相同调用的 key
+        :arg key: 此次调用的 key 参数的值
+        :arg group_key / rest_arguments: 除 key 之外的其他参数值，group_key 相同的调用会被合并在一起'''
+        future = self.futures.get(cache_key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self.futures[cache_key] = loop.create_future()
+            self._queue.append((cache_key, key, group_key, rest_arguments, future))
+            if not self._scheduled:
+                self._scheduled = True
+                loop.call_soon(self._dispatch)
+        # 用 shield 包装，使某一个调用者被 cancel 时，不会连带 cancel 其他调用者共享的 future
+        return asyncio.shield(future)
+
+    def _dispatch(self):
+        self._scheduled = False
+        queue, self._queue = self._queue, []
+        groups = {}
+        for cache_key, key, group_key, rest_arguments, future in queue:
+            groups.setdefault(group_key, (rest_arguments, []))[1].append((cache_key, key, future))
+
+        max_size = self.batch.max_size or len(queue)
+        for rest_arguments, items in groups.values():
+            for i in range(0, len(items), max_size):
+                task = asyncio.ensure_future(self._run(rest_arguments, items[i:i + max_size]))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    def cancel(self):
+        '''请求结束时，取消还没完成的批量调用，以及还在等待被合并的调用'''
+        for task in list(self._tasks):
+            task.cancel()
+        for _, _, _, _, future in self._queue:
+            future.cancel()
+        self._queue = []
+
+    async def _run(self, rest_arguments, items):
+        keys = [key for _, key, _ in items]
+        try:
+            result = self.context.call(self.batch.bulk_route, dict(rest_arguments, **{self.batch.bulk_key: keys}))
+            if inspect.isawaitable(result):
+                result = await result
+            if isinstance(result, dict):
+                values = [result.get(key) for key in keys]
+            elif isinstance(result, (list, tuple)) and len(result) == len(keys):
+                values = result
+            else:
+                raise BatchFailed('批量 interface {} 的返回值必须是 dict，或包含 {} 个元素的 list (got: {})'.format(
+                    self.batch.bulk_route, len(keys), type(result)))
+        except BaseException as e:
+            for cache_key, _, future in items:
+                self._forget(cache_key, future)
+                if not future.done():
+                    if isinstance(e, Exception):
+                        future.set_exception(e)
+                    else:
+                        future.cancel()
+            if not isinstance(e, Exception):
+                raise
+            return
+
+        for (cache_key, _, future), value in zip(items, values):
+            if future.done():
+                continue
+            if isinstance(value, Exception):
+                # 失败的调用不记录结果，之后以相同参数发起的调用会重新执行
+                self._forget(cache_key, future)
+                future.set_exception(value)
+            else:
+                future.set_result(value)
+
+    def _forget(self, cache_key, future):
+        if self.futures.get(cache_key) is future:
+            del self.futures[cache_key]
+
+
+class BatchFailed(APILibError):
+    pass
@@ -0,0 +1,244 @@
+'''
+interface 调用结果的缓存。
+
+为 Router 指定一个 cache 对象，并在注册 interface 时指定 cache_ttl，这个 interface 的调用结果就会被缓存起来：
+
+    router = Router(cache=LocalCache())
+
+    @router.register('item.detail', [Int('id')], cache_ttl=60)
+    async def item_detail(context, args):
+        ...
+
+缓存的 key 由 route path 与 arguments 组成，与 context 无关，因此只应对结果不依赖 context 的 interface 开启缓存。
+arguments 中含有无法转换成 JSON 的值时，此次调用不会使用缓存。
+
+提供两种缓存，它们的接口完全相同，可以互相替换：
+
+* LocalCache: 进程内的 LRU 缓存
+* SharedMemoryCache: 基于 mmap 共享内存的缓存。在 fork 出多个 worker 进程之前创建它，所有 worker 就会共享同一份缓存内容，
+  不用每个 worker 各自缓存、各自预热一遍
+'''
+import collections
+import hashlib
+import logging
+import mmap
+import multiprocessing
+import pickle
+import struct
+import time
+
+__all__ = ['MISS', 'LocalCache', 'SharedMemoryCache']
+
+logger = logging.getLogger(__name__)
+
+
+class _MissCls:
+    def __repr__(self):
+        return 'cache.MISS'
+
+
+# 代表缓存中没有对应的值（缓存的值本身可能是 None，所以不能用 None 来表示）
+MISS = _MissCls()
+
+
+class LocalCache:
+    '''进程内的 LRU 缓存。
+    注意：缓存的是对象本身而不是它的副本，因此不要修改从缓存中取出的值'''
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        '''取得缓存的值，没有缓存或已过期时返回 MISS'''
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.time():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return MISS
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, ttl):
+        '''缓存一个值，ttl 秒后过期。返回是否成功缓存'''
+        self._entries[key] = (time.time() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return True
+
+    def delete(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, entries=len(self._entries))
+
+
+class SharedMemoryCache:
+    '''基于 mmap 共享内存、可在多个进程间共享的缓存。必须在 fork 出 worker 进程之前创建。
+
+    共享内存被划分为固定数量、固定大小的 slot，组成一个 set-associative 的哈希表：
+    每个 key 根据哈希值落入一个 bucket，每个 bucket 有 ways 个 slot。
+    bucket 满了之后，用 clock 算法淘汰其中最近没有被读取过的 slot。
+
+    读取不加锁（seqlock）：每个 slot 有一个版本号，写入前把它改为奇数、写完后再改回偶数；
+    读取时如果发现版本号是奇数，或读取前后版本号不一致，就说明读到的内容不完整，需要重新读取。
+    写入按 bucket 分组加锁（lock_stripes 个跨进程的锁）。
+
+    值通过 pickle 序列化后保存，无法序列化或序列化后超过 slot 容量的值不会被缓存（set() 返回 False）。
+    hits / misses 是每个进程各自统计的。
+    '''
+    _slot_header = struct.Struct('<QQdII')     # version, key hash, expires, key length, value length
+    _version = struct.Struct('<Q')
+
+    def __init__(self, slots=4096, slot_size=1024, ways=8, lock_stripes=64):
+        '''
+        :arg int slots: slot 的总数，最多能同时缓存这么多个值
+        :arg int slot_size: 每个 slot 的字节数，包括 key、序列化后的值和 32 字节的 header
+        :arg int ways: 每个 bucket 包含的 slot 数，1 ~ 255（每个 bucket 的 clock hand 只占一个字节）
+        :arg int lock_stripes: 写入时使用的锁的数量
+        '''
+        if not 1 <= ways <= 255:
+            raise ValueError('ways 必须在 1 ~ 255 之间 (got: {})'.format(ways))
+        if slots % ways != 0:
+            raise ValueError('slots 必须是 ways 的整数倍')
+        if slot_size <= self._slot_header.size:
+            raise ValueError('slot_size 必须大于 {}'.format(self._slot_header.size))
+        self.slots = slots
+        self.slot_size = slot_size
+        self.ways = ways
+        self.buckets = slots // ways
+
+        # 内存布局：[slot 0][slot 1]...[slot n-1][各 slot 的 reference bit][各 bucket 的 clock hand]
+        self._ref_offset = slots * slot_size
+        self._hand_offset = self._ref_offset + slots
+        # fileno 为 -1 时，mmap 创建的是匿名的 MAP_SHARED 内存，fork 出的子进程与父进程共享它
+        self._mm = mmap.mmap(-1, self._hand_offset + self.buckets)
+        self._locks = [multiprocessing.Lock() for _ in range(lock_stripes)]
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _hash(key_bytes):
+        # 不能用内置的 hash()，它在不同的进程中可能得到不同的结果
+        return int.from_bytes(hashlib.blake2b(key_bytes, digest_size=8).digest(), 'little')
+
+    def _locate(self, key):
+        key_bytes = key.encode()
+        key_hash = self._hash(key_bytes)
+        bucket = key_hash % self.buckets
+        return key_bytes, key_hash, bucket
+
+    def get(self, key):
+        '''取得缓存的值，没有缓存或已过期时返回 MISS'''
+        key_bytes, key_hash, bucket = self._locate(key)
+        mm = self._mm
+        header_size = self._slot_header.size
+        for slot in range(bucket * self.ways, (bucket + 1) * self.ways):
+            offset = slot * self.slot_size
+            # 写入者正在修改这个 slot 时，最多重试几次
+            for _ in range(4):
+                version = self._version.unpack_from(mm, offset)[0]
+                if version & 1:
+                    continue
+                _, slot_hash, expires, key_len, value_len = self._slot_header.unpack_from(mm, offset)
+                if slot_hash != key_hash or key_len != len(key_bytes):
+                    break
+                data = mm[offset + header_size:offset + header_size + key_len + value_len]
+                if self._version.unpack_from(mm, offset)[0] != version:
+                    continue
+                if data[:key_len] != key_bytes:
+                    break
+                if expires < time.time():
+                    self.misses += 1
+                    return MISS
+                mm[self._ref_offset + slot] = 1
+                self.hits += 1
+                return pickle.loads(data[key_len:])
+        self.misses += 1
+        return MISS
+
+    def set(self, key, value, ttl):
+        '''缓存一个值，ttl 秒后过期。返回是否成功缓存'''
+        key_bytes, key_hash, bucket = self._locate(key)
+        try:
+            value_bytes = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.warning('值无法被序列化，不进行缓存（key: %s, error: %r）', key, e)
+            return False
+        if self._slot_header.size + len(key_bytes) + len(value_bytes) > self.slot_size:
+            return False
+
+        with self._locks[bucket % len(self._locks)]:
+            slot = self._find_slot(bucket, key_bytes, key_hash)
+            self._write_slot(slot, key_hash, time.time() + ttl, key_bytes, value_bytes)
+        return True
+
+    def delete(self, key):
+        key_bytes, key_hash, bucket = self._locate(key)
+        with self._locks[bucket % len(self._locks)]:
+            for slot in range(bucket * self.ways, (bucket + 1) * self.ways):
+                if self._slot_matches(slot, key_bytes, key_hash):
+                    self._write_slot(slot, 0, 0.0, b'', b'')
+
+    def clear(self):
+        for bucket in range(self.buckets):
+            with self._locks[bucket % len(self._locks)]:
+                for slot in range(bucket * self.ways, (bucket + 1) * self.ways):
+                    self._write_slot(slot, 0, 0.0, b'', b'')
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses)
+
+    def _slot_matches(self, slot, key_bytes, key_hash):
+        offset = slot * self.slot_size
+        _, slot_hash, _, key_len, _ = self._slot_header.unpack_from(self._mm, offset)
+        if slot_hash != key_hash or key_len != len(key_bytes):
+            return False
+        start = offset + self._slot_header.size
+        return self._mm[start:start + key_len] == key_bytes
+
+    def _find_slot(self, bucket, key_bytes, key_hash):
+        '''选出用来保存新值的 slot（调用者需持有 bucket 对应的锁）。
+        优先使用保存着同一个 key 的 slot，其次是空的或已过期的 slot，最后用 clock 算法淘汰一个'''
+        first_slot = bucket * self.ways
+        now = time.time()
+        free_slot = None
+        for slot in range(first_slot, first_slot + self.ways):
+            if self._slot_matches(slot, key_bytes, key_hash):
+                return slot
+            if free_slot is None:
+                _, _, expires, key_len, _ = self._slot_header.unpack_from(self._mm, slot * self.slot_size)
+                if key_len == 0 or expires < now:
+                    free_slot = slot
+        if free_slot is not None:
+            return free_slot
+
+        hand_pos = self._hand_offset + bucket
+        hand = self._mm[hand_pos]
+        while True:
+            slot = first_slot + hand
+            hand = (hand + 1) % self.ways
+            if self._mm[self._ref_offset + slot]:
+                self._mm[self._ref_offset + slot] = 0
+            else:
+                self._mm[hand_pos] = hand
+                return slot
+
+    def _write_slot(self, slot, key_hash, expires, key_bytes, value_bytes):
+        offset = slot * self.slot_size
+        version = self._version.unpack_from(self._mm, offset)[0]
+        self._version.pack_into(self._mm, offset, version + 1)
+        self._slot_header.pack_into(
+            self._mm, offset, version + 1, key_hash, expires, len(key_bytes), len(value_bytes))
+        start = offset + self._slot_header.size
+        self._mm[start:start + len(key_bytes) + len(value_bytes)] = key_bytes + value_bytes
+        self._mm[self._ref_offset + slot] = 0
+        self._version.pack_into(self._mm, offset, version + 2)
@@ -0,0 +1,298 @@
+'''
+调用 TornadoAdapter（以及 ASGIAdapter）所提供的 API 的异步客户端。
+
+    client = APIClient('http://127.0.0.1:8888/api/')
+    result = await client.call('a.b.c', dict(x=1))
+    results = await client.call_many([('a.b.c', dict(x=1)), ('d.e.f', {})])
+    await client.close()
+
+* 请求格式与 adapter 的约定一致：route path 拼接在 base_url 之后，arguments 以 JSON 的形式作为 POST body
+* HTTP 连接会被保持（keep-alive）并放入连接池中复用，同时进行中的调用数不超过 max_concurrency
+* 若指定了 ws_url（对应 adapter 的 WebSocketHandler），所有调用都会通过同一个 WebSocket 连接多路复用地发送；
+  若服务端没有提供 WebSocket 接口（连接失败），会自动改用 HTTP
+* 返回值默认按 JSON 解析，与 adapter 默认的 output_formatter 相对应；使用了自定义 output_formatter 时，可以通过 output_parser 指定对应的解析方式
+'''
+import asyncio
+import itertools
+import json
+import urllib.parse
+from . import APILibError
+from .tracing import current_span
+
+__all__ = ['APIClient', 'APICallFailed']
+
+
+def parse_json(body, headers):
+    '''默认的 output_parser，与 adapter 默认的 output_formatter（dump_json）相对应'''
+    return json.loads(body.decode()) if len(body) else None
+
+
+class _Connection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.reused = False
+
+    def is_usable(self):
+        return not self.writer.is_closing() and not self.reader.at_eof()
+
+    def close(self):
+        self.writer.close()
+
+
+class ConnectionPool:
+    '''保存空闲的 keep-alive 连接，供后续请求复用
+
+    Attributes:
+
+    * created: 一共创建过多少个连接
+    '''
+    def __init__(self, host, port, ssl=None, max_idle=10):
+        self.host = host
+        self.port = port
+        self.ssl = ssl
+        self.max_idle = max_idle
+        self.created = 0
+        self._idle = []
+
+    async def acquire(self):
+        while self._idle:
+            conn = self._idle.pop()
+            if conn.is_usable():
+                conn.reused = True
+                return conn
+            conn.close()
+        reader, writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+        self.created += 1
+        return _Connection(reader, writer)
+
+    def release(self, conn, reusable):
+        if reusable and len(self._idle) < self.max_idle and conn.is_usable():
+            self._idle.append(conn)
+        else:
+            conn.close()
+
+    def close(self):
+        for conn in self._idle:
+            conn.close()
+        self._idle = []
+
+
+class APIClient:
+    def __init__(self, base_url, max_concurrency=10, ws_url=None, timeout=None, timeout_header=None,
+                 output_parser=parse_json):
+        '''
+        :arg string base_url: route path 之前的 URL 部分，例如 http://127.0.0.1:8888/api/
+        :arg int max_concurrency: 同时进行中的调用数上限，也是连接池中保存的空闲连接数上限
+        :arg string ws_url: adapter 的 WebSocketHandler 所对应的 URL，例如 ws://127.0.0.1:8888/api-ws
+        :arg float timeout: 每次调用的超时时间（秒），None 代表不限制
+        :arg string timeout_header: 若指定，会通过这个 HTTP Header 把超时时间告知服务端（对应 TornadoAdapter 的同名参数）
+        :arg output_parser: 解析 HTTP response body 的函数，它会接收到 body（bytes）和 headers（dict，key 为小写）两个参数
+        '''
+        url = urllib.parse.urlsplit(base_url)
+        if url.scheme not in ['http', 'https']:
+            raise APICallFailed('不支持的 URL: {}'.format(base_url), None)
+        self.base_url = base_url
+        self.host = url.hostname
+        self.base_path = url.path or '/'
+        self.host_header = url.netloc
+        self.pool = ConnectionPool(
+            url.hostname, url.port or (443 if url.scheme == 'https' else 80),
+            ssl=True if url.scheme == 'https' else None, max_idle=max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.ws_url = ws_url
+        self.timeout = timeout
+        self.timeout_header = timeout_header
+        self.output_parser = output_parser
+
+        self._semaphore = None
+        self._ws = None
+        self._ws_connecting = None
+        self._ws_ids = itertools.count()
+        self._ws_waiters = {
+            # call_id: future
+        }
+
+    @property
+    def semaphore(self):
+        # 在第一次用到时才创建，保证它与调用方处在同一个 event loop 里
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def call(self, route_path, arguments={}):
+        '''调用一个 interface，返回它的返回值。调用失败时抛出 APICallFailed'''
+        async with self.semaphore:
+            coro = self._call(route_path, arguments)
+            if self.timeout is None:
+                return await coro
+            try:
+                return await asyncio.wait_for(coro, self.timeout)
+            except asyncio.TimeoutError:
+                raise APICallFailed('调用超时: {}'.format(route_path), None)
+
+    async def call_many(self, calls, return_exceptions=False):
+        '''并发地进行多个调用，按顺序返回它们的结果
+
+        :arg calls: [(route_path, arguments), ...]
+        :arg bool return_exceptions: 为 True 时，失败的调用会以 APICallFailed 对象的形式出现在结果中，而不是直接抛出'''
+        return await asyncio.gather(
+            *[self.call(route_path, arguments) for route_path, arguments in calls],
+            return_exceptions=return_exceptions)
+
+    async def _call(self, route_path, arguments):
+        if self.ws_url is not None and await self._ensure_ws():
+            return await self._call_by_ws(route_path, arguments)
+        return await self._call_by_http(route_path, arguments)
+
+    async def _call_by_http(self, route_path, arguments):
+        body = json.dumps(arguments).encode()
+        request_lines = [
+            'POST {}{} HTTP/1.1'.format(self.base_path, urllib.parse.quote(route_path)),
+            'Host: {}'.format(self.host_header),
+            'Content-Type: application/json',
+            'Content-Length: {}'.format(len(body)),
+            'Connection: keep-alive',
+        ]
+        if self.timeout_header is not None and self.timeout is not None:
+            request_lines.append('{}: {}'.format(self.timeout_header, self.timeout))
+        span = current_span()
+        if span is not None:
+            # 把 trace context 传递给下游服务，见 `api_libs.tracing`
+            request_lines.append('traceparent: {}'.format(span.traceparent()))
+        request = ('\r\n'.join(request_lines) + '\r\n\r\n').encode() + body
+
+        while True:
+            conn = await self.pool.acquire()
+            try:
+                conn.writer.write(request)
+                status, headers, response_body, reusable = await read_response(conn.reader)
+                break
+            except EmptyResponse:
+                conn.close()
+                # 复用的 keep-alive 连接可能已被服务端关闭，此时换一个新连接重试。
+                # 只有在没收到任何 response 数据时才重试；其他情况下服务端可能已经执行了这个调用，
+                # 重试会使它被执行两次
+                if not conn.reused:
+                    raise APICallFailed('连接已断开: {}'.format(route_path), None)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                conn.close()
+                raise APICallFailed('连接已断开: {}'.format(route_path), None)
+            except BaseException:
+                conn.close()
+                raise
+        self.pool.release(conn, reusable)
+
+        if status != 200:
+            raise APICallFailed(
+                '调用失败（HTTP {}）: {}'.format(status, response_body.decode(errors='replace')[:200]), status)
+        return self.output_parser(response_body, headers)
+
+    async def _ensure_ws(self):
+        '''建立 WebSocket 连接。连接失败时返回 False，并在之后改用 HTTP'''
+        if self._ws is not None:
+            return True
+        if self._ws_connecting is None:
+            self._ws_connecting = asyncio.ensure_future(self._connect_ws())
+        return await asyncio.shield(self._ws_connecting)
+
+    async def _connect_ws(self):
+        # 只有使用 WebSocket 时才需要 tornado
+        from tornado.websocket import websocket_connect
+        try:
+            self._ws = await websocket_connect(self.ws_url, on_message_callback=self._on_ws_message)
+            return True
+        except Exception:
+            self.ws_url = None
+            return False
+
+    def _on_ws_message(self, message):
+        if message is None:
+            # 连接已断开，之后的调用会重新建立连接
+            self._ws = None
+            self._ws_connecting = None
+            for waiter in self._ws_waiters.values():
+                if not waiter.done():
+                    waiter.set_exception(APICallFailed('WebSocket 连接已断开', None))
+            return
+        response = json.loads(message)
+        waiter = self._ws_waiters.get(response.get('id'))
+        if waiter is not None and not waiter.done():
+            waiter.set_result(response)
+
+    async def _call_by_ws(self, route_path, arguments):
+        call_id = next(self._ws_ids)
+        waiter = self._ws_waiters[call_id] = asyncio.get_running_loop().create_future()
+        try:
+            await self._ws.write_message(json.dumps(dict(id=call_id, path=route_path, arguments=arguments)))
+            response = await waiter
+        finally:
+            self._ws_waiters.pop(call_id, None)
+        if 'error' in response:
+            raise APICallFailed(response['error'], response.get('status'))
+        return response['result']
+
+    async def close(self):
+        self.pool.close()
+        if self._ws is not None:
+            self._ws.close()
+            self._ws = None
+
+
+async def read_response(reader):
+    '''读取一个 HTTP/1.1 response
+
+    :return: (status, headers, body, reusable)，reusable 代表此连接能否继续用于下一个请求'''
+    status_line = await reader.readline()
+    if not status_line:
+        raise EmptyResponse()
+    parts = status_line.decode('latin-1').split(' ', 2)
+    if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+        raise APICallFailed('无法识别的 HTTP response: {}'.format(status_line), None)
+    status = int(parts[1])
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in [b'\r\n', b'\n', b'']:
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    reusable = headers.get('connection', '').lower() != 'close' and parts[0] != 'HTTP/1.0'
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';')[0].strip(), 16)
+            if size == 0:
+                # 跳过 trailer
+                while (await reader.readline()) not in [b'\r\n', b'\n', b'']:
+                    pass
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+        body = b''.join(chunks)
+    elif 'content-length' in headers:
+        body = await reader.readexactly(int(headers['content-length']))
+    elif status in [204, 304] or 100 <= status < 200:
+        body = b''
+    else:
+        body = await reader.read()
+        reusable = False
+    return status, headers, body, reusable
+
+
+class EmptyResponse(Exception):
+    '''连接在收到任何 response 内容之前就被关闭了'''
+    pass
+
+
+class APICallFailed(APILibError):
+    '''
+    Attributes:
+
+    * status: 服务端返回的 HTTP 状态码（或 WebSocket 回复中的错误码），连接出错或超时时为 None
+    '''
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
@@ -0,0 +1,187 @@
+'''
+控制 interface 在哪里执行。
+
+通过 Router 调用 interface 时，默认直接在调用者所在的线程里执行（inline）。
+对于会进行 CPU 密集运算或阻塞式 I/O 的同步 interface，在 event loop 中直接执行会阻塞住其他所有连接，
+此时可以在注册 interface 时通过 executor 选项，把它放到线程池或进程池中执行：
+
+    @router.register('report.build', [Int('id')], executor=THREAD)
+    def build_report(context, args):
+        ...
+
+被放到线程池 / 进程池中执行的 interface，通过 `Router.call()` 调用时返回的是一个 coroutine，需要 await 它才能得到结果
+（TornadoAdapter 会自动处理这一点）。
+通过 `Context.call()` 发起的嵌套调用总是 inline 执行。
+'''
+import asyncio
+import contextvars
+import functools
+import inspect
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from . import APILibError
+
+__all__ = ['INLINE', 'THREAD', 'PROCESS', 'Executors', 'LoopLagMonitor']
+
+
+INLINE = 'inline'
+THREAD = 'thread'
+PROCESS = 'process'
+
+EXECUTOR_TYPES = [INLINE, THREAD, PROCESS]
+
+
+# 使用进程池的 router。进程池中的子进程是 fork 出来的，会继承这个 dict，子进程通过它找到要调用的 router。
+_process_routers = {
+    # id(router): router
+}
+
+
+def _call_in_process(router_id, path, arguments):
+    '''在进程池的子进程中执行 interface。
+    context（例如 tornado RequestHandler）无法跨进程传递，所以 interface 接收到的 context 为 None'''
+    router = _process_routers[router_id]
+    return router.interfaces[path](arguments=arguments, context=None)
+
+
+class Executors:
+    '''管理一个 router 所使用的线程池与进程池。
+    线程池和进程池都是在第一次用到时才创建的。
+
+    注意：进程池的子进程是在第一次向进程池提交任务时 fork 出来的，
+    因此所有 executor=PROCESS 的 interface 都必须在这之前注册好；它们的参数值和返回值都必须能被 pickle。
+    '''
+    def __init__(self, thread_pool_size=None, process_pool_size=None):
+        '''
+        :arg int thread_pool_size: 线程池的最大线程数。None 代表使用 ThreadPoolExecutor 的默认值
+        :arg int process_pool_size: 进程池的最大进程数。None 代表使用 CPU 核数
+        '''
+        self.thread_pool_size = thread_pool_size
+        self.process_pool_size = process_pool_size
+        self._thread_pool = None
+        self._process_pool = None
+
+    @property
+    def thread_pool(self):
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(
+                self.thread_pool_size, thread_name_prefix='api_libs')
+        return self._thread_pool
+
+    @property
+    def process_pool(self):
+        if self._process_pool is None:
+            try:
+                mp_context = multiprocessing.get_context('fork')
+            except ValueError:
+                # 当前平台不支持 fork（例如 Windows）
+                mp_context = None
+            self._process_pool = ProcessPoolExecutor(self.process_pool_size, mp_context=mp_context)
+        return self._process_pool
+
+    def submit(self, executor, router, path, context_instance, arguments):
+        '''在指定的 executor 中调用 interface，返回一个 coroutine
+
+        :arg string path: 已经转换成小写的、确定存在的 route path'''
+        if executor == THREAD:
+            # run_in_executor 不会传递 contextvars，需手动带上调用者的 context，
+            # 使阶段计时（api_libs.timing）、追踪（api_libs.tracing）等在线程池中同样有效
+            fn = functools.partial(
+                contextvars.copy_context().run, router._call_with_context, path, context_instance, arguments)
+            pool = self.thread_pool
+        elif executor == PROCESS:
+            _process_routers[id(router)] = router
+            fn = functools.partial(_call_in_process, id(router), path, arguments)
+            pool = self.process_pool
+        else:
+            raise ExecutorError('不支持的 executor 类型: {}'.format(executor))
+
+        async def run():
+            ret_val = await asyncio.get_running_loop().run_in_executor(pool, fn)
+            # 如果在线程池里执行的 interface 返回了 coroutine，则回到 event loop 中继续执行它
+            if inspect.isawaitable(ret_val):
+                ret_val = await ret_val
+            return ret_val
+        return run()
+
+    def shutdown(self, wait=True):
+        '''关闭线程池和进程池。之后若再次用到它们，会重新创建'''
+        for pool in [self._thread_pool, self._process_pool]:
+            if pool is not None:
+                pool.shutdown(wait=wait)
+        self._thread_pool = None
+        self._process_pool = None
+
+
+class LoopLagMonitor:
+    '''测量 event loop 的延迟（loop lag）。
+
+    每隔 interval 秒安排一次回调，回调实际被执行的时间比预期晚了多少，就是这段时间里 event loop 被阻塞的程度。
+    延迟持续偏高，说明有 interface 在 event loop 中执行了太久，
+    结合 `Router.blocking_stats`（需开启 `Router.track_blocking`）可以找出应该改用 THREAD / PROCESS executor 的 route。
+
+        monitor = LoopLagMonitor()
+        monitor.start()
+        ...
+        monitor.stats()     # dict(count=..., total=..., max=..., last=...)
+    '''
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.reset()
+        self._handle = None
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def start(self, loop=None):
+        '''开始测量。需在 event loop 所在的线程中调用'''
+        self.stop()
+        loop = loop or asyncio.get_event_loop()
+        self._schedule(loop)
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _schedule(self, loop):
+        expected = loop.time() + self.interval
+        self._handle = loop.call_at(expected, self._tick, loop, expected)
+
+    def _tick(self, loop, expected):
+        lag = max(loop.time() - expected, 0.0)
+        self.count += 1
+        self.total += lag
+        self.last = lag
+        if lag > self.max:
+            self.max = lag
+        self._schedule(loop)
+
+    def stats(self):
+        return dict(
+            count=self.count,
+            total=self.total,
+            max=self.max,
+            last=self.last,
+            mean=self.total / self.count if self.count else 0.0,
+        )
+
+
+def record_blocking(stats, path, started):
+    '''把一次 inline 执行所占用的时间记录到 stats（`Router.blocking_stats`）里'''
+    elapsed = time.perf_counter() - started
+    route_stats = stats.get(path)
+    if route_stats is None:
+        route_stats = stats[path] = dict(count=0, total=0.0, max=0.0)
+    route_stats['count'] += 1
+    route_stats['total'] += elapsed
+    if elapsed > route_stats['max']:
+        route_stats['max'] = elapsed
+
+
+class ExecutorError(APILibError):
+    pass
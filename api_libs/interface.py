@@ -1,5 +1,7 @@
 from . import APILibError
-from .parameters.Arguments import Arguments
+from .parameters.Arguments import Arguments, TrustedArguments
+from .timing import current_timer, record_interface_call
+from .tracing import current_span
 
 __all__ = ['interface', 'bound_interface']
 
@@ -17,22 +19,30 @@ def interface(parameters=None, bound=False):
 
         def sort_out_arguments(interface_raw_args, interface_kwargs):
             if parameters is not None:
+                if isinstance(interface_raw_args, TrustedArguments):
+                    return dict(**interface_kwargs, args=interface_raw_args.build(parameters))
                 return dict(**interface_kwargs, args=Arguments(parameters, interface_raw_args))
             else:
                 if interface_raw_args != {}:
                     raise InterfaceCallFailed('此 interface 不接受任何参数（got: {}）'.format(interface_raw_args))
                 return interface_kwargs
 
+        # 当前请求启用了阶段计时（见 `api_libs.timing`）或正在被追踪（见 `api_libs.tracing`）时，分别记录参数检查和函数执行的耗时
         def interface_fn(arguments={}, **kwargs):
+            if current_timer() is not None or current_span() is not None:
+                return record_interface_call(fn, sort_out_arguments, arguments, kwargs)
             sorted_args = sort_out_arguments(arguments, kwargs)
             return fn(**sorted_args)
 
         def bound_interface_fn(cls_or_inst, arguments={}, **kwargs):
+            if current_timer() is not None or current_span() is not None:
+                return record_interface_call(fn, sort_out_arguments, arguments, kwargs, cls_or_inst)
             sorted_args = sort_out_arguments(arguments, kwargs)
             return fn(cls_or_inst, **sorted_args)
 
         choosed_fn = bound_interface_fn if bound else interface_fn
         setattr(choosed_fn, '__api_libs_interface', True)
+        setattr(choosed_fn, '__api_libs_parameters', parameters)
 
         return choosed_fn
     return wrapper
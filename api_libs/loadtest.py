@@ -0,0 +1,369 @@
+'''
+压力测试：在本机回环地址上启动 TornadoAdapter 提供的服务，以固定并发数（closed-loop）或固定请求速率（open-loop）
+按指定的 route 组合发起调用，报告吞吐量、延迟分布（p50 / p99 / p999）、错误率和各 worker 的 CPU 占用。
+
+    python -m api_libs.loadtest myapp.api:router --route 'item.detail:3={"id": 1}' --route user.info \\
+        --concurrency 64 --duration 10
+    python -m api_libs.loadtest myapp.api:router --route item.detail --rate 2000 --processes 4 --json
+
+也可以在程序中使用：
+
+    report = run_loadtest(router, RouteMix.parse(['item.detail={"id": 1}']), concurrency=32, duration=5)
+    print(report.format())
+
+* processes=0（默认）时，服务与压测客户端运行在同一个进程、同一个 event loop 中，报告的 CPU 占用包含了客户端本身；
+  processes >= 1 时，服务通过 `api_libs.serving.serve()` 在单独的进程中运行，分别报告每个 worker 进程的 CPU 占用
+  （需要 Linux 的 /proc，其他平台上为 None）
+* open-loop 模式下，请求按固定的时间间隔发出，延迟从计划发出的时间开始计算，
+  因此服务端处理不过来时，排队等待的时间也会体现在延迟中（避免 coordinated omission）
+'''
+import argparse
+import asyncio
+import importlib
+import json
+import multiprocessing
+import os
+import random
+import re
+import signal
+import socket
+import sys
+import time
+from . import APILibError
+from .client import APIClient, APICallFailed
+from .metrics import Histogram
+
+__all__ = ['RouteMix', 'LoadReport', 'run_loadtest']
+
+
+class RouteMix:
+    '''要调用的 route 组合：[(route path, 权重, arguments), ...]'''
+    def __init__(self, entries):
+        if not entries:
+            raise LoadTestFailed('至少需要指定一个 route')
+        self.entries = entries
+        self._paths = [path for path, _, _ in entries]
+        self._weights = [weight for _, weight, _ in entries]
+        self._arguments = {path: arguments for path, _, arguments in entries}
+
+    @classmethod
+    def parse(cls, specs):
+        '''从 "PATH[:WEIGHT][=ARGUMENTS_JSON]" 格式的字符串列表中解析出 RouteMix'''
+        entries = []
+        for spec in specs:
+            path_part, _, raw_arguments = spec.partition('=')
+            path, _, raw_weight = path_part.partition(':')
+            try:
+                weight = float(raw_weight) if raw_weight else 1
+                arguments = json.loads(raw_arguments) if raw_arguments else {}
+            except ValueError:
+                raise LoadTestFailed('route 的格式不正确: {}'.format(spec))
+            entries.append((path.strip(), weight, arguments))
+        return cls(entries)
+
+    def choose(self, rng):
+        path = rng.choices(self._paths, self._weights)[0]
+        return path, self._arguments[path]
+
+
+class LoadReport:
+    '''
+    Attributes:
+
+    * requests: 完成的请求数（包括失败的）
+    * errors: dict(错误码: 次数)，错误码为 HTTP 状态码，连接出错时为 None
+    * duration: 实际的压测时长（秒）
+    * latency: 以微秒为单位的 `api_libs.metrics.Histogram`
+    * cpu: dict(worker 名称: CPU 占用率)，1.0 代表占满一个核
+    '''
+    def __init__(self, mode, concurrency, rate):
+        self.mode = mode
+        self.concurrency = concurrency
+        self.rate = rate
+        self.requests = 0
+        self.errors = {}
+        self.duration = 0
+        self.latency = Histogram()
+        self.per_route = {
+            # path: dict(requests=int, errors=int)
+        }
+        self.cpu = {}
+
+    def record(self, path, started, status=None, failed=False):
+        elapsed_us = int((time.perf_counter() - started) * 1000000)
+        self.requests += 1
+        self.latency.record(elapsed_us)
+        route_stats = self.per_route.setdefault(path, dict(requests=0, errors=0))
+        route_stats['requests'] += 1
+        if failed:
+            self.errors[status] = self.errors.get(status, 0) + 1
+            route_stats['errors'] += 1
+
+    @property
+    def error_count(self):
+        return sum(self.errors.values())
+
+    def to_dict(self):
+        latency = self.latency
+        return dict(
+            mode=self.mode,
+            concurrency=self.concurrency,
+            rate=self.rate,
+            requests=self.requests,
+            duration=self.duration,
+            throughput=self.requests / self.duration if self.duration else 0,
+            error_rate=self.error_count / self.requests if self.requests else 0,
+            errors={str(status): count for status, count in self.errors.items()},
+            latency_ms=dict(
+                p50=latency.percentile(50) / 1000,
+                p90=latency.percentile(90) / 1000,
+                p99=latency.percentile(99) / 1000,
+                p999=latency.percentile(99.9) / 1000,
+                max=latency.max / 1000,
+                mean=latency.total / latency.count / 1000 if latency.count else 0,
+            ),
+            histogram=self.histogram_rows(),
+            per_route=self.per_route,
+            cpu=self.cpu,
+        )
+
+    def histogram_rows(self):
+        '''把延迟分布按 2 的幂次合并成较粗的区间，返回 [(下界 ms, 上界 ms, 请求数), ...]'''
+        rows = {}
+        for index, count in self.latency.counts.items():
+            lower, upper = Histogram.bucket_bounds(index)
+            # 以微秒为单位，按 2 的幂次分组
+            group = max(lower, 1).bit_length() - 1
+            rows[group] = rows.get(group, 0) + count
+        return [((1 << group) / 1000 if group else 0, (2 << group) / 1000, count) for group, count in sorted(rows.items())]
+
+    def format(self):
+        data = self.to_dict()
+        latency = data['latency_ms']
+        lines = [
+            '模式: {}  并发数: {}{}'.format(
+                self.mode, self.concurrency, '  目标速率: {}/s'.format(self.rate) if self.rate else ''),
+            '请求数: {}  时长: {:.2f}s  吞吐量: {:.1f} req/s  错误率: {:.2%}'.format(
+                data['requests'], data['duration'], data['throughput'], data['error_rate']),
+            '延迟 (ms): p50 {p50:.3f}  p90 {p90:.3f}  p99 {p99:.3f}  p999 {p999:.3f}  max {max:.3f}'.format(**latency),
+        ]
+        if self.errors:
+            lines.append('错误: ' + ', '.join('{}: {}'.format(status, count) for status, count in data['errors'].items()))
+        lines.append('延迟分布:')
+        max_count = max([count for _, _, count in data['histogram']] or [1])
+        for lower, upper, count in data['histogram']:
+            lines.append('  {:>9.3f} - {:>9.3f} ms  {:>8}  {}'.format(
+                lower, upper, count, '#' * max(1, int(40 * count / max_count))))
+        for worker, usage in sorted(self.cpu.items()):
+            lines.append('CPU {}: {}'.format(worker, 'N/A' if usage is None else '{:.1%}'.format(usage)))
+        return '\n'.join(lines)
+
+
+async def drive(client, mix, report, duration, concurrency, rate=None, seed=None):
+    '''发起调用，把结果记录在 report 中。rate 为 None 时为 closed-loop 模式，否则为 open-loop 模式'''
+    rng = random.Random(seed)
+    deadline = time.perf_counter() + duration
+
+    async def call(path, arguments, started):
+        try:
+            await client.call(path, arguments)
+        except APICallFailed as e:
+            report.record(path, started, e.status, failed=True)
+        else:
+            report.record(path, started)
+
+    started = time.perf_counter()
+    if rate is None:
+        async def worker():
+            while time.perf_counter() < deadline:
+                path, arguments = mix.choose(rng)
+                await call(path, arguments, time.perf_counter())
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+    else:
+        # 按计划时间依次发出请求；同时进行中的请求数由 client 的 max_concurrency 限制，超出的会排队
+        interval = 1 / rate
+        tasks = set()
+        next_time = started
+        while next_time < deadline:
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            path, arguments = mix.choose(rng)
+            task = asyncio.ensure_future(call(path, arguments, next_time))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            next_time += interval
+        if tasks:
+            await asyncio.gather(*tasks)
+    report.duration = time.perf_counter() - started
+
+
+def run_loadtest(target, mix, concurrency=16, duration=10, rate=None, processes=0, warmup=1, seed=None,
+                 url_pattern=r'/api/(.+)'):
+    '''启动服务并进行压测，返回 `LoadReport`
+
+    :arg target: Router 或 TornadoAdapter
+    :arg RouteMix mix: 要调用的 route 组合
+    :arg int concurrency: closed-loop 模式下的并发数；open-loop 模式下同时进行中的请求数上限
+    :arg float duration: 压测时长（秒）
+    :arg float rate: 若指定，以 open-loop 模式每秒发出这么多个请求
+    :arg int processes: 为 0 时在当前进程中运行服务，否则在单独的进程中以这么多个 worker 运行服务
+    :arg float warmup: 正式压测前先进行这么多秒的预热，这部分的结果不计入报告
+    :arg seed: 选择 route 所用的随机数种子
+    :arg string url_pattern: adapter.RequestHandler 对应的 url pattern，压测客户端会按它拼出请求的 URL
+    '''
+    prefix = url_prefix(url_pattern)
+    report = LoadReport('open-loop' if rate else 'closed-loop', concurrency, rate)
+    if processes == 0:
+        asyncio.run(_run_in_process(target, mix, report, concurrency, duration, rate, warmup, seed, url_pattern, prefix))
+        return report
+
+    port = _free_port()
+    server = multiprocessing.get_context('fork').Process(
+        target=_serve, args=(target, port, processes, url_pattern))
+    server.start()
+    try:
+        _wait_for_port(port)
+        asyncio.run(_run_against(
+            port, prefix, mix, report, concurrency, duration, rate, warmup, seed, server.pid, processes))
+    finally:
+        os.kill(server.pid, signal.SIGTERM)
+        server.join(10)
+        if server.is_alive():
+            server.kill()
+    return report
+
+
+async def _run_in_process(target, mix, report, concurrency, duration, rate, warmup, seed, url_pattern, prefix):
+    from tornado.httpserver import HTTPServer
+    from tornado.netutil import bind_sockets
+    from tornado.web import Application
+    from .adapters.tornado_adapter import TornadoAdapter
+
+    adapter = target if isinstance(target, TornadoAdapter) else TornadoAdapter(target)
+    sockets = bind_sockets(0, '127.0.0.1')
+    server = HTTPServer(Application([(url_pattern, adapter.RequestHandler)]))
+    server.add_sockets(sockets)
+    client = _client(sockets[0].getsockname()[1], prefix, concurrency)
+    try:
+        if warmup:
+            await drive(client, mix, LoadReport(None, concurrency, rate), warmup, concurrency, rate, seed)
+        cpu_started = time.process_time()
+        await drive(client, mix, report, duration, concurrency, rate, seed)
+        report.cpu['in-process (含压测客户端)'] = (time.process_time() - cpu_started) / report.duration
+    finally:
+        await client.close()
+        server.stop()
+
+
+async def _run_against(port, prefix, mix, report, concurrency, duration, rate, warmup, seed, server_pid, processes):
+    client = _client(port, prefix, concurrency)
+    try:
+        if warmup:
+            await drive(client, mix, LoadReport(None, concurrency, rate), warmup, concurrency, rate, seed)
+        # processes == 1 时，serve() 直接在 server 进程中提供服务；否则由它 fork 出的子进程提供服务
+        worker_pids = [server_pid] if processes == 1 else _child_pids(server_pid)
+        cpu_started = {pid: cpu_seconds(pid) for pid in worker_pids}
+        await drive(client, mix, report, duration, concurrency, rate, seed)
+        for pid in worker_pids:
+            before, after = cpu_started[pid], cpu_seconds(pid)
+            report.cpu['worker {}'.format(pid)] = \
+                None if before is None or after is None else (after - before) / report.duration
+    finally:
+        await client.close()
+
+
+def _client(port, prefix, concurrency):
+    return APIClient('http://127.0.0.1:{}{}'.format(port, prefix), max_concurrency=concurrency)
+
+
+def url_prefix(url_pattern):
+    '''取出 url pattern 中 route path 之前的部分，例如 r'/api/(.+)' 对应 '/api/'。
+    只支持 "固定前缀 + 一个 regex group" 形式的 pattern'''
+    match = re.fullmatch(r'\^?((?:[^\\.*+?\[\]{}|^$()]|\\.)*)\([^()]*\)\$?', url_pattern)
+    if match is None:
+        raise LoadTestFailed('无法从 url pattern 中取得 URL 前缀: {}'.format(url_pattern))
+    return re.sub(r'\\(.)', r'\1', match.group(1))
+
+
+def _serve(target, port, processes, url_pattern):
+    from .serving import serve
+    serve(target, port, address='127.0.0.1', processes=processes, url_pattern=url_pattern)
+
+
+def _free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def _wait_for_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise LoadTestFailed('服务没有在 {} 秒内启动'.format(timeout))
+            time.sleep(0.05)
+
+
+def _child_pids(pid):
+    try:
+        with open('/proc/{0}/task/{0}/children'.format(pid)) as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return [pid]
+
+
+def cpu_seconds(pid):
+    '''返回进程已使用的 CPU 时间（user + system，秒），无法取得时返回 None（需要 Linux 的 /proc）'''
+    try:
+        with open('/proc/{}/stat'.format(pid)) as f:
+            # 进程名可能包含空格，从最后一个 ")" 之后开始解析
+            fields = f.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return None
+    # utime 和 stime 分别是第 14、15 个字段，去掉前两个字段（pid、进程名）后的下标为 11、12
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def load_target(spec):
+    '''从 "module:attribute" 格式的字符串中取得 Router 或 TornadoAdapter'''
+    module_name, _, attribute = spec.partition(':')
+    if not attribute:
+        raise LoadTestFailed('target 的格式应为 module:attribute (got: {})'.format(spec))
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m api_libs.loadtest', description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('target', help='module:attribute，指向一个 Router 或 TornadoAdapter')
+    parser.add_argument('--route', action='append', required=True, help='PATH[:WEIGHT][=ARGUMENTS_JSON]，可以指定多次')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--rate', type=float, help='以 open-loop 模式每秒发出这么多个请求')
+    parser.add_argument('--processes', type=int, default=0, help='为 0 时在当前进程中运行服务')
+    parser.add_argument('--warmup', type=float, default=1)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--json', action='store_true', help='以 JSON 格式输出报告')
+    options = parser.parse_args(argv)
+
+    sys.path.insert(0, os.getcwd())
+    report = run_loadtest(
+        load_target(options.target), RouteMix.parse(options.route), concurrency=options.concurrency,
+        duration=options.duration, rate=options.rate, processes=options.processes, warmup=options.warmup,
+        seed=options.seed)
+    print(json.dumps(report.to_dict(), indent=2) if options.json else report.format())
+
+
+class LoadTestFailed(APILibError):
+    pass
+
+
+if __name__ == '__main__':
+    main()
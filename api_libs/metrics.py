@@ -0,0 +1,342 @@
+'''
+统计每个 route 的调用次数、各类异常的次数，以及调用耗时的分布（histogram）。
+
+    metrics = RouterMetrics()
+    router = Router(metrics=metrics)
+
+    ...
+
+    metrics.snapshot()          # {path: {'calls': ..., 'errors': {...}, 'latency': {...}}}
+    metrics.prometheus_text()   # Prometheus text exposition format
+    metrics.register_route(router, 'metrics')   # 把上面的内容通过一个 route 提供出来
+
+通过 `Router.call()` 和 `Context.call()` 发起的调用都会被统计，嵌套调用会记在被调用的 route 名下。
+对于 async interface，统计的是从发起调用到 coroutine 执行完毕的时间。
+启用了阶段计时（见 `api_libs.timing`）的请求，各阶段的耗时也会通过 `record_phases()` 按 route 分别统计；
+通过 tracemalloc 抽样记录的各阶段内存分配情况则由 `record_allocations()` 统计。
+
+统计数据按线程分别记录（每个线程写入自己的那一份），因此记录时不需要加锁；读取时再把各线程的数据合并起来。
+'''
+import inspect
+import threading
+import time
+
+__all__ = ['Histogram', 'RouterMetrics', 'UNKNOWN_ROUTE']
+
+
+# 调用不存在的 route 时，统计数据记在这个名字下，避免任意的 route path 导致统计项无限增长
+UNKNOWN_ROUTE = '<unknown>'
+
+# 导出为 Prometheus histogram 时使用的 bucket 边界（秒）
+PROMETHEUS_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+
+class Histogram:
+    '''HDR 风格的对数-线性 histogram，记录以微秒为单位的整数值。
+
+    值被放入按 2 的幂次分段、每段再等分成 2 ** sub_bits 份的 bucket 中，相对误差不超过 1 / 2 ** sub_bits。
+    bucket 的划分方式是固定的，因此不同的 histogram（例如不同线程、不同进程记录的）可以直接相加合并。
+    '''
+    sub_bits = 3
+
+    def __init__(self):
+        self.counts = {
+            # bucket index: count
+        }
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    @classmethod
+    def bucket_index(cls, value):
+        linear_limit = 1 << (cls.sub_bits + 1)
+        if value < linear_limit:
+            return value
+        shift = value.bit_length() - cls.sub_bits - 1
+        return (shift << cls.sub_bits) + (value >> shift)
+
+    @classmethod
+    def bucket_bounds(cls, index):
+        '''返回 bucket 所覆盖的值的范围 [lower, upper)'''
+        if index < 1 << (cls.sub_bits + 1):
+            return index, index + 1
+        shift = (index >> cls.sub_bits) - 1
+        mantissa = index - (shift << cls.sub_bits)
+        return mantissa << shift, (mantissa + 1) << shift
+
+    def record(self, value):
+        index = self.bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        '''把另一个 histogram 的数据合并到当前 histogram 中'''
+        for index, count in list(other.counts.items()):
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        '''返回第 p 百分位的值（所在 bucket 的上界）'''
+        if self.count == 0:
+            return 0
+        target = self.count * p / 100
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self.bucket_bounds(index)[1] - 1, self.max)
+        return self.max
+
+    def cumulative_counts(self, bounds):
+        '''对每个边界 b，返回值不大于 b 的记录数（按 bucket 上界估算）'''
+        items = sorted(self.counts.items())
+        result = []
+        for bound in bounds:
+            result.append(sum(count for index, count in items if self.bucket_bounds(index)[1] - 1 <= bound))
+        return result
+
+
+class RouteStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = {
+            # exception class name: count
+        }
+        self.latency = Histogram()
+        self.phases = {
+            # phase name: Histogram
+        }
+        self.allocations = {
+            # phase name: dict(samples=int, peak_total=int, peak_max=int, retained_total=int)
+        }
+
+    def merge(self, other):
+        self.calls += other.calls
+        for name, count in list(other.errors.items()):
+            self.errors[name] = self.errors.get(name, 0) + count
+        self.latency.merge(other.latency)
+        for phase, histogram in list(other.phases.items()):
+            if phase not in self.phases:
+                self.phases[phase] = Histogram()
+            self.phases[phase].merge(histogram)
+        for phase, allocation in list(other.allocations.items()):
+            self._merge_allocation(phase, **allocation)
+
+    def _merge_allocation(self, phase, samples, peak_total, peak_max, retained_total):
+        allocation = self.allocations.get(phase)
+        if allocation is None:
+            allocation = self.allocations[phase] = dict(samples=0, peak_total=0, peak_max=0, retained_total=0)
+        allocation['samples'] += samples
+        allocation['peak_total'] += peak_total
+        allocation['peak_max'] = max(allocation['peak_max'], peak_max)
+        allocation['retained_total'] += retained_total
+
+
+class RouterMetrics:
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def record(self, route, started, error=None):
+        '''记录一次调用
+
+        :arg string route: route path
+        :arg float started: 调用开始的时间（time.perf_counter() 的值）
+        :arg Exception error: 调用抛出的异常，调用成功时为 None'''
+        elapsed_us = int((time.perf_counter() - started) * 1000000)
+        stats = self._route_stats(route)
+        stats.calls += 1
+        stats.latency.record(elapsed_us)
+        if error is not None:
+            name = type(error).__name__
+            stats.errors[name] = stats.errors.get(name, 0) + 1
+
+    def _route_stats(self, route):
+        shard = self._shard()
+        stats = shard.get(route)
+        if stats is None:
+            stats = shard[route] = RouteStats()
+        return stats
+
+    def record_phases(self, timer):
+        '''记录一个 `api_libs.timing.PhaseTimer` 中的各阶段耗时'''
+        for route, phase, seconds in timer.totals():
+            phases = self._route_stats(route).phases
+            if phase not in phases:
+                phases[phase] = Histogram()
+            phases[phase].record(int(seconds * 1000000))
+
+    def record_allocations(self, timer):
+        '''记录一个 `api_libs.timing.AllocationTracker` 中各阶段的内存分配情况，整个请求记为 request 阶段'''
+        items = timer.allocation_totals() + [(timer.route, 'request', timer.peak_bytes, timer.retained_bytes)]
+        for route, phase, peak_bytes, retained_bytes in items:
+            self._route_stats(route)._merge_allocation(phase, 1, peak_bytes, peak_bytes, retained_bytes)
+
+    def track(self, route, fn, *args):
+        '''调用 fn(*args) 并记录这次调用。若 fn 返回 coroutine / future，会在它执行完毕时再记录'''
+        started = time.perf_counter()
+        try:
+            ret_val = fn(*args)
+        except Exception as e:
+            self.record(route, started, e)
+            raise
+        if inspect.isawaitable(ret_val):
+            return self.track_async(route, started, ret_val)
+        self.record(route, started)
+        return ret_val
+
+    async def track_async(self, route, started, awaitable):
+        try:
+            ret_val = await awaitable
+        except Exception as e:
+            self.record(route, started, e)
+            raise
+        self.record(route, started)
+        return ret_val
+
+    def merged(self):
+        '''把各线程的数据合并起来，返回 {route: RouteStats}'''
+        result = {}
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for route, stats in list(shard.items()):
+                if route not in result:
+                    result[route] = RouteStats()
+                result[route].merge(stats)
+        return result
+
+    def reset(self):
+        with self._shards_lock:
+            for shard in self._shards:
+                shard.clear()
+
+    def snapshot(self):
+        '''以 dict 的形式返回各 route 的统计数据，耗时的单位为秒'''
+        result = {}
+        for route, stats in sorted(self.merged().items()):
+            latency = stats.latency
+            result[route] = dict(
+                calls=stats.calls,
+                errors=dict(stats.errors),
+                latency=dict(
+                    count=latency.count,
+                    sum=latency.total / 1000000,
+                    max=latency.max / 1000000,
+                    p50=latency.percentile(50) / 1000000,
+                    p90=latency.percentile(90) / 1000000,
+                    p99=latency.percentile(99) / 1000000,
+                ),
+                phases={
+                    phase: dict(
+                        count=histogram.count,
+                        sum=histogram.total / 1000000,
+                        p50=histogram.percentile(50) / 1000000,
+                        p99=histogram.percentile(99) / 1000000,
+                    )
+                    for phase, histogram in sorted(stats.phases.items())
+                },
+                allocations={
+                    phase: dict(
+                        samples=allocation['samples'],
+                        peak_avg=allocation['peak_total'] / allocation['samples'],
+                        peak_max=allocation['peak_max'],
+                        retained_avg=allocation['retained_total'] / allocation['samples'],
+                    )
+                    for phase, allocation in sorted(stats.allocations.items())
+                },
+            )
+        return result
+
+    def prometheus_text(self, prefix='api_libs_route'):
+        '''以 Prometheus text exposition format 导出统计数据'''
+        merged = sorted(self.merged().items())
+        lines = [
+            '# HELP {}_calls_total Number of interface calls.'.format(prefix),
+            '# TYPE {}_calls_total counter'.format(prefix),
+        ]
+        for route, stats in merged:
+            lines.append('{}_calls_total{{route="{}"}} {}'.format(prefix, _escape(route), stats.calls))
+
+        lines += [
+            '# HELP {}_errors_total Number of failed interface calls by exception class.'.format(prefix),
+            '# TYPE {}_errors_total counter'.format(prefix),
+        ]
+        for route, stats in merged:
+            for name, count in sorted(stats.errors.items()):
+                lines.append('{}_errors_total{{route="{}",exception="{}"}} {}'.format(
+                    prefix, _escape(route), _escape(name), count))
+
+        lines += [
+            '# HELP {}_latency_seconds Interface call latency.'.format(prefix),
+            '# TYPE {}_latency_seconds histogram'.format(prefix),
+        ]
+        bounds_us = [int(bound * 1000000) for bound in PROMETHEUS_BUCKETS]
+        for route, stats in merged:
+            label = _escape(route)
+            counts = stats.latency.cumulative_counts(bounds_us)
+            for bound, count in zip(PROMETHEUS_BUCKETS, counts):
+                lines.append('{}_latency_seconds_bucket{{route="{}",le="{}"}} {}'.format(prefix, label, bound, count))
+            lines.append('{}_latency_seconds_bucket{{route="{}",le="+Inf"}} {}'.format(
+                prefix, label, stats.latency.count))
+            lines.append('{}_latency_seconds_sum{{route="{}"}} {}'.format(
+                prefix, label, stats.latency.total / 1000000))
+            lines.append('{}_latency_seconds_count{{route="{}"}} {}'.format(prefix, label, stats.latency.count))
+
+        lines += [
+            '# HELP {}_phase_seconds Time spent in each request phase.'.format(prefix),
+            '# TYPE {}_phase_seconds summary'.format(prefix),
+        ]
+        for route, stats in merged:
+            for phase, histogram in sorted(stats.phases.items()):
+                labels = 'route="{}",phase="{}"'.format(_escape(route), _escape(phase))
+                lines.append('{}_phase_seconds_sum{{{}}} {}'.format(prefix, labels, histogram.total / 1000000))
+                lines.append('{}_phase_seconds_count{{{}}} {}'.format(prefix, labels, histogram.count))
+
+        lines += [
+            '# HELP {}_phase_peak_bytes Peak memory growth of sampled requests in each phase.'.format(prefix),
+            '# TYPE {}_phase_peak_bytes summary'.format(prefix),
+        ]
+        for route, stats in merged:
+            for phase, allocation in sorted(stats.allocations.items()):
+                labels = 'route="{}",phase="{}"'.format(_escape(route), _escape(phase))
+                lines.append('{}_phase_peak_bytes_sum{{{}}} {}'.format(prefix, labels, allocation['peak_total']))
+                lines.append('{}_phase_peak_bytes_count{{{}}} {}'.format(prefix, labels, allocation['samples']))
+        lines += [
+            '# HELP {}_phase_retained_bytes Memory retained by sampled requests after each phase.'.format(prefix),
+            '# TYPE {}_phase_retained_bytes summary'.format(prefix),
+        ]
+        for route, stats in merged:
+            for phase, allocation in sorted(stats.allocations.items()):
+                labels = 'route="{}",phase="{}"'.format(_escape(route), _escape(phase))
+                lines.append('{}_phase_retained_bytes_sum{{{}}} {}'.format(prefix, labels, allocation['retained_total']))
+                lines.append('{}_phase_retained_bytes_count{{{}}} {}'.format(prefix, labels, allocation['samples']))
+        return '\n'.join(lines) + '\n'
+
+    def register_route(self, router, path='metrics'):
+        '''在 router 中注册一个 route，以 Prometheus text format 输出统计数据'''
+        # adapters.common 依赖 route 模块，在这里才 import，避免循环 import
+        from .adapters.common import RawResponse
+
+        @router.register(path)
+        def metrics_route(context):
+            return RawResponse(self.prometheus_text(), 'text/plain; version=0.0.4; charset=utf-8')
+        return metrics_route
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -7,7 +7,14 @@ class Arguments(ObjectDict):
     def __init__(self, parameters, arguments):
         self._build(parameters, arguments)
 
-    def _build(self, parameters, arguments, allow_unexpected=False):
+    @classmethod
+    def from_trusted(cls, parameters, arguments, check_types=False):
+        '''用已经检查、格式化过的参数值构建 Arguments 对象，只进行 `Parameter.verify_trusted()` 中的检查'''
+        instance = cls.__new__(cls)
+        instance._build(parameters, arguments, trusted=True, check_types=check_types)
+        return instance
+
+    def _build(self, parameters, arguments, allow_unexpected=False, trusted=False, check_types=False):
         '''验证、格式化每一个参数值，并把它们设置成此对象的 property
 
         :arg Parameter[] parameters: 某个 interface 的参数定义
@@ -24,7 +31,7 @@ class Arguments(ObjectDict):
                 raise ArgumentsError('不支持以下参数：{}'.format(unexpected_args))
 
         for param in parameters:
-            formatted_arg = param.verify(arguments)
+            formatted_arg = param.verify_trusted(arguments, check_types) if trusted else param.verify(arguments)
             if formatted_arg is not NoValue:
                 self[param.name] = formatted_arg
 
@@ -34,5 +41,22 @@ class Arguments(ObjectDict):
         self._build(parameters, self, allow_unexpected=True)
 
 
+class TrustedArguments(dict):
+    '''通过 `Context.call(..., trusted=True)` 传给 interface 的参数值。
+    其中的值已经是检查、格式化过的结果（例如来自另一个 interface 的 Arguments），interface 不会再对它们执行完整的检查
+
+    Attributes:
+
+    * verify: 为 True 时（调试用），额外检查各参数值是否确实是格式化之后的类型（例如 Decimal 参数的值必须已经是 Decimal 对象），
+      用于找出传入了未经格式化的值的调用者。注意这并不是完整的检查：转换类的 rule（类型转换、trim、转义等）依然不会执行，
+      因此无法发现“类型正确、但没有经过 trim / 转义”的值'''
+    def __init__(self, arguments, verify=False):
+        super().__init__(arguments)
+        self.verify = verify
+
+    def build(self, parameters):
+        return Arguments.from_trusted(parameters, self, check_types=self.verify)
+
+
 class ArgumentsError(APILibError):
     pass
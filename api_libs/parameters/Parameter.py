@@ -113,10 +113,44 @@ class Parameter:
 
         return value
 
+    def verify_trusted(self, arguments, check_types=False):
+        '''用于已经检查、格式化过的参数值（见 `api_libs.parameters.Arguments.TrustedArguments`）：
+        跳过 transform_rules 中会转换参数值的 rule，其他仍可能不满足的检查（required、min、max_len、regex 等）照常进行。
+        子类可以定义 ``trusted_rule_xxx(value, check_types)`` 方法，代替 rule_xxx 在此时执行（例如 Dict、List 需要以同样的方式检查子项）
+
+        :arg bool check_types: 为 True 时（调试用），检查参数值是否确实是格式化之后的类型（见 formatted_types）'''
+        value = arguments.get(self.name, NoValue) if self.name is not NoValue else arguments
+
+        for rule_name in self.sysrule_order:
+            value = getattr(self, 'sysrule_' + rule_name)(value)
+
+        if value is not NoValue and value is not None:
+            if check_types and self.formatted_types is not None and not isinstance(value, self.formatted_types):
+                raise VerifyFailed('参数 {} 的值不是格式化过的值 (expect: {}, got: {} {})'.format(
+                    self.name, self.formatted_types, type(value), value))
+            for rule_name in self._normal_rules:
+                trusted_rule = getattr(self, 'trusted_rule_' + rule_name, None)
+                if trusted_rule is not None:
+                    value = trusted_rule(value, check_types)
+                elif rule_name not in self.transform_rules:
+                    value = getattr(self, 'rule_' + rule_name)(value)
+
+        return value
+
+    def warmup(self):
+        '''提前完成 verify 时需要用到的准备工作（例如编译正则表达式），避免第一次调用时产生额外的延迟。
+        包含子 parameter 的子类需要把此调用传递给子 parameter'''
+        pass
+
     # 各 sysrule 的执行顺序
     sysrule_order = ['default', 'required', 'nullable']
     # 各普通 rule 的执行顺序
     rule_order = []
+    # 会转换参数值的普通 rule（类型转换、trim、转义等），verify_trusted() 时不执行。
+    # 对已经格式化过的值再执行一次它们，要么是多余的，要么会得到错误的结果（例如字符串被重复转义）
+    transform_rules = []
+    # 参数值格式化之后的类型，verify_trusted(check_types=True) 时用来检查。None 代表不检查
+    formatted_types = None
 
     def spec_defaults(self):
         '''返回各 specs 的默认值（如果有的话）
@@ -23,7 +23,17 @@ class Dict(Parameter):
                 raise Exception('parameter {}: format 中不允许出现 name 重复的项({})'.format(self.name, param.name))
             names.add(param.name)
 
+    def warmup(self):
+        for param in self.specs['format']:
+            param.warmup()
+
     def rule_format(self, value):
+        return self._format(value, lambda param: param.verify(value))
+
+    def trusted_rule_format(self, value, check_types):
+        return self._format(value, lambda param: param.verify_trusted(value, check_types))
+
+    def _format(self, value, verify):
         if not isinstance(value, dict):
             raise VerifyFailed('参数 {} 的值必须是 dict (got: {} {})'.format(self.name, type(value), value))
 
@@ -36,7 +46,7 @@ class Dict(Parameter):
 
         formatted_dict = {}
         for param in params:
-            formatted_value = param.verify(value)
+            formatted_value = verify(param)
             if formatted_value is not NoValue:
                 formatted_dict[param.name] = formatted_value
         return ObjectDict(formatted_dict)
@@ -0,0 +1,434 @@
+'''
+根据 Parameter 定义生成参数值，用于 benchmark、压力测试等需要大量真实输入的场合。
+
+    from api_libs.parameters.generator import PayloadGenerator
+
+    generator = PayloadGenerator(seed=1, max_items=10, max_str_len=40)
+    arguments = generator.valid_arguments([Int('id', min=1), Str('email', regex=r'^\\w+@\\w+\\.com$')])
+    arguments, reason = generator.invalid_arguments(parameters)     # reason 例如 'id: max'
+    arguments = generator.route_arguments(router, 'user.create')   # 根据 interface 注册时的参数定义生成
+
+* 生成的值都可以直接序列化成 JSON：Decimal 生成为字符串，Datetime / Date 生成为 timestamp
+* Str 的 regex 会被解析后反向生成匹配的字符串；lookaround、``\\b`` 等无法直接生成的部分会通过重试来满足
+* 非 required 或带 default 的参数按 optional_rate 的概率出现，nullable 的参数按 null_rate 的概率为 None
+* invalid_arguments() 会在一组合法的参数值上制造一处错误，错误的种类见 INVALID_KINDS。
+  生成的结果都经过 Arguments 确认确实无法通过检查
+* 相同的 seed 与相同的参数定义，总是生成相同的结果
+'''
+import decimal as dec
+import random
+import string
+from .. import APILibError
+from .Arguments import Arguments, ArgumentsError
+from .Parameter import VerifyFailed, NoValue
+from .number_param import Int, Float, Decimal
+from .str_param import Str
+from .bool_param import Bool
+from .object_param import Object
+from .time_param import Datetime, Date
+from .list_param import List
+from .dict_param import Dict
+from .two_step_param import CanHas, CanNotHas
+
+try:
+    from re import _parser as sre_parse
+except ImportError:     # Python < 3.11
+    import sre_parse
+
+__all__ = ['PayloadGenerator', 'GenerateFailed', 'INVALID_KINDS']
+
+
+# invalid_arguments() 能够制造的错误种类
+INVALID_KINDS = ['type', 'null', 'missing', 'unexpected', 'min', 'max', 'min_len', 'max_len', 'choices', 'regex',
+                 'forbidden']
+
+# 没有 regex 限制时，字符串使用的字符。不包含 HTML 特殊字符，避免 escape 之后长度发生变化
+_ALPHABET = string.ascii_letters + string.digits
+# 正则中的 "." 与取反的字符集使用的字符
+_PRINTABLE = string.ascii_letters + string.digits + string.punctuation + ' '
+_CATEGORIES = {
+    'CATEGORY_DIGIT': string.digits,
+    'CATEGORY_NOT_DIGIT': string.ascii_letters + '_-. ',
+    'CATEGORY_WORD': string.ascii_letters + string.digits + '_',
+    'CATEGORY_NOT_WORD': ' -.,;:!?@#',
+    'CATEGORY_SPACE': ' \t',
+    'CATEGORY_NOT_SPACE': string.ascii_letters + string.digits,
+}
+
+# 生成结果没能通过检查时（例如 regex 中带有 lookahead），最多重试几次
+_MAX_ATTEMPTS = 50
+
+
+class GenerateFailed(APILibError):
+    pass
+
+
+class PayloadGenerator:
+    def __init__(self, seed=None, max_items=5, max_str_len=20, max_regex_repeat=5, optional_rate=0.5, null_rate=0.1,
+                 number_range=1000000):
+        '''
+        :arg seed: 随机数种子，为 None 时每次生成不同的结果
+        :arg int max_items: 没有 max_len 限制时，List 最多生成几个元素
+        :arg int max_str_len: 没有 max_len 限制时，Str 最长生成多少个字符
+        :arg int max_regex_repeat: 正则中的 *、+、{n,} 等没有上限的重复，最多在下限的基础上多重复几次
+        :arg float optional_rate: 非必需的参数出现的概率（0 ~ 1）
+        :arg float null_rate: nullable 的参数值为 None 的概率（0 ~ 1）
+        :arg number_range: 没有 min / max 限制时，数值的生成范围为 [-number_range, number_range]
+        '''
+        self.random = random.Random(seed)
+        self.max_items = max_items
+        self.max_str_len = max_str_len
+        self.max_regex_repeat = max_regex_repeat
+        self.optional_rate = optional_rate
+        self.null_rate = null_rate
+        self.number_range = number_range
+
+    # ===== 合法的参数值 =====
+
+    def valid_arguments(self, parameters):
+        '''根据 interface 的参数定义（Parameter 列表，None 代表不接受参数）生成一组能通过检查的参数值'''
+        for _ in range(_MAX_ATTEMPTS):
+            arguments = self._fields(parameters or [])
+            if _passes(parameters, arguments):
+                return arguments
+        raise GenerateFailed('无法生成能通过检查的参数值：{}'.format([param.name for param in parameters]))
+
+    def valid_value(self, param):
+        '''生成一个能通过 param 检查的参数值（不考虑 required、nullable，即总是生成一个实际的值）'''
+        for _ in range(_MAX_ATTEMPTS):
+            value = self._value(param)
+            if _passes_param(param, value):
+                return value
+        raise GenerateFailed('无法生成能通过参数 {} 检查的值（{}）'.format(param.name, param.specs))
+
+    def _fields(self, parameters):
+        '''生成一组参数值，parameters 可以是 interface 的参数定义，也可以是 Dict 的 format'''
+        values = {}
+        for param in parameters:
+            if isinstance(param, CanNotHas):
+                continue
+            optional = isinstance(param, CanHas) or not param.specs.get('required', True) or 'default' in param.specs
+            if optional and self.random.random() >= self.optional_rate:
+                continue
+            if param.specs.get('nullable') and self.random.random() < self.null_rate:
+                values[param.name] = None
+            else:
+                values[param.name] = self.valid_value(param)
+        return values
+
+    def _value(self, param):
+        generate = self._generators.get(type(param))
+        if generate is None:
+            # 自定义的 Parameter 子类，按最接近的内置类型生成
+            for param_cls, fn in self._generators.items():
+                if isinstance(param, param_cls):
+                    generate = fn
+                    break
+            else:
+                raise GenerateFailed('不支持为 {} 生成参数值'.format(type(param).__name__))
+        return generate(self, param)
+
+    def _int(self, param):
+        low, high = self._bounds(param, int)
+        value = self.random.randint(low, high)
+        if value == 0 and param.specs.get('nozero'):
+            value = high if high != 0 else low
+        return value
+
+    def _float(self, param):
+        low, high = self._bounds(param, float)
+        value = round(self.random.uniform(low, high), 3)
+        return value if low <= value <= high else low
+
+    def _decimal(self, param):
+        low, high = self._bounds(param, dec.Decimal)
+        # 生成两位小数，用字符串表示，以便序列化成 JSON 时不丢失精度
+        value = dec.Decimal(self.random.randint(int(low * 100), int(high * 100))) / 100
+        return str(value)
+
+    def _bounds(self, param, number_type):
+        low = param.specs.get('min')
+        high = param.specs.get('max')
+        if low is None:
+            low = min(-self.number_range, high) if high is not None else -self.number_range
+        if high is None:
+            high = max(self.number_range, low)
+        if number_type is int:
+            return _ceil(low), _floor(high)
+        return number_type(str(low)) if number_type is dec.Decimal else number_type(low), \
+            number_type(str(high)) if number_type is dec.Decimal else number_type(high)
+
+    def _str(self, param):
+        specs = param.specs
+        if 'choices' in specs:
+            return self.random.choice(list(specs['choices']))
+        if 'regex' in specs:
+            return self.regex_string(specs['regex'])
+        min_len = specs.get('min_len', min(1, specs.get('max_len', 1)))
+        max_len = specs.get('max_len', max(min_len, self.max_str_len))
+        length = self.random.randint(min_len, max(min_len, max_len))
+        return ''.join(self.random.choice(_ALPHABET) for _ in range(length))
+
+    def _bool(self, param):
+        return self.random.random() < 0.5
+
+    def _timestamp(self, param):
+        # 2001-09-09 ~ 2033-05-18 之间的整数 timestamp
+        return self.random.randint(1000000000, 2000000000)
+
+    def _list(self, param):
+        min_len = param.specs.get('min_len', 0)
+        max_len = param.specs.get('max_len', max(min_len, self.max_items))
+        length = self.random.randint(min_len, max(min_len, min(max_len, min_len + self.max_items)))
+        return [self.valid_value(param.specs['type']) for _ in range(length)]
+
+    def _dict(self, param):
+        return self._fields(param.specs['format'])
+
+    def _object(self, param):
+        value_type = param.specs['type']
+        if isinstance(value_type, tuple):
+            value_type = value_type[0]
+        candidates = [self._json_value(0)] if value_type is object else [
+            value for value in self._json_samples() if isinstance(value, value_type)]
+        if not candidates:
+            raise GenerateFailed('不支持为 type={} 的 Object 生成参数值'.format(value_type))
+        return self.random.choice(candidates)
+
+    def _can_has(self, param):
+        return self._json_value(0)
+
+    def _json_samples(self):
+        return [
+            self._int(Int()), self._float(Float()), self._str(Str()), self._bool(Bool()),
+            [self._json_value(1) for _ in range(self.random.randint(0, self.max_items))],
+            {'key{}'.format(i): self._json_value(1) for i in range(self.random.randint(0, self.max_items))},
+        ]
+
+    def _json_value(self, depth):
+        '''生成任意一个可以序列化成 JSON 的值'''
+        choices = [lambda: self._int(Int()), lambda: self._str(Str()), lambda: self._bool(Bool())]
+        if depth < 2:
+            choices.append(lambda: [self._json_value(depth + 1) for _ in range(self.random.randint(0, 3))])
+        return self.random.choice(choices)()
+
+    _generators = {
+        Int: _int,
+        Float: _float,
+        Decimal: _decimal,
+        Str: _str,
+        Bool: _bool,
+        Datetime: _timestamp,
+        Date: _timestamp,
+        List: _list,
+        Dict: _dict,
+        Object: _object,
+        CanHas: _can_has,
+    }
+
+    # ===== 根据正则表达式生成字符串 =====
+
+    def regex_string(self, pattern):
+        '''生成一个能被 pattern search 到的字符串'''
+        return self._regex(sre_parse.parse(pattern), {})
+
+    def _regex(self, items, groups):
+        return ''.join(self._regex_item(str(op), av, groups) for op, av in items)
+
+    def _regex_item(self, op, av, groups):
+        if op == 'LITERAL':
+            return chr(av)
+        elif op == 'NOT_LITERAL':
+            return self.random.choice([char for char in _PRINTABLE if ord(char) != av])
+        elif op == 'ANY':
+            return self.random.choice(_PRINTABLE)
+        elif op == 'IN':
+            return self.random.choice(self._char_set(av))
+        elif op in ['MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT']:
+            low, high, sub_items = av
+            high = min(high, low + self.max_regex_repeat)
+            return ''.join(self._regex(sub_items, groups) for _ in range(self.random.randint(low, high)))
+        elif op == 'SUBPATTERN':
+            group, sub_items = av[0], av[-1]
+            text = self._regex(sub_items, groups)
+            if group is not None:
+                groups[group] = text
+            return text
+        elif op == 'BRANCH':
+            return self._regex(self.random.choice(av[1]), groups)
+        elif op == 'GROUPREF':
+            return groups.get(av, '')
+        elif op in ['AT', 'ASSERT', 'ASSERT_NOT']:
+            # 锚点与 lookaround 不产生字符，生成的结果不满足要求时由调用者重试
+            return ''
+        raise GenerateFailed('不支持根据正则中的 {} 生成字符串'.format(op))
+
+    def _char_set(self, items):
+        chars = set()
+        negate = False
+        for op, av in items:
+            op = str(op)
+            if op == 'NEGATE':
+                negate = True
+            elif op == 'LITERAL':
+                chars.add(chr(av))
+            elif op == 'RANGE':
+                # 范围过大时（例如中文字符）只取其中一部分
+                chars.update(chr(code) for code in range(av[0], min(av[1], av[0] + 255) + 1))
+            elif op == 'CATEGORY':
+                chars.update(_CATEGORIES.get(str(av), ''))
+            else:
+                raise GenerateFailed('不支持根据正则中的 {} 生成字符串'.format(op))
+        if negate:
+            chars = set(_PRINTABLE).difference(chars)
+        if not chars:
+            raise GenerateFailed('无法根据正则中的字符集生成字符')
+        return sorted(chars)
+
+    # ===== 无法通过检查的参数值 =====
+
+    def invalid_arguments(self, parameters, kinds=None):
+        '''在一组合法的参数值中制造一处错误
+
+        :arg parameters: interface 的参数定义
+        :arg kinds: 允许制造的错误种类（见 INVALID_KINDS），None 代表全部
+        :return: (arguments, reason)。reason 的格式为 "参数路径: 错误种类"，例如 "user.age: max"、"tags[]: type"；
+          顶层多出一个参数时为 ": unexpected"'''
+        kinds = INVALID_KINDS if kinds is None else kinds
+        for _ in range(_MAX_ATTEMPTS):
+            arguments = self.valid_arguments(parameters)
+            candidates = [
+                mutation for mutation in self._mutations(parameters or [], arguments, None) if mutation[1] in kinds]
+            if not candidates:
+                break
+            path, kind, apply = self.random.choice(candidates)
+            apply()
+            if not _passes(parameters, arguments):
+                return arguments, '{}: {}'.format(path or '', kind)
+        raise GenerateFailed('无法为参数定义生成 {} 类的错误'.format(kinds))
+
+    def _mutations(self, parameters, values, parent_path):
+        '''列出能在 values（与 parameters 对应的一组参数值）上制造的错误，返回 [(path, kind, apply), ...]'''
+        mutations = [(parent_path, 'unexpected', lambda: values.__setitem__('__unexpected__', 1))]
+        for param in parameters:
+            path = param.name if parent_path is None else '{}.{}'.format(parent_path, param.name)
+            if isinstance(param, CanNotHas):
+                mutations.append((path, 'forbidden', _setter(values, param.name, 1)))
+                continue
+            if isinstance(param, CanHas):
+                continue
+            if param.specs.get('required', True) and 'default' not in param.specs:
+                mutations.append((path, 'missing', lambda name=param.name: values.pop(name, None)))
+            if not param.specs.get('nullable'):
+                mutations.append((path, 'null', _setter(values, param.name, None)))
+            mutations.extend(self._value_mutations(param, path, values, param.name))
+        return mutations
+
+    def _value_mutations(self, param, path, container, key):
+        '''针对参数值本身（container[key]）能制造的错误'''
+        mutations = []
+        wrong_value = self._wrong_type_value(param)
+        if wrong_value is not NoValue:
+            mutations.append((path, 'type', _setter(container, key, wrong_value)))
+
+        specs = param.specs
+        if isinstance(param, (Int, Float, Decimal)):
+            step = dec.Decimal('0.01') if isinstance(param, Decimal) else 1
+            for kind, delta in [('min', -step), ('max', step)]:
+                if specs.get(kind) is not None:
+                    value = specs[kind] + delta if not isinstance(param, Decimal) \
+                        else str(dec.Decimal(str(specs[kind])) + delta)
+                    mutations.append((path, kind, _setter(container, key, value)))
+        elif isinstance(param, Str):
+            if specs.get('min_len', 0) > 0:
+                # 使用不会被 trim 掉、escape 后长度也不变的字符
+                mutations.append((path, 'min_len', _setter(container, key, 'a' * (specs['min_len'] - 1))))
+            if 'max_len' in specs:
+                mutations.append((path, 'max_len', _setter(container, key, 'a' * (specs['max_len'] + 1))))
+            if 'choices' in specs:
+                invalid_choice = '_'.join(str(choice) for choice in specs['choices']) + '_'
+                mutations.append((path, 'choices', _setter(container, key, invalid_choice)))
+            if 'regex' in specs:
+                for text in ['', '~', ' !~ ', '0']:
+                    if not param._pattern('regex').search(text):
+                        mutations.append((path, 'regex', _setter(container, key, text)))
+                        break
+        elif isinstance(param, List) and isinstance(_get(container, key), list):
+            value = _get(container, key)
+            if specs.get('min_len', 0) > 0:
+                mutations.append((path, 'min_len', _setter(container, key, value[:specs['min_len'] - 1])))
+            if 'max_len' in specs:
+                mutations.append((path, 'max_len', lambda: container.__setitem__(key, value + [
+                    self.valid_value(specs['type']) for _ in range(specs['max_len'] + 1 - len(value))])))
+            if value:
+                mutations.extend(self._value_mutations(specs['type'], path + '[]', value, 0))
+        elif isinstance(param, Dict) and isinstance(_get(container, key), dict):
+            mutations.extend(self._mutations(specs['format'], _get(container, key), path))
+        return mutations
+
+    def _wrong_type_value(self, param):
+        '''返回一个类型不符合 param 要求的值，无法构造时返回 NoValue'''
+        if isinstance(param, Object):
+            value_type = param.specs['type']
+            for value in ['x', 1, [], {}]:
+                if not isinstance(value, value_type):
+                    return value
+            return NoValue
+        for param_cls, value in [
+                (Int, '1'), (Float, 'x'), (Decimal, []), (Str, 1), (Bool, 'true'), (Datetime, 'x'), (Date, 'x'),
+                (List, 'x'), (Dict, [])]:
+            if isinstance(param, param_cls):
+                return value
+        return NoValue
+
+    # ===== Router =====
+
+    def route_arguments(self, router, path, valid=True):
+        '''根据 router 中 path 对应的 interface 的参数定义生成参数值。
+        valid=False 时返回 invalid_arguments() 的结果，即 (arguments, reason)'''
+        parameters = route_parameters(router, path)
+        return self.valid_arguments(parameters) if valid else self.invalid_arguments(parameters)
+
+
+def route_parameters(router, path):
+    '''取得 router 中 path 对应的 interface 的参数定义（None 代表此 interface 不接受参数）'''
+    interface = router.interfaces.get(path.lower())
+    if interface is None:
+        raise GenerateFailed('route 不存在：{}'.format(path))
+    return getattr(interface, '__api_libs_parameters', None)
+
+
+def _setter(container, key, value):
+    return lambda: container.__setitem__(key, value)
+
+
+def _get(container, key):
+    return container.get(key) if isinstance(container, dict) else container[key]
+
+
+def _passes(parameters, arguments):
+    try:
+        if parameters is None:
+            return arguments == {}
+        Arguments(parameters, arguments)
+    except (VerifyFailed, ArgumentsError):
+        return False
+    return True
+
+
+def _passes_param(param, value):
+    try:
+        param.verify(value) if param.name is NoValue else param.verify({param.name: value})
+    except VerifyFailed:
+        return False
+    return True
+
+
+def _ceil(value):
+    integer = int(value)
+    return integer + 1 if integer < value else integer
+
+
+def _floor(value):
+    integer = int(value)
+    return integer - 1 if integer > value else integer
@@ -16,6 +16,9 @@ class List(Parameter):
         if not isinstance(item_type, Parameter):
             raise Exception('parameter {}: type specification 的值必须是 Parameter 或其子类, got {}'.format(self.name, item_type))
 
+    def warmup(self):
+        self.specs['type'].warmup()
+
     def rule_type(self, value):
         if type(value) != list:
             raise VerifyFailed('参数 {} 的值必须是 list (got: {} {})'.format(self.name, type(value), value))
@@ -26,6 +29,12 @@ class List(Parameter):
             formatted_item.append(item_type.verify(item))
         return formatted_item
 
+    def trusted_rule_type(self, value, check_types):
+        if type(value) != list:
+            raise VerifyFailed('参数 {} 的值必须是 list (got: {} {})'.format(self.name, type(value), value))
+        item_type = self.specs.get('type')
+        return [item_type.verify_trusted(item, check_types) for item in value]
+
     def rule_min_len(self, value):
         '''通过 min_len=n 指定 list 的最小长度'''
         if 'min_len' in self.specs and len(value) < self.specs['min_len']:
@@ -47,6 +47,8 @@ class Int(Number):
 
 class Float(Number):
     rule_order = ['type']
+    transform_rules = ['type']
+    formatted_types = float
 
     def rule_type(self, value):
         if type(value) not in [int, float] or math.isnan(value) or math.isinf(value):
@@ -58,6 +60,8 @@ class Float(Number):
 
 class Decimal(Number):
     rule_order = ['type']
+    transform_rules = ['type']
+    formatted_types = dec.Decimal
 
     def rule_type(self, value):
         if type(value) is str:
@@ -0,0 +1,142 @@
+'''
+参数检查的 profiling：统计每个 (route, 参数路径, rule) 的调用次数与耗时，找出拖慢参数检查的 rule。
+
+    from api_libs.parameters.profiling import validation_profiler
+
+    validation_profiler.enable()
+    ...
+    print(validation_profiler.format_report(top=20))
+    validation_profiler.disable()
+
+启用时会把 `Parameter.verify` 替换成带计时的版本，关闭时再换回来，因此关闭状态下没有任何额外开销。
+
+* 参数路径：顶层参数为参数名；Dict 的子项为 ``parent.child``；List 的元素为 ``parent[]``
+* total 是 rule 的总耗时，包含其中嵌套的子参数的检查（例如 Dict 的 format rule 包含了各子项的检查）；
+  self 是扣除嵌套的子参数检查之后的耗时
+* 不是通过 Router 发起的参数检查（例如直接调用 interface），route 记为 None
+'''
+import json
+import threading
+import time
+from .Parameter import Parameter, NoValue
+from ..timing import current_route
+
+__all__ = ['ValidationProfiler', 'validation_profiler']
+
+
+class ValidationProfiler:
+    def __init__(self):
+        self.enabled = False
+        self._stats = {
+            # (route, parameter path, rule name): [calls, total seconds, self seconds]
+        }
+        self._lock = threading.Lock()
+        # 每个线程当前所在的参数路径，以及当前 rule 中嵌套的子参数检查所用的时间
+        self._local = threading.local()
+        self._original_verify = None
+
+    def enable(self):
+        if self.enabled:
+            return
+        self._original_verify = Parameter.verify
+        profiler = self
+
+        def verify(param, arguments):
+            return profiler._verify(param, arguments)
+        Parameter.verify = verify
+        self.enabled = True
+
+    def disable(self):
+        if not self.enabled:
+            return
+        Parameter.verify = self._original_verify
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def _verify(self, param, arguments):
+        '''与 `Parameter.verify()` 的行为相同，同时记录每个 rule 的耗时'''
+        local = self._local
+        parent_path = getattr(local, 'path', None)
+        if param.name is NoValue:
+            path = (parent_path or '') + '[]'
+        else:
+            path = param.name if parent_path is None else '{}.{}'.format(parent_path, param.name)
+
+        route = current_route()
+        local.path = path
+        try:
+            value = arguments.get(param.name, NoValue) if param.name is not NoValue else arguments
+            for rule_name in param.sysrule_order:
+                value = self._run_rule(route, path, param, 'sysrule_' + rule_name, value)
+            if value is not NoValue and value is not None:
+                for rule_name in param._normal_rules:
+                    value = self._run_rule(route, path, param, 'rule_' + rule_name, value)
+            return value
+        finally:
+            local.path = parent_path
+
+    def _run_rule(self, route, path, param, method_name, value):
+        local = self._local
+        outer_child_time = getattr(local, 'child_time', 0)
+        local.child_time = 0
+        started = time.perf_counter()
+        try:
+            return getattr(param, method_name)(value)
+        finally:
+            elapsed = time.perf_counter() - started
+            self_time = elapsed - local.child_time
+            local.child_time = outer_child_time + elapsed
+
+            key = (route, path, method_name.split('_', 1)[1])
+            with self._lock:
+                stats = self._stats.get(key)
+                if stats is None:
+                    stats = self._stats[key] = [0, 0, 0]
+                stats[0] += 1
+                stats[1] += elapsed
+                stats[2] += self_time
+
+    def report(self, top=20, sort_by='total'):
+        '''返回耗时最多的 top 个 rule
+
+        :arg int top: 返回多少项，None 代表全部
+        :arg string sort_by: 'total' 或 'self'，按哪一种耗时排序
+        :return: [dict(route, parameter, rule, calls, total, self), ...]，耗时的单位为秒'''
+        if sort_by not in ['total', 'self']:
+            raise ValueError('sort_by 只能是 total 或 self (got: {})'.format(sort_by))
+        with self._lock:
+            items = [
+                dict(route=route, parameter=path, rule=rule, calls=stats[0], total=stats[1], self=stats[2])
+                for (route, path, rule), stats in self._stats.items()
+            ]
+        items.sort(key=lambda item: item[sort_by], reverse=True)
+        return items if top is None else items[:top]
+
+    def format_report(self, top=20, sort_by='total', format='table'):
+        '''以文本表格（format='table'）或 JSON（format='json'）的形式输出 `report()` 的结果'''
+        items = self.report(top, sort_by)
+        if format == 'json':
+            return json.dumps(items, ensure_ascii=False)
+        elif format != 'table':
+            raise ValueError('不支持的 format: {}'.format(format))
+
+        header = ['route', 'parameter', 'rule', 'calls', 'total(ms)', 'self(ms)', 'avg(us)']
+        rows = [header] + [
+            [
+                str(item['route']), item['parameter'], item['rule'], str(item['calls']),
+                '{:.3f}'.format(item['total'] * 1000), '{:.3f}'.format(item['self'] * 1000),
+                '{:.1f}'.format(item['total'] / item['calls'] * 1000000),
+            ]
+            for item in items
+        ]
+        widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+        return '\n'.join(
+            '  '.join(cell.ljust(width) if i < 3 else cell.rjust(width) for i, (cell, width) in enumerate(zip(row, widths)))
+            for row in rows)
+
+
+# 全局唯一的 profiler，Router 会在它启用时记录当前的 route
+validation_profiler = ValidationProfiler()
@@ -7,6 +7,23 @@ __all__ = ['Str']
 
 class Str(Parameter):
     rule_order = ['type', 'trim', 'regex', 'not_regex', 'escape']
+    transform_rules = ['trim', 'escape']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._patterns = {}
+
+    def warmup(self):
+        for spec_name in ['regex', 'not_regex']:
+            if spec_name in self.specs:
+                self._pattern(spec_name)
+
+    def _pattern(self, spec_name):
+        '''取得 regex / not_regex 编译后的正则对象'''
+        pattern = self._patterns.get(spec_name)
+        if pattern is None:
+            pattern = self._patterns[spec_name] = re.compile(self.specs[spec_name])
+        return pattern
 
     def spec_defaults(self):
         return dict(
@@ -32,17 +49,29 @@ class Str(Parameter):
         return value
 
     def rule_regex(self, value):
-        if 'regex' in self.specs and not re.search(self.specs['regex'], value):
+        if 'regex' in self.specs and not self._pattern('regex').search(value):
             raise VerifyFailed('rule_regex: 参数 {} 不符合格式(got: {})'.format(
                 self.name, value))
         return value
 
     def rule_not_regex(self, value):
-        if 'not_regex' in self.specs and re.search(self.specs['not_regex'], value):
+        if 'not_regex' in self.specs and self._pattern('not_regex').search(value):
             raise VerifyFailed('rule_not_regex: 参数 {} 不符合格式(got: {})'.format(
                 self.name, value))
         return value
 
+    def trusted_rule_regex(self, value, check_types):
+        # 正常检查时，regex 作用于转义之前的值；已经格式化过的值需要先还原，才能得到相同的检查结果
+        self.rule_regex(self._unescaped(value))
+        return value
+
+    def trusted_rule_not_regex(self, value, check_types):
+        self.rule_not_regex(self._unescaped(value))
+        return value
+
+    def _unescaped(self, value):
+        return html.unescape(value) if self.specs['escape'] else value
+
     def rule_escape(self, value):
         '''转义字符串中的 HTML 字符'''
         if self.specs['escape']:
@@ -7,6 +7,8 @@ __all__ = ['Datetime', 'Date']
 class Datetime(Parameter):
     '''把 timestamp (int / float) 类型参数值，转换成 datetime 对象'''
     rule_order = ['type']
+    transform_rules = ['type']
+    formatted_types = datetime.datetime
 
     def rule_type(self, value):
         if type(value) is datetime.datetime:
@@ -21,6 +23,8 @@ class Datetime(Parameter):
 class Date(Parameter):
     '''把 timestamp (int / float) 类型参数值，转换成 date 对象'''
     rule_order = ['type']
+    transform_rules = ['type']
+    formatted_types = datetime.date
 
     def rule_type(self, value):
         if type(value) is datetime.date:
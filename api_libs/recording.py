@@ -0,0 +1,381 @@
+'''
+录制线上流量，并在本地回放，用来离线重现性能问题、比较两个版本的延迟分布。
+
+    recorder = TrafficRecorder('/var/log/api-traffic.jsonl', sample_rate=0.01, max_bytes=100 * 1024 * 1024,
+                               redact_keys=['password', 'token'])
+    adapter = TornadoAdapter(router, recorder=recorder)
+
+录制文件每行一条记录，格式为 JSON 数组 ``[timestamp, route path, duration (ms), status, arguments]``：
+
+* timestamp 是请求开始处理的时间（unix 时间戳），回放时据此还原请求之间的间隔
+* duration 是 adapter 调用 interface 并输出结果所用的时间，status 是 HTTP 状态码
+* 文件只会被追加写入；达到 max_bytes 后停止录制（不会删除或覆盖已有的内容）
+* 写入经过缓冲，进程退出前应调用 `TrafficRecorder.close()`。读取时会忽略不完整的最后一行
+
+回放与比较：
+
+    python -m api_libs.recording replay traffic.jsonl myapp.api:router --speed 10 --output new.json
+    python -m api_libs.recording replay traffic.jsonl http://127.0.0.1:8888/api/ --speed 0 --concurrency 32
+    python -m api_libs.recording summary traffic.jsonl --output production.json
+    python -m api_libs.recording compare old.json new.json --threshold 0.1
+
+* target 为 Router 时在当前进程中直接调用 router（不经过 HTTP，context data 为 None）；
+  为 TornadoAdapter 时在本机回环地址上启动服务，通过 HTTP 调用；为 URL 时调用已在运行的服务
+* speed=1 按录制时的节奏回放，speed=10 以 10 倍速回放；speed=0 时不等待，以 concurrency 个并发尽快回放
+* 按节奏回放时，延迟从计划发出的时间开始计算（与 `api_libs.loadtest` 的 open-loop 模式相同）
+* summary 把录制文件中记录的线上耗时整理成与 replay 相同格式的报告，可以与回放的结果进行比较
+'''
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from . import APILibError
+from .client import APIClient, APICallFailed
+from .loadtest import LoadReport, load_target, url_prefix
+from .metrics import Histogram
+
+__all__ = ['TrafficRecorder', 'read_records', 'replay', 'summarize', 'compare_reports', 'ReplayReport']
+
+logger = logging.getLogger(__name__)
+
+
+class TrafficRecorder:
+    def __init__(self, path, sample_rate=1.0, max_bytes=64 * 1024 * 1024, routes=None, redact_keys=(), redact=None):
+        '''
+        :arg string path: 录制文件的路径，已存在时在文件末尾追加
+        :arg float sample_rate: 随机录制这个比例（0 ~ 1）的请求
+        :arg int max_bytes: 录制文件的大小上限（包括文件中原有的内容）
+        :arg routes: 若指定，只录制这些 route
+        :arg redact_keys: arguments（包括嵌套的 dict）中，这些 key 的值会被替换成 "***"，不区分大小写
+        :arg redact: 若指定，录制前会调用 ``redact(route_path, arguments)``，用它的返回值作为要录制的 arguments；
+          返回 None 时不录制此次请求。它在 redact_keys 之后执行
+        '''
+        self.path = path
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.routes = None if routes is None else set(route.lower() for route in routes)
+        self.redact_keys = set(key.lower() for key in redact_keys)
+        self.redact = redact
+        self.recorded = 0
+        self.full = False
+        self._file = None
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def should_record(self, route_path):
+        if self.full:
+            return False
+        if self.routes is not None and route_path.lower() not in self.routes:
+            return False
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def wrap(self, req_handler, route_path, arguments, coro):
+        '''若此次请求需要录制，返回一个执行 coro 并记录结果的新 coroutine，否则原样返回 coro'''
+        if not self.should_record(route_path):
+            return coro
+        arguments = self._redact_keys(arguments) if self.redact_keys else arguments
+        if self.redact is not None:
+            arguments = self.redact(route_path, arguments)
+            if arguments is None:
+                return coro
+        # 在调用前就把 arguments 序列化，避免它在调用过程中被修改
+        return self._track(req_handler, route_path, json.dumps(arguments, ensure_ascii=False, default=str), coro)
+
+    async def _track(self, req_handler, route_path, raw_arguments, coro):
+        timestamp = time.time()
+        started = time.perf_counter()
+        status = 500
+        try:
+            await coro
+            status = req_handler.get_status()
+        except Exception as e:
+            status = getattr(e, 'status_code', 500)
+            raise
+        finally:
+            self.write(timestamp, route_path, (time.perf_counter() - started) * 1000, status, raw_arguments)
+
+    def write(self, timestamp, route_path, duration_ms, status, raw_arguments):
+        '''写入一条记录。raw_arguments 是已经序列化成 JSON 的 arguments'''
+        line = '[{:.6f},{},{:.3f},{},{}]\n'.format(
+            timestamp, json.dumps(route_path, ensure_ascii=False), duration_ms, status, raw_arguments).encode()
+        with self._lock:
+            if self.full:
+                return
+            if self._file is None:
+                self._file = open(self.path, 'ab')
+                self._size = self._file.tell()
+            if self._size + len(line) > self.max_bytes:
+                self.full = True
+                logger.warning('录制文件已达到大小上限（%s bytes），停止录制: %s', self.max_bytes, self.path)
+                return
+            self._file.write(line)
+            self._size += len(line)
+            self.recorded += 1
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _redact_keys(self, value):
+        if isinstance(value, dict):
+            return {
+                key: '***' if isinstance(key, str) and key.lower() in self.redact_keys else self._redact_keys(item)
+                for key, item in value.items()
+            }
+        if isinstance(value, list):
+            return [self._redact_keys(item) for item in value]
+        return value
+
+
+def read_records(path):
+    '''逐条读取录制文件，生成 (timestamp, route path, duration_ms, status, arguments)。
+    无法解析的行（例如进程退出时没有写完的最后一行）会被跳过'''
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                timestamp, route_path, duration_ms, status, arguments = json.loads(line.decode())
+            except ValueError:
+                logger.warning('跳过无法解析的记录: %r', line[:100])
+                continue
+            yield timestamp, route_path, duration_ms, status, arguments
+
+
+class ReplayReport(LoadReport):
+    '''在 `LoadReport` 的基础上，记录每个 route 各自的延迟分布'''
+    def __init__(self, mode, concurrency, rate=None):
+        super().__init__(mode, concurrency, rate)
+        self.route_latency = {
+            # path: Histogram（微秒）
+        }
+
+    def record(self, path, started, status=None, failed=False):
+        self.record_elapsed(path, int((time.perf_counter() - started) * 1000000), status, failed)
+
+    def record_elapsed(self, path, elapsed_us, status=None, failed=False):
+        self.requests += 1
+        self.latency.record(elapsed_us)
+        self.route_latency.setdefault(path, Histogram()).record(elapsed_us)
+        route_stats = self.per_route.setdefault(path, dict(requests=0, errors=0))
+        route_stats['requests'] += 1
+        if failed:
+            self.errors[status] = self.errors.get(status, 0) + 1
+            route_stats['errors'] += 1
+
+    def to_dict(self):
+        data = super().to_dict()
+        for path, histogram in self.route_latency.items():
+            data['per_route'][path]['latency_ms'] = _percentiles(histogram)
+        return data
+
+
+def _percentiles(histogram):
+    return dict(
+        p50=histogram.percentile(50) / 1000,
+        p90=histogram.percentile(90) / 1000,
+        p99=histogram.percentile(99) / 1000,
+        p999=histogram.percentile(99.9) / 1000,
+    )
+
+
+def summarize(path):
+    '''把录制文件中记录的线上耗时整理成与 `replay()` 相同格式的 `ReplayReport`'''
+    report = ReplayReport('recorded', None)
+    first = last = None
+    for timestamp, route_path, duration_ms, status, _ in read_records(path):
+        report.record_elapsed(route_path, int(duration_ms * 1000), status, failed=status >= 400)
+        first = timestamp if first is None else first
+        last = timestamp
+    report.duration = last - first if report.requests > 1 else 0
+    return report
+
+
+def replay(path, target, speed=1.0, concurrency=16, limit=None, url_pattern=r'/api/(.+)'):
+    '''回放录制文件，返回 `ReplayReport`
+
+    :arg target: Router、TornadoAdapter，或已在运行的服务的 base url（例如 http://127.0.0.1:8888/api/）
+    :arg float speed: 回放速度的倍数。为 0 时不按录制的节奏，以 concurrency 个并发尽快回放
+    :arg int concurrency: 同时进行中的请求数上限
+    :arg int limit: 最多回放多少条记录
+    :arg string url_pattern: target 为 TornadoAdapter 时，adapter.RequestHandler 对应的 url pattern，回放客户端会按它拼出请求的 URL
+    '''
+    records = []
+    for record in read_records(path):
+        if limit is not None and len(records) >= limit:
+            break
+        records.append(record)
+    if not records:
+        raise ReplayFailed('录制文件中没有可回放的记录: {}'.format(path))
+    report = ReplayReport('replay x{}'.format(speed) if speed else 'replay (max speed)', concurrency)
+    asyncio.run(_replay(records, target, speed, concurrency, report, url_pattern))
+    return report
+
+
+async def _replay(records, target, speed, concurrency, report, url_pattern):
+    from .route import Router
+    from .adapters.tornado_adapter import TornadoAdapter
+
+    server = None
+    if isinstance(target, Router):
+        call = _router_caller(target)
+    else:
+        if isinstance(target, TornadoAdapter):
+            server, base_url = _start_server(target, url_pattern)
+        else:
+            base_url = target
+        client = APIClient(base_url, max_concurrency=concurrency)
+        call = client.call
+    try:
+        await _drive(records, call, speed, concurrency, report)
+    finally:
+        if server is not None:
+            server.stop()
+        if not isinstance(target, Router):
+            await client.close()
+
+
+def _router_caller(router):
+    async def call(route_path, arguments):
+        try:
+            ret_val = router.call(route_path, None, arguments)
+            if asyncio.iscoroutine(ret_val) or isinstance(ret_val, asyncio.Future):
+                await ret_val
+        except Exception as e:
+            # 与 HTTP 调用一致，以 APICallFailed 表示调用失败，用异常的类型名代替状态码
+            raise APICallFailed(str(e), type(e).__name__)
+    return call
+
+
+def _start_server(adapter, url_pattern):
+    from tornado.httpserver import HTTPServer
+    from tornado.netutil import bind_sockets
+    from tornado.web import Application
+
+    sockets = bind_sockets(0, '127.0.0.1')
+    server = HTTPServer(Application([(url_pattern, adapter.RequestHandler)]))
+    server.add_sockets(sockets)
+    return server, 'http://127.0.0.1:{}{}'.format(sockets[0].getsockname()[1], url_prefix(url_pattern))
+
+
+async def _drive(records, call, speed, concurrency, report):
+    async def send(route_path, arguments, started):
+        try:
+            await call(route_path, arguments)
+        except APICallFailed as e:
+            report.record(route_path, started, e.status, failed=True)
+        else:
+            report.record(route_path, started)
+
+    started = time.perf_counter()
+    if not speed:
+        queue = iter(records)
+
+        async def worker():
+            for _, route_path, _, _, arguments in queue:
+                await send(route_path, arguments, time.perf_counter())
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+    else:
+        # 按录制时的间隔（除以 speed）依次发出请求；同时进行中的请求数由 semaphore 限制，超出的会排队
+        semaphore = asyncio.Semaphore(concurrency)
+        first_timestamp = records[0][0]
+        tasks = []
+
+        async def limited_send(route_path, arguments, scheduled):
+            async with semaphore:
+                await send(route_path, arguments, scheduled)
+
+        for timestamp, route_path, _, _, arguments in records:
+            scheduled = started + (timestamp - first_timestamp) / speed
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(limited_send(route_path, arguments, scheduled)))
+        await asyncio.gather(*tasks)
+    report.duration = time.perf_counter() - started
+
+
+def compare_reports(baseline, current, threshold=0.1):
+    '''比较两份报告（`ReplayReport.to_dict()` 的结果）的延迟分布
+
+    :return: [(route, percentile, baseline_ms, current_ms, ratio, is_regression), ...]。
+      route 为 None 的是全部请求的汇总；只比较两份报告中都存在的 route'''
+    rows = []
+    sources = [(None, baseline['latency_ms'], current['latency_ms'])] + [
+        (path, baseline['per_route'][path]['latency_ms'], stats['latency_ms'])
+        for path, stats in sorted(current['per_route'].items())
+        if path in baseline['per_route'] and 'latency_ms' in stats and 'latency_ms' in baseline['per_route'][path]
+    ]
+    for route, base_latency, current_latency in sources:
+        for percentile in ['p50', 'p90', 'p99', 'p999']:
+            base_ms, current_ms = base_latency[percentile], current_latency[percentile]
+            ratio = current_ms / base_ms if base_ms else 1
+            rows.append((route, percentile, base_ms, current_ms, ratio, ratio > 1 + threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m api_libs.recording', description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    replay_parser = commands.add_parser('replay', help='回放录制文件')
+    replay_parser.add_argument('file')
+    replay_parser.add_argument('target', help='module:attribute（Router 或 TornadoAdapter），或服务的 base url')
+    replay_parser.add_argument('--speed', type=float, default=1, help='回放速度的倍数，为 0 时尽快回放')
+    replay_parser.add_argument('--concurrency', type=int, default=16)
+    replay_parser.add_argument('--limit', type=int, help='最多回放多少条记录')
+    replay_parser.add_argument('--output', help='把报告以 JSON 格式写入此文件')
+
+    summary_parser = commands.add_parser('summary', help='整理录制文件中记录的线上耗时')
+    summary_parser.add_argument('file')
+    summary_parser.add_argument('--output', help='把报告以 JSON 格式写入此文件')
+
+    compare_parser = commands.add_parser('compare', help='比较两份报告的延迟分布')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help='延迟增加多少（比例）算作 regression')
+    options = parser.parse_args(argv)
+
+    if options.command == 'compare':
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        with open(options.current) as f:
+            current = json.load(f)
+        rows = compare_reports(baseline, current, options.threshold)
+        for route, percentile, base_ms, current_ms, ratio, is_regression in rows:
+            print('{:<30} {:<5} {:>10.3f} -> {:>10.3f} ms   {:+7.1%}{}'.format(
+                route or '(all)', percentile, base_ms, current_ms, ratio - 1, '   REGRESSION' if is_regression else ''))
+        return 1 if any(row[5] for row in rows) else 0
+
+    if options.command == 'replay':
+        target = options.target
+        if not target.startswith(('http://', 'https://')):
+            sys.path.insert(0, os.getcwd())
+            target = load_target(target)
+        report = replay(options.file, target, options.speed, options.concurrency, options.limit)
+    else:
+        report = summarize(options.file)
+    print(report.format())
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(report.to_dict(), f, indent=2)
+    return 0
+
+
+class ReplayFailed(APILibError):
+    pass
+
+
+if __name__ == '__main__':
+    sys.exit(main())
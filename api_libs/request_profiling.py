@@ -0,0 +1,170 @@
+'''
+按需对单个请求进行 profiling，把结果写入本地目录，用来生成火焰图或进行离线分析。
+
+    profiler = RequestProfiler('/tmp/api-profiles', mode=SAMPLING, header='X-API-Profile', token='secret')
+    adapter = TornadoAdapter(router, profiler=profiler)
+
+    # 以下三种方式都能触发 profiling：
+    # 1. 带有 "X-API-Profile: secret" Header 的请求
+    # 2. 程序中调用 profiler.profile_next('item.detail')，之后的第一个 item.detail 请求
+    # 3. profiler.set_sample_rate('item.detail', 0.01)，随机选取 1% 的 item.detail 请求
+
+两种模式：
+
+* CPROFILE: 使用 cProfile，输出 ``.pstats`` 文件，可以用 pstats、snakeviz 等工具查看
+* SAMPLING: 在后台线程中定时采集 event loop 线程的调用栈，输出 ``.collapsed`` 文件（每行为 "frame;frame;frame count"），
+  可以直接交给 flamegraph.pl、speedscope 等工具生成火焰图。它的开销比 cProfile 小得多，也不影响被测代码的相对耗时
+
+注意：profiling 是针对整个线程进行的，请求执行期间 event loop 处理的其他请求也会被记录进去。
+同一时间只会对一个请求进行 profiling，期间其他满足条件的请求会按普通请求处理。
+'''
+import cProfile
+import hmac
+import itertools
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+__all__ = ['RequestProfiler', 'StackSampler', 'CPROFILE', 'SAMPLING']
+
+logger = logging.getLogger(__name__)
+
+
+CPROFILE = 'cprofile'
+SAMPLING = 'sampling'
+
+
+class RequestProfiler:
+    def __init__(self, output_dir, mode=SAMPLING, header=None, token=None, sample_interval=0.001):
+        '''
+        :arg string output_dir: profiling 结果的输出目录，不存在时会自动创建
+        :arg string mode: CPROFILE 或 SAMPLING
+        :arg string header: 若指定，客户端可以通过这个 HTTP Header 触发对此次请求的 profiling
+        :arg string token: header 的值必须与它相同才会触发 profiling。没有指定 token 时，header 不会生效
+        :arg float sample_interval: SAMPLING 模式下采集调用栈的间隔（秒）
+        '''
+        if mode not in [CPROFILE, SAMPLING]:
+            raise ValueError('不支持的 profiling 模式: {}'.format(mode))
+        self.output_dir = output_dir
+        self.mode = mode
+        self.header = header
+        self.token = token
+        self.sample_interval = sample_interval
+        self.sample_rates = {
+            # route（小写）: 0 ~ 1 之间的采样比例
+        }
+        self._pending = []      # profile_next() 指定的 route（None 代表任意 route）
+        self._active = False
+        self._sequence = itertools.count()
+
+    def profile_next(self, route=None, count=1):
+        '''对接下来的 count 个调用 route 的请求进行 profiling，route 为 None 代表任意 route'''
+        # 与 router 一样，route path 不区分大小写
+        self._pending.extend([route.lower() if route is not None else None] * count)
+
+    def set_sample_rate(self, route, rate):
+        '''随机选取比例为 rate（0 ~ 1）的、调用 route 的请求进行 profiling。rate 为 0 时取消'''
+        route = route.lower()
+        if rate:
+            self.sample_rates[route] = rate
+        else:
+            self.sample_rates.pop(route, None)
+
+    def should_profile(self, req_handler, route):
+        if self._active:
+            return False
+        if self.header is not None and self.token is not None:
+            value = req_handler.request.headers.get(self.header)
+            if value is not None and hmac.compare_digest(value.encode(), self.token.encode()):
+                return True
+        for pending_route in [route, None]:
+            if pending_route in self._pending:
+                self._pending.remove(pending_route)
+                return True
+        rate = self.sample_rates.get(route)
+        return rate is not None and random.random() < rate
+
+    def wrap(self, req_handler, route, coro):
+        '''若此次请求需要 profiling，返回一个在 profiler 下执行 coro 的新 coroutine，否则原样返回 coro'''
+        if not self.should_profile(req_handler, route):
+            return coro
+        return self.run(route, coro)
+
+    async def run(self, route, coro):
+        '''在 profiler 下执行 coro，并把结果写入文件'''
+        self._active = True
+        try:
+            if self.mode == CPROFILE:
+                profile = cProfile.Profile()
+                profile.enable()
+                try:
+                    return await coro
+                finally:
+                    profile.disable()
+                    self._write(route, 'pstats', profile.dump_stats)
+            else:
+                sampler = StackSampler(threading.get_ident(), self.sample_interval)
+                sampler.start()
+                try:
+                    return await coro
+                finally:
+                    sampler.stop()
+                    self._write(route, 'collapsed', sampler.dump)
+        finally:
+            self._active = False
+
+    def _write(self, route, extension, dump):
+        os.makedirs(self.output_dir, exist_ok=True)
+        # 文件名：route-时间戳（毫秒）-pid-序号
+        filename = '{}-{}-{}-{}.{}'.format(
+            re.sub(r'[^\w.-]', '_', route), int(time.time() * 1000), os.getpid(), next(self._sequence), extension)
+        path = os.path.join(self.output_dir, filename)
+        try:
+            dump(path)
+        except OSError:
+            logger.exception('无法写入 profiling 结果: %s', path)
+            return
+        logger.info('profiling 结果已写入 %s', path)
+
+
+class StackSampler:
+    '''在后台线程中定时采集指定线程的调用栈，按相同调用栈合并计数'''
+    def __init__(self, thread_id, interval=0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = {
+            # 'frame;frame;frame': count
+        }
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{} ({}:{})'.format(code.co_name, code.co_filename, code.co_firstlineno).replace(';', ':'))
+                frame = frame.f_back
+            key = ';'.join(reversed(stack))
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def dump(self, path):
+        '''以 collapsed stack 格式写入文件'''
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.counts.items()):
+                f.write('{} {}\n'.format(stack, count))
@@ -1,30 +1,99 @@
 import re
+import json
+import asyncio
+import inspect
+import logging
+import time
 from . import APILibError
 from .interface import interface as to_interface
+from .execution import Executors, EXECUTOR_TYPES, INLINE, PROCESS, record_blocking
+from .cache import MISS
+from .metrics import UNKNOWN_ROUTE
+from .timing import current_timer, call_in_route
+from .tracing import current_span, trace_call
+from .parameters.profiling import validation_profiler
+from .parameters.Arguments import Arguments, TrustedArguments
+from .batching import BatchLoader
 
 __all__ = ['Router', 'Context']
 
+logger = logging.getLogger(__name__)
+
+# 未注册的 route 的选项（不要修改它）
+_NO_OPTIONS = {}
+
 
 class Router:
     '''通过此对象集中管理（注册、调用）interface'''
 
-    def __init__(self, context_cls=None):
+    def __init__(self, context_cls=None, thread_pool_size=None, process_pool_size=None, cache=None, metrics=None,
+                 verify_trusted=False, track_blocking=None):
         '''
         :arg context_cls: 此 router 绑定的 context 类型。不同类型的 context 提供不同的功能。
+        :arg int thread_pool_size: executor=THREAD 的 interface 所用线程池的大小
+        :arg int process_pool_size: executor=PROCESS 的 interface 所用进程池的大小
+        :arg cache: 缓存 interface 调用结果所用的缓存对象，详见 `api_libs.cache`
+        :arg metrics: 若指定，router 会把各 route 的调用次数、异常次数和耗时记录到这个对象里，详见 `api_libs.metrics`
+        :arg bool verify_trusted: 调试用。为 True 时，通过 `Context.call(..., trusted=True)` 发起的调用还会检查各参数值是否确实是
+          格式化之后的类型（例如 Decimal 参数的值必须已经是 Decimal 对象），用于发现传入了未经格式化的值的调用者。
+          这只是额外的类型检查，不是完整的检查：类型转换、trim、转义等 rule 依然不会执行。可以在运行时修改
+        :arg bool track_blocking: 是否把各 route 以 inline 方式执行时占用线程的时间记录到 blocking_stats 中。
+          None 代表只在指定了 metrics 时记录。可以在运行时修改
         :type context_cls: `Context` 或它的子类
+        :type cache: ``api_libs.cache.LocalCache`` / ``api_libs.cache.SharedMemoryCache`` or ``None``
+        :type metrics: ``api_libs.metrics.RouterMetrics`` or ``None``
         '''
         self.context_cls = context_cls or Context
+        self.cache = cache
+        self.metrics = metrics
+        self.verify_trusted = verify_trusted
+        self.track_blocking = track_blocking if track_blocking is not None else metrics is not None
         self.interfaces = {
             # path: interface
         }
+        self.route_options = {
+            # path: dict(coalesce=bool, executor=str, limiter=RouteLimiter, cache_ttl=float, batch=Batch, memoize=bool, trusted=bool)
+        }
+        self.executors = Executors(thread_pool_size, process_pool_size)
+        # 各 route 以 inline 方式执行同步 interface 时占用调用者线程（一般就是 event loop）的时间，track_blocking 为 True 时才会记录
+        self.blocking_stats = {
+            # path: dict(count=int, total=float, max=float)
+        }
+        self._inflight_calls = {
+            # (path, arguments_key): dict(future=共享的 future, waiters=还在等待结果的调用者数量)
+        }
 
-    def register(self, path, parameters=None, bound=False):
+    def register(self, path, parameters=None, bound=False, coalesce=False, executor=INLINE, limiter=None,
+                 cache_ttl=None, batch=None, memoize=False, trusted=False):
         '''通过这个 decorator 注册 interface。
         可以传入一个普通函数，此 decorator 会自动将其转换为 interface；也可以传入一个已经生成好的 interface。
 
         :arg string path: interface 对应的 route path
         :arg parameters: 只在传入的是普通函数（也就是不是 interface）时有效, 指定其参数定义，如果不需要参数，则为 None。
         :arg parameters: 只在传入的是普通函数（也就是不是 interface）时有效，指明当前传入的是 function 还是 bound method。
+        :arg bool coalesce: 是否合并并发的相同调用。
+          开启后，通过 `Router.call()` 发起的、route path 与 arguments 都相同的并发调用会共享同一个正在执行中的 coroutine / future，
+          所有调用者都会得到同一个返回值（或同一个异常）；所有调用者都被 cancel 后，正在执行的调用也会被 cancel。
+          注意：被合并的调用只有第一个调用者的 context 会传给 interface，因此只应对结果不依赖 context 的 interface 开启此选项。
+          此功能只对返回 coroutine / future 的 interface 有效，且只在有正在运行的 event loop 时生效。
+        :arg string executor: interface 的执行方式，INLINE / THREAD / PROCESS，详见 `api_libs.execution`
+          注意：executor=PROCESS 时 context 无法跨进程传递，interface 接收到的 context 总是 None，
+          因此只应对不使用 context 的 interface 使用 PROCESS
+        :arg limiter: 限制此 route 的并发数与调用频率，详见 `api_libs.admission`。
+          指定了 limiter 的 route，通过 `Router.call()` 调用时总是返回一个 coroutine
+        :arg float cache_ttl: 若指定，通过 `Router.call()` 调用此 interface 的结果会被缓存这么多秒（需为 router 指定 cache）。
+          与 coalesce 一样，只应对结果不依赖 context 的 interface 开启此选项
+        :arg batch: 若指定，同一个请求中通过 `Context.call_async()` / `Context.gather()` 对此 route 并发发起的调用
+          会被合并成对批量 interface 的调用，
+          详见 `api_libs.batching`
+        :arg bool memoize: 声明此 interface 是纯函数（结果只取决于参数值，且没有副作用）。
+          开启后，同一个 context（也就是同一个请求）中通过 `Context.call()` 以相同参数值发起的调用只会执行一次，
+          之后的调用直接得到第一次调用的返回值。结果保存在 context 对象上，请求结束、context 被释放时一起释放
+        :arg bool trusted: 是否接受通过 `Context.call(..., trusted=True)` 发起的可信调用。
+          可信调用传入的是已经检查、格式化过的参数值（例如 Decimal、datetime 对象，或已经转义过的字符串），
+          interface 不再执行类型转换、trim、转义等会转换参数值的 rule，其他检查（required、min、max_len、regex 等）照常进行
+        :type batch: ``api_libs.batching.Batch`` or ``None``
+        :type limiter: ``api_libs.admission.RouteLimiter`` or ``None``
         :type parameters: list of ``api_libs.parameters.Parameter`` or ``None``
         '''
         if type(path) != str:
@@ -36,6 +105,8 @@ class Router:
             raise RouteRegisterFailed('route path 中不允许出现 "/" 字符(got: {})'.format(path))
         elif path in self.interfaces:
             raise RouteRegisterFailed('route path ({}) 已存在，不允许重复添加'.format(path))
+        elif executor not in EXECUTOR_TYPES:
+            raise RouteRegisterFailed('不支持的 executor 类型: {}'.format(executor))
 
         def wrapper(interface_or_fn):
             if hasattr(interface_or_fn, '__api_libs_interface'):
@@ -44,6 +115,9 @@ class Router:
                 interface = to_interface(parameters, bound)(interface_or_fn)
 
             self.interfaces[path] = interface
+            self.route_options[path] = dict(
+                coalesce=coalesce, executor=executor, limiter=limiter, cache_ttl=cache_ttl, batch=batch,
+                memoize=memoize, trusted=trusted)
             return interface
         return wrapper
 
@@ -54,9 +128,168 @@ class Router:
         :arg any context_data: 可以是初始化 context 对象所需的数据，也可以直接传入 context 实例。不同类型的 context 需要不同类型的数据
         :arg dict arguments: 传给 interface 的参数值'''
         context_instance = context_data if isinstance(context_data, self.context_cls) else self.context_cls(self, context_data)
-        return self._call_with_context(path, context_instance, arguments)
+        # route 的选项只取一次，沿着调用链传下去
+        options = self._options_of(path)
+        if self.cache is not None and options.get('cache_ttl') is not None:
+            return self._cached_call(path, options, context_instance, arguments)
+        return self._call_uncached(path, options, context_instance, arguments)
+
+    def _call_uncached(self, path, options, context_instance, arguments):
+        if options.get('coalesce'):
+            return self._coalesced_call(path, options, context_instance, arguments)
+        return self._admit(path, options, context_instance, arguments)
+
+    def _cached_call(self, path, options, context_instance, arguments):
+        '''优先从缓存中取得调用结果；没有缓存时发起调用，并把结果放入缓存'''
+        key = arguments_key(arguments)
+        if key is None:
+            return self._call_uncached(path, options, context_instance, arguments)
+        cache_key = path.lower() + '?' + key
+        ttl = options['cache_ttl']
+
+        # 缓存中同时记录 interface 的返回值是否是 coroutine / future，
+        # 使得命中缓存时，返回值的形式与实际调用时一致（调用者原本需要 await 的，依然需要 await）
+        cached = self.cache.get(cache_key)
+        if cached is not MISS:
+            is_async, value = cached
+            return _resolved(value) if is_async else value
+
+        ret_val = self._call_uncached(path, options, context_instance, arguments)
+        if not inspect.isawaitable(ret_val):
+            self._store_cache(cache_key, (False, ret_val), ttl)
+            return ret_val
+
+        async def store():
+            value = await ret_val
+            self._store_cache(cache_key, (True, value), ttl)
+            return value
+        return store()
+
+    def _store_cache(self, cache_key, value, ttl):
+        '''把调用结果放入缓存。缓存失败不应该让一个成功的调用变成失败，所以只记录日志'''
+        try:
+            self.cache.set(cache_key, value, ttl)
+        except Exception:
+            logger.exception('缓存调用结果失败（key: %s）', cache_key)
+
+    def _admit(self, path, options, context_instance, arguments):
+        '''若 route 指定了 limiter，则在限额允许时才执行调用'''
+        limiter = options.get('limiter')
+        if limiter is None:
+            return self._dispatch(path, options, context_instance, arguments)
+        self._check_call(path, context_instance)
+        return limiter.run(
+            lambda: self._dispatch(path, options, context_instance, arguments),
+            deadline=getattr(context_instance, 'deadline', None))
+
+    def _dispatch(self, path, options, context_instance, arguments):
+        '''按照 route 的 executor 选项，在当前线程、线程池或进程池中调用 interface'''
+        executor = options.get('executor', INLINE)
+        if executor != INLINE:
+            self._check_call(path, context_instance)
+            ret_val = self.executors.submit(executor, self, path.lower(), context_instance, arguments)
+            if self.metrics is not None and executor == PROCESS:
+                # 在进程池中执行的 interface 不会经过 _call_with_context()，在这里记录
+                ret_val = self.metrics.track_async(path.lower(), time.perf_counter(), ret_val)
+            return ret_val
+
+        if not self.track_blocking:
+            return self._call_with_context(path, context_instance, arguments)
+        started = time.perf_counter()
+        ret_val = self._call_with_context(path, context_instance, arguments)
+        if not inspect.isawaitable(ret_val):
+            record_blocking(self.blocking_stats, path.lower(), started)
+        return ret_val
+
+    def get_route_option(self, path, name, default=None):
+        '''取得注册 interface 时为它指定的选项值；path 不存在或未指定此选项时返回 default'''
+        return self._options_of(path).get(name, default)
+
+    def _options_of(self, path):
+        '''取得注册 interface 时为它指定的全部选项；path 不存在时返回空 dict（不要修改它）'''
+        if type(path) != str:
+            return _NO_OPTIONS
+        options = self.route_options.get(path)
+        if options is None:
+            # 大部分调用使用的本来就是小写的 route path，先直接查找，找不到时再转换成小写
+            options = self.route_options.get(path.lower(), _NO_OPTIONS)
+        return options
+
+    def _coalesced_call(self, path, options, context_instance, arguments):
+        '''若已经有 route path 和 arguments 都相同的调用正在执行，直接共享它的 future；否则发起新的调用'''
+        key = (path.lower(), arguments_key(arguments))
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            key = None
+        if key is None or key[1] is None:
+            return self._admit(path, options, context_instance, arguments)
+
+        inflight = self._inflight_calls.get(key)
+        if inflight is None:
+            ret_val = self._admit(path, options, context_instance, arguments)
+            if not inspect.isawaitable(ret_val):
+                return ret_val
+
+            inflight = self._inflight_calls[key] = dict(future=asyncio.ensure_future(ret_val), waiters=0)
+
+            def on_done(done_future):
+                if self._inflight_calls.get(key) is inflight:
+                    del self._inflight_calls[key]
+            inflight['future'].add_done_callback(on_done)
+
+        return self._wait_coalesced(inflight)
+
+    def _wait_coalesced(self, inflight):
+        '''为一个调用者创建等待共享调用结果的 future。
+        某一个调用者被 cancel 时，不会连带 cancel 其他调用者共享的 future；最后一个调用者也被 cancel 时，才 cancel 共享的 future'''
+        future = inflight['future']
+        waiter = future.get_loop().create_future()
+        inflight['waiters'] += 1
+
+        def on_result(_):
+            if waiter.done():
+                return
+            if future.cancelled():
+                waiter.cancel()
+            elif future.exception() is not None:
+                waiter.set_exception(future.exception())
+            else:
+                waiter.set_result(future.result())
+
+        def on_waiter_done(_):
+            inflight['waiters'] -= 1
+            if waiter.cancelled() and inflight['waiters'] == 0 and not future.done():
+                future.cancel()
+
+        future.add_done_callback(on_result)
+        waiter.add_done_callback(on_waiter_done)
+        return waiter
 
     def _call_with_context(self, path, context_instance, arguments={}):
+        if current_span() is not None:
+            # 当前请求正在被追踪（见 `api_libs.tracing`），为此次调用创建一个 span
+            return trace_call('route', self.route_name(path), self._call_with_metrics, path, context_instance, arguments)
+        return self._call_with_metrics(path, context_instance, arguments)
+
+    def _call_with_metrics(self, path, context_instance, arguments):
+        if self.metrics is not None:
+            return self.metrics.track(self.route_name(path), self._invoke, path, context_instance, arguments)
+        return self._invoke(path, context_instance, arguments)
+
+    def _invoke(self, path, context_instance, arguments):
+        path = self._check_call(path, context_instance)
+        if current_timer() is not None or validation_profiler.enabled:
+            return call_in_route(path, self.interfaces[path], arguments=arguments, context=context_instance)
+        return self.interfaces[path](arguments=arguments, context=context_instance)
+
+    def route_name(self, path):
+        '''返回记录统计数据时所用的 route 名称：已注册的 route 为小写的 route path，否则为 UNKNOWN_ROUTE'''
+        route = path.lower() if type(path) == str else None
+        return route if route in self.interfaces else UNKNOWN_ROUTE
+
+    def _check_call(self, path, context_instance):
+        '''检查 route path 和 context 是否合法，返回转换成小写的 route path'''
         if type(path) != str:
             raise RouteCallFailed('route path ({}) 必须是字符串'.format(path))
 
@@ -66,7 +299,14 @@ class Router:
             raise RouteCallFailed('context 类型错误（expect: {}, got: {}）'.format(self.context_cls, context_instance))
         if path not in self.interfaces:
             raise RouteCallFailed('route "{}" 不存在'.format(path))
-        return self.interfaces[path](arguments=arguments, context=context_instance)
+        return path
+
+    def admission_stats(self):
+        '''返回各个指定了 limiter 的 route 当前的并发数、排队数和拒绝次数'''
+        return {
+            path: options['limiter'].stats()
+            for path, options in self.route_options.items() if options.get('limiter') is not None
+        }
 
     def change_context(self, context_cls):
         '''为当前 router 指定一个新的 context 类型'''
@@ -74,16 +314,211 @@ class Router:
 
 
 class Context:
-    '''存放 interface 被调用时的上下文信息，以及提供一些辅助方法'''
+    '''存放 interface 被调用时的上下文信息，以及提供一些辅助方法
+
+    Attributes:
+
+    * deadline: 此次调用的截止时间（``time.monotonic()`` 的值），None 代表没有截止时间。
+      因为嵌套调用共享同一个 context 对象，所以截止时间对通过 `Context.call()` 发起的嵌套调用同样有效。
+    '''
+    # 定义成 class attribute，这样即使子类的 __init__ 没有调用 super().__init__()，也能正常读取
+    deadline = None
+    # 指定了 batch 选项的各 route 的 BatchLoader，在第一次用到时才创建
+    _batch_loaders = None
+    # 指定了 memoize 选项的 route 在此 context 中的调用结果，(path, arguments_key): 返回值 / future
+    _memo = None
+
     def __init__(self, router, context_data=None):
         self.router = router
         self.data = context_data
 
-    def call(self, route_path, arguments={}):
+    def set_timeout(self, seconds):
+        '''把截止时间设置为从现在开始的 seconds 秒之后'''
+        self.deadline = time.monotonic() + seconds
+
+    def remaining(self):
+        '''距离截止时间还剩多少秒（可能为负数），没有截止时间时返回 None。
+        可以用它来为下游请求设置超时时间'''
+        return self.deadline - time.monotonic() if self.deadline is not None else None
+
+    def check_deadline(self):
+        '''若已超过截止时间，抛出 DeadlineExceeded'''
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise DeadlineExceeded('已超过调用的截止时间')
+
+    def call(self, route_path, arguments={}, trusted=False):
         '''调用同一个 router 下的另一个 interface。
-        新调用的 interface 会接收到和当前一样的 context 对象。'''
+        新调用的 interface 会接收到和当前一样的 context 对象。
+        若已超过截止时间，不会再发起调用，而是抛出 DeadlineExceeded。
+
+        被调用的 route 指定了 memoize 选项时，相同参数值的调用在此 context 中只会执行一次。
+        此方法发起的调用不会被合并成批量调用（见 `api_libs.batching`），需要合并时使用 call_async() 或 gather()。
+
+        :arg bool trusted: arguments 中是否是已经检查、格式化过的参数值（例如当前 interface 的 args 中的值）。
+          为 True 时，被调用的 interface 不会再对它们执行类型转换、转义等 rule（见 `Router.register()` 的 trusted 选项），
+          此时调用不会被合并成批量调用'''
+        return self._start_call(route_path, arguments, trusted, False)
+
+    def _start_call(self, route_path, arguments, trusted, allow_batch):
+        self.check_deadline()
+        options = self.router._options_of(route_path)
+        if trusted:
+            if not options.get('trusted'):
+                raise RouteCallFailed('route "{}" 不接受 trusted 调用'.format(route_path))
+            arguments = TrustedArguments(arguments, verify=self.router.verify_trusted)
+        elif allow_batch and options.get('batch') is not None:
+            # BatchLoader 本身已经会在 context 中合并相同的调用，不需要再经过 memoize
+            ret_val = self._batched_call(route_path, options['batch'], arguments)
+            if ret_val is not None:
+                return ret_val
+        if options.get('memoize'):
+            return self._memoized_call(route_path, arguments)
         return self.router._call_with_context(route_path, self, arguments)
 
+    def _memoized_call(self, route_path, arguments):
+        '''优先返回此 context 中相同调用的结果；没有时发起调用并记录结果。
+        调用失败时不记录，之后的调用会重新执行'''
+        key = arguments_key(arguments)
+        if key is None:
+            return self.router._call_with_context(route_path, self, arguments)
+        key = (route_path.lower(), key)
+        if self._memo is None:
+            self._memo = {}
+        if key in self._memo:
+            ret_val = self._memo[key]
+            return asyncio.shield(ret_val) if isinstance(ret_val, asyncio.Future) else ret_val
+
+        ret_val = self.router._call_with_context(route_path, self, arguments)
+        if not inspect.isawaitable(ret_val):
+            self._memo[key] = ret_val
+            return ret_val
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # 没有正在运行的 event loop 时无法共享 coroutine，不记录结果
+            return ret_val
+
+        future = self._memo[key] = asyncio.ensure_future(ret_val)
+
+        def on_done(done_future):
+            if (done_future.cancelled() or done_future.exception() is not None) and self._memo.get(key) is done_future:
+                del self._memo[key]
+        future.add_done_callback(on_done)
+        # 用 shield 包装，使某一个调用者被 cancel 时，不会连带 cancel 其他调用者共享的 future
+        return asyncio.shield(future)
+
+    def end_request(self):
+        '''清除只在一次请求中有效的状态（memoize 记录的结果、batch 合并调用的记录），并取消还没完成的批量调用。
+        一个 context 被多次请求共用时（例如 WebSocket、SocketAdapter 的同一个连接上的各条消息），adapter 会在每次请求结束后调用它'''
+        self._memo = None
+        if self._batch_loaders is not None:
+            for loader in self._batch_loaders.values():
+                loader.cancel()
+        self._batch_loaders = None
+
+    def clear_memo(self, route_path=None):
+        '''清除此 context 中记录的 memoize 调用结果（例如在修改了数据之后）。route_path 为 None 时清除全部'''
+        if self._memo is None:
+            return
+        if route_path is None:
+            self._memo.clear()
+        else:
+            for key in [key for key in self._memo if key[0] == route_path.lower()]:
+                del self._memo[key]
+
+    def _batched_call(self, route_path, batch, arguments):
+        '''把调用加入批量调用中，返回可以 await 的结果；无法合并时（没有正在运行的 event loop、缺少 key 参数等）返回 None'''
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+        key = arguments.get(batch.key)
+        rest_arguments = {name: value for name, value in arguments.items() if name != batch.key}
+        cache_key, group_key = arguments_key(arguments), arguments_key(rest_arguments)
+        if key is None or isinstance(key, (list, dict)) or cache_key is None or group_key is None:
+            return None
+
+        # 先按原 route 的参数定义进行检查，使不合法的调用与未合并时一样抛出异常
+        path = self.router._check_call(route_path, self)
+        parameters = getattr(self.router.interfaces[path], '__api_libs_parameters', None)
+        if parameters is not None:
+            Arguments(parameters, arguments)
+
+        if self._batch_loaders is None:
+            self._batch_loaders = {}
+        loader = self._batch_loaders.get(path)
+        if loader is None:
+            loader = self._batch_loaders[path] = BatchLoader(self, batch)
+        return loader.load(cache_key, key, group_key, rest_arguments)
+
+    async def call_async(self, route_path, arguments={}, trusted=False):
+        '''与 call() 相同，但总是返回一个 coroutine：无论被调用的 interface 是否是 async 的，都可以用 await 取得它的返回值。
+        被调用的 route 指定了 batch 选项时，并发发起的调用会被合并成批量调用（见 `api_libs.batching`）'''
+        ret_val = self._start_call(route_path, arguments, trusted, True)
+        if inspect.isawaitable(ret_val):
+            ret_val = await ret_val
+        return ret_val
+
+    async def gather(self, calls, max_concurrency=None, return_exceptions=False):
+        '''在 event loop 上并发地调用多个 interface，按 calls 的顺序返回它们的结果。
+        各调用共享当前的 context 对象，也共享它的截止时间
+
+        :arg calls: [(route_path, arguments), ...]，不需要参数的调用也可以只写 route_path
+        :arg int max_concurrency: 同时执行的调用数上限，None 代表不限制
+        :arg bool return_exceptions: 为 False 时，任一调用失败都会 cancel 其他尚未完成的调用，并抛出那个异常；
+          为 True 时，失败的调用会以异常对象的形式出现在结果中，不影响其他调用
+
+        超过截止时间时，尚未完成的调用会被 cancel，它们的结果为 DeadlineExceeded（return_exceptions=False 时直接抛出）。
+        注意：同步 interface 会直接在 event loop 中执行，期间其他调用无法推进'''
+        semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+        async def run(route_path, arguments={}):
+            if semaphore is None:
+                return await self.call_async(route_path, arguments)
+            async with semaphore:
+                return await self.call_async(route_path, arguments)
+
+        tasks = [asyncio.ensure_future(run(call) if isinstance(call, str) else run(*call)) for call in calls]
+        if not tasks:
+            return []
+        try:
+            remaining = self.remaining()
+            done, pending = await asyncio.wait(
+                tasks, timeout=max(remaining, 0) if remaining is not None else None,
+                return_when=asyncio.ALL_COMPLETED if return_exceptions else asyncio.FIRST_EXCEPTION)
+        finally:
+            # 超时、某个调用失败或 gather 本身被 cancel 时，结束其余的调用
+            unfinished = [task for task in tasks if not task.done()]
+            for task in unfinished:
+                task.cancel()
+            if unfinished:
+                await asyncio.wait(unfinished)
+
+        errors = [
+            DeadlineExceeded('已超过调用的截止时间') if task in pending
+            else asyncio.CancelledError() if task.cancelled() else task.exception()
+            for task in tasks
+        ]
+        if not return_exceptions:
+            # 优先抛出调用本身的异常：超时的调用只有在没有其他调用失败时才会被报告
+            for task, error in sorted(zip(tasks, errors), key=lambda item: item[0] in pending):
+                if error is not None:
+                    raise error
+        return [error if error is not None else task.result() for task, error in zip(tasks, errors)]
+
+
+async def _resolved(value):
+    return value
+
+
+def arguments_key(arguments):
+    '''把 arguments 转换成一个规范化的字符串（key 排序后的 JSON），用于判断两次调用的参数值是否相同。
+    arguments 中含有无法转换成 JSON 的值时，返回 None'''
+    try:
+        return json.dumps(arguments, sort_keys=True, separators=(',', ':'))
+    except (TypeError, ValueError):
+        return None
+
 
 class RouteRegisterFailed(APILibError):
     pass
@@ -91,3 +526,7 @@ class RouteRegisterFailed(APILibError):
 
 class RouteCallFailed(APILibError):
     pass
+
+
+class DeadlineExceeded(APILibError):
+    pass
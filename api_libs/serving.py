@@ -0,0 +1,209 @@
+'''
+以多进程的方式运行 TornadoAdapter 提供的服务。
+
+    from api_libs.serving import serve
+
+    serve(adapter, port=8888, processes=4, modules=['myapp.interfaces'])
+
+* processes > 1 时，会 fork 出多个 worker 进程共同处理请求。
+  默认由父进程绑定端口后再 fork，各 worker 共享同一个 listening socket；
+  指定 reuse_port=True 时，改为由各 worker 分别以 SO_REUSEPORT 绑定端口，由内核在它们之间分配连接。
+* 每个 worker 在开始接收请求前都会先进行 warmup：提前编译各 interface 的参数检查规则（见 `Parameter.warmup()`）。
+  modules 中列出的模块（一般是定义 interface 的模块）会在 fork 之前被 import，各 worker 共享这部分内存。
+* 收到 SIGTERM / SIGINT 时，worker 会停止接收新连接，等待正在处理中的请求完成（最多 shutdown_timeout 秒）后再退出。
+  父进程会把信号转发给所有 worker，并等待它们退出。
+* 指定 use_uvloop=True 时，各 worker 使用 uvloop 作为 event loop（需安装 uvloop）。
+'''
+import asyncio
+import importlib
+import logging
+import os
+import signal
+import time
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+from tornado.web import Application
+from . import APILibError
+from .adapters.tornado_adapter import TornadoAdapter
+
+__all__ = ['serve', 'warmup']
+
+logger = logging.getLogger(__name__)
+
+
+def warmup(router, modules=()):
+    '''import 指定的模块，并对 router 中所有 interface 的参数定义进行预处理'''
+    for module_name in modules:
+        importlib.import_module(module_name)
+    for interface in router.interfaces.values():
+        for param in getattr(interface, '__api_libs_parameters', None) or []:
+            param.warmup()
+
+
+def serve(target, port, address=None, url_pattern=r'/api/(.+)', processes=1, reuse_port=False,
+          modules=(), use_uvloop=False, shutdown_timeout=10, handlers=(), app_settings=None, on_worker_start=None):
+    '''启动服务，直到收到 SIGTERM / SIGINT 并完成关闭流程后才返回
+
+    :arg target: 要提供服务的 `TornadoAdapter`，或一个 Router（此时会自动为它创建一个 TornadoAdapter）
+    :arg int port: 监听的端口
+    :arg string address: 监听的地址，None 代表所有地址
+    :arg string url_pattern: adapter.RequestHandler 对应的 url pattern，必须有且只有一个 regex group
+    :arg int processes: worker 进程数。为 0 时使用 CPU 核数；为 1 时不 fork，直接在当前进程中提供服务
+    :arg bool reuse_port: 是否由各 worker 分别以 SO_REUSEPORT 绑定端口
+    :arg modules: 需要在 fork 之前 import 的模块名
+    :arg bool use_uvloop: 是否使用 uvloop
+    :arg float shutdown_timeout: 关闭服务时，最多等待正在处理中的请求多少秒
+    :arg handlers: 额外加入 tornado application 的 handler
+    :arg dict app_settings: 传给 tornado Application 的 settings
+    :arg on_worker_start: 每个 worker 在 warmup 之后、开始接收请求之前调用的函数，它会接收到 adapter 和 worker 序号两个参数
+    '''
+    adapter = target if isinstance(target, TornadoAdapter) else TornadoAdapter(target)
+    if processes == 0:
+        processes = os.cpu_count() or 1
+
+    for module_name in modules:
+        importlib.import_module(module_name)
+
+    options = dict(
+        adapter=adapter, port=port, address=address, url_pattern=url_pattern,
+        sockets=None if reuse_port and processes > 1 else bind_sockets(port, address),
+        use_uvloop=use_uvloop, shutdown_timeout=shutdown_timeout, handlers=list(handlers),
+        app_settings=app_settings or {}, on_worker_start=on_worker_start)
+
+    if processes == 1:
+        run_worker(0, **options)
+    else:
+        Supervisor(processes, options).run()
+
+
+class Supervisor:
+    '''在父进程中管理各 worker 进程：fork 出 worker，在 worker 意外退出时重新启动它，并把关闭信号转发给 worker'''
+    def __init__(self, processes, worker_options, max_restarts=100):
+        self.processes = processes
+        self.worker_options = worker_options
+        self.max_restarts = max_restarts
+        self.children = {
+            # pid: worker 序号
+        }
+        self.stopping = False
+
+    def run(self):
+        for worker_id in range(self.processes):
+            self.start_worker(worker_id)
+
+        signal.signal(signal.SIGTERM, self.on_signal)
+        signal.signal(signal.SIGINT, self.on_signal)
+
+        restarts = 0
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            worker_id = self.children.pop(pid, None)
+            if worker_id is None or self.stopping:
+                continue
+            logger.warning('worker %d (pid %d) 意外退出（%s）', worker_id, pid, describe_exit_status(status))
+            restarts += 1
+            if restarts > self.max_restarts:
+                # 先结束其余的 worker，不要让它们变成无人管理的孤儿进程
+                self.terminate_workers()
+                raise ServeFailed('worker 重启次数过多')
+            self.start_worker(worker_id)
+
+    def start_worker(self, worker_id):
+        pid = os.fork()
+        if pid == 0:
+            # 子进程继承了父进程的信号处理函数和 children（重启的 worker 是在父进程设置好信号处理函数之后才 fork 的）。
+            # 在 worker 的 event loop 设置好自己的信号处理函数之前，收到的信号不应该被转发给其他 worker
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            self.children = {}
+            exit_code = 0
+            try:
+                run_worker(worker_id, **self.worker_options)
+            except BaseException:
+                logger.exception('worker %d 运行失败', worker_id)
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+        self.children[pid] = worker_id
+
+    def on_signal(self, signum, frame):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def terminate_workers(self):
+        '''向所有 worker 发送 SIGTERM，并等待它们退出'''
+        self.on_signal(signal.SIGTERM, None)
+        for pid in list(self.children):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self.children = {}
+
+
+def describe_exit_status(status):
+    '''把 os.wait() 返回的 status 转换成便于阅读的描述'''
+    if os.WIFSIGNALED(status):
+        return 'signal {}'.format(os.WTERMSIG(status))
+    if os.WIFEXITED(status):
+        return 'exit code {}'.format(os.WEXITSTATUS(status))
+    return 'status {}'.format(status)
+
+
+def run_worker(worker_id, adapter, use_uvloop, **options):
+    if use_uvloop:
+        try:
+            import uvloop
+        except ImportError:
+            raise ServeFailed('use_uvloop=True 需要先安装 uvloop')
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    else:
+        # fork 出的子进程可能继承了父进程中的 event loop policy 状态，这里重新设置一个干净的
+        asyncio.set_event_loop_policy(None)
+    asyncio.run(worker_main(worker_id, adapter, **options))
+
+
+async def worker_main(worker_id, adapter, port, address, url_pattern, sockets, shutdown_timeout,
+                      handlers, app_settings, on_worker_start):
+    warmup(adapter.router)
+    if on_worker_start is not None:
+        on_worker_start(adapter, worker_id)
+
+    app = Application(handlers + [(url_pattern, adapter.RequestHandler)], **app_settings)
+    server = HTTPServer(app)
+    if sockets is None:
+        sockets = bind_sockets(port, address, reuse_port=True)
+    server.add_sockets(sockets)
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in [signal.SIGTERM, signal.SIGINT]:
+        loop.add_signal_handler(signum, stop_event.set)
+    await stop_event.wait()
+
+    # 停止接收新连接，等待正在处理中的请求完成
+    server.stop()
+    deadline = time.monotonic() + shutdown_timeout
+    while adapter.in_flight > 0 and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    if adapter.in_flight > 0:
+        logger.warning('关闭服务时仍有 %d 个请求未处理完', adapter.in_flight)
+
+    try:
+        await asyncio.wait_for(server.close_all_connections(), max(deadline - time.monotonic(), 0.1))
+    except asyncio.TimeoutError:
+        pass
+    adapter.router.executors.shutdown(wait=False)
+
+
+class ServeFailed(APILibError):
+    pass
@@ -0,0 +1,205 @@
+'''
+慢请求日志：记录耗时超过阈值的请求，便于事后分析。
+
+    slow_log = SlowRequestLog(threshold=0.5, route_thresholds={'report.export': 5}, path='/var/log/api-slow.jsonl',
+                              redact_keys=['password', 'token'], max_per_second=5)
+    adapter = TornadoAdapter(router, slow_log=slow_log)
+
+每条记录是一个 JSON object：
+
+    {"time": 1500000000.123, "route": "item.detail", "duration_ms": 812.3, "status": 200, "response_size": 5120,
+     "arguments": {"id": 1, "keyword": "abc...(300 chars)"},
+     "phases": {"parse": 0.1, "validate": 0.3, "execute": 810.2, "serialize": 1.2},
+     "nested": {"item.stock": {"validate": 0.1, "execute": 650.0}},
+     "dropped": 0}
+
+* arguments 是经过 redact 和截断的摘要：redact_keys 中的 key 的值被替换为 "***"，过长的字符串、list、dict 会被截断，
+  整个摘要序列化后不超过 max_arguments_length 个字符
+* phases 是此次请求调用的 route 各阶段的耗时（毫秒），nested 是通过 `Context.call()` 发起的嵌套调用的耗时
+* 日志在后台线程中写入，不会阻塞 event loop。每秒最多记录 max_per_second 条，
+  超出的部分以及来不及写入的部分会被丢弃，丢弃的条数会记在下一条日志的 dropped 中。
+  这样在故障期间大量请求变慢时，写日志本身不会让情况变得更糟
+'''
+import json
+import logging
+import queue
+import threading
+import time
+
+__all__ = ['SlowRequestLog', 'summarize_arguments']
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class SlowRequestLog:
+    def __init__(self, threshold=1.0, route_thresholds=None, path=None, redact_keys=(), max_per_second=10,
+                 max_arguments_length=1000, max_string_length=100, max_items=10, queue_size=1000):
+        '''
+        :arg float threshold: 耗时超过多少秒的请求会被记录
+        :arg dict route_thresholds: 为个别 route 单独指定阈值，dict(route: seconds)
+        :arg string path: 若指定，日志以 JSON Lines 的格式追加写入此文件；否则以 WARNING 级别写入
+          名为 ``api_libs.slow_log`` 的 logger
+        :arg redact_keys: arguments（包括嵌套的 dict）中，这些 key 的值会被替换成 "***"，不区分大小写
+        :arg float max_per_second: 每秒最多记录多少条
+        :arg int max_arguments_length: arguments 摘要序列化成 JSON 后的最大长度
+        :arg int max_string_length: arguments 中的字符串最多保留多少个字符
+        :arg int max_items: arguments 中的 list / dict 最多保留多少项
+        :arg int queue_size: 等待写入的日志最多有多少条
+        '''
+        self.threshold = threshold
+        self.route_thresholds = {route.lower(): seconds for route, seconds in (route_thresholds or {}).items()}
+        self.path = path
+        self.redact_keys = set(key.lower() for key in redact_keys)
+        self.max_per_second = max_per_second
+        self.max_arguments_length = max_arguments_length
+        self.max_string_length = max_string_length
+        self.max_items = max_items
+        self.dropped = 0
+        self._queue = queue.Queue(queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        # 令牌桶：最多积累 max_per_second 个令牌
+        self._tokens = max_per_second
+        self._refilled = time.monotonic()
+
+    def get_threshold(self, route):
+        return self.route_thresholds.get(route, self.threshold)
+
+    def observe(self, route, duration, timer=None, arguments=None, status=None, response_size=None):
+        '''请求处理完毕后调用，耗时超过阈值时记录下来
+
+        :arg string route: route 名称
+        :arg float duration: 请求的总耗时（秒）
+        :arg timer: 记录了此次请求各阶段耗时的 `api_libs.timing.PhaseTimer`'''
+        if duration < self.get_threshold(route):
+            return False
+        # 先进行限流，被丢弃的请求不需要花时间整理日志内容
+        if not self._acquire():
+            self._drop()
+            return False
+        entry = self.build_entry(route, duration, timer, arguments, status, response_size)
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self._drop()
+            return False
+        self._ensure_thread()
+        return True
+
+    def build_entry(self, route, duration, timer, arguments, status, response_size):
+        phases = {}
+        nested = {}
+        for phase_route, phase, seconds in (timer.totals() if timer is not None else []):
+            target = phases if phase_route == route else nested.setdefault(phase_route, {})
+            target[phase] = round(seconds * 1000, 3)
+        with self._lock:
+            dropped, self.dropped = self.dropped, 0
+        return dict(
+            time=time.time(),
+            route=route,
+            duration_ms=round(duration * 1000, 3),
+            status=status,
+            response_size=response_size,
+            arguments=summarize_arguments(
+                arguments, self.redact_keys, self.max_arguments_length, self.max_string_length, self.max_items),
+            phases=phases,
+            nested=nested,
+            dropped=dropped,
+        )
+
+    def _acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.max_per_second, self._tokens + (now - self._refilled) * self.max_per_second)
+            self._refilled = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def _drop(self):
+        with self._lock:
+            self.dropped += 1
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='api-libs-slow-log', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        f = open(self.path, 'a') if self.path is not None else None
+        try:
+            while True:
+                entry = self._queue.get()
+                try:
+                    if entry is _STOP:
+                        return
+                    line = json.dumps(entry, ensure_ascii=False, default=str)
+                    if f is not None:
+                        f.write(line + '\n')
+                        if self._queue.empty():
+                            f.flush()
+                    else:
+                        logger.warning(line)
+                except Exception:
+                    logger.exception('写入慢请求日志失败')
+                finally:
+                    self._queue.task_done()
+        finally:
+            if f is not None:
+                f.close()
+
+    def flush(self):
+        '''等待目前已提交的日志全部写入'''
+        self._queue.join()
+
+    def close(self):
+        '''写入剩余的日志，并结束后台线程'''
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+
+def summarize_arguments(arguments, redact_keys=(), max_length=1000, max_string_length=100, max_items=10):
+    '''生成 arguments 的摘要：redact 掉敏感的值、截断过长的内容，使其序列化成 JSON 后不超过 max_length 个字符。
+    整体仍然过长时，返回截断后的 JSON 字符串'''
+    summary = _summarize(arguments, set(key.lower() for key in redact_keys), max_string_length, max_items, 0)
+    raw = json.dumps(summary, ensure_ascii=False, default=str)
+    if len(raw) <= max_length:
+        return summary
+    return raw[:max_length] + '...({} chars)'.format(len(raw))
+
+
+def _summarize(value, redact_keys, max_string_length, max_items, depth):
+    if isinstance(value, str):
+        if len(value) > max_string_length:
+            return value[:max_string_length] + '...({} chars)'.format(len(value))
+        return value
+    if isinstance(value, dict):
+        if depth >= 5:
+            return '{...}'
+        summary = {}
+        for i, (key, item) in enumerate(value.items()):
+            if i >= max_items:
+                summary['...'] = '{} more'.format(len(value) - max_items)
+                break
+            if isinstance(key, str) and key.lower() in redact_keys:
+                summary[key] = '***'
+            else:
+                summary[key] = _summarize(item, redact_keys, max_string_length, max_items, depth + 1)
+        return summary
+    if isinstance(value, (list, tuple)):
+        if depth >= 5:
+            return ['...']
+        summary = [_summarize(item, redact_keys, max_string_length, max_items, depth + 1) for item in value[:max_items]]
+        if len(value) > max_items:
+            summary.append('...({} more)'.format(len(value) - max_items))
+        return summary
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    return repr(value)[:max_string_length]
@@ -0,0 +1,78 @@
+from unittest import TestCase
+import asyncio
+import time
+from ..route import Router
+from ..admission import RouteLimiter, TokenBucket, Overloaded, RateLimited
+
+
+class TokenBucketTestCase(TestCase):
+    def test_acquire(self):
+        bucket = TokenBucket(rate=100, burst=2)
+        self.assertTrue(bucket.try_acquire())
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+        time.sleep(0.02)
+        self.assertTrue(bucket.try_acquire())
+
+
+class RouteLimiterTestCase(TestCase):
+    def setUp(self):
+        self.router = Router()
+        self.running = 0
+        self.max_running = 0
+
+    def register(self, limiter):
+        @self.router.register('test.limited', limiter=limiter)
+        async def fn(context):
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            await asyncio.sleep(0.02)
+            self.running -= 1
+            return 'done'
+
+    def gather(self, count):
+        async def run():
+            return await asyncio.gather(
+                *[self.router.call('test.limited') for _ in range(count)], return_exceptions=True)
+        return asyncio.run(run())
+
+    def test_concurrency(self):
+        limiter = RouteLimiter(max_concurrency=2, max_queue=10)
+        self.register(limiter)
+        self.assertEqual(self.gather(6), ['done'] * 6)
+        self.assertEqual(self.max_running, 2)
+        self.assertEqual(limiter.stats(), dict(
+            in_flight=0, queued=0, admitted=6, rejected_overloaded=0, rejected_rate_limited=0))
+
+    def test_queue_full(self):
+        limiter = RouteLimiter(max_concurrency=2, max_queue=1)
+        self.register(limiter)
+        results = self.gather(5)
+        self.assertEqual(results[:3], ['done'] * 3)
+        for result in results[3:]:
+            self.assertIsInstance(result, Overloaded)
+        self.assertEqual(limiter.rejected_overloaded, 2)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_queue_timeout(self):
+        limiter = RouteLimiter(max_concurrency=1, max_queue=10, queue_timeout=0.01)
+        self.register(limiter)
+        results = self.gather(3)
+        self.assertEqual(results[0], 'done')
+        self.assertIsInstance(results[1], Overloaded)
+        self.assertEqual(limiter.stats()['queued'], 0)
+        self.assertEqual(limiter.in_flight, 0)
+
+        # 已知平均耗时后，预计等不到执行机会的调用会被立即拒绝
+        started = time.monotonic()
+        results = self.gather(3)
+        self.assertIsInstance(results[1], Overloaded)
+        self.assertLess(time.monotonic() - started, 0.04)
+
+    def test_rate_limit(self):
+        limiter = RouteLimiter(rate=1, burst=2)
+        self.register(limiter)
+        results = self.gather(3)
+        self.assertEqual(results[:2], ['done'] * 2)
+        self.assertIsInstance(results[2], RateLimited)
+        self.assertEqual(self.router.admission_stats()['test.limited']['rejected_rate_limited'], 1)
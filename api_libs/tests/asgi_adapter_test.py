@@ -0,0 +1,142 @@
+from unittest import TestCase
+import asyncio
+import json
+import urllib.parse
+from api_libs.adapters.asgi_adapter import ASGIAdapter, ASGIRequest
+from api_libs.admission import RouteLimiter
+from api_libs.parameters import Int, Float
+
+
+def call_app(app, path, method='GET', body=b'', headers=None, query_string=''):
+    '''在当前进程中直接调用 ASGI application，不经过网络'''
+    scope = {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'query_string': query_string.encode(),
+        'headers': [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+    }
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    headers = {name.decode(): value.decode() for name, value in sent[0]['headers']}
+    return sent[0]['status'], headers, sent[1]['body']
+
+
+class ASGIAdapterTestCase(TestCase):
+    def setUp(self):
+        self.adapter = ASGIAdapter(path_prefix='/api/')
+
+    def fetch(self, path, **kwargs):
+        status, headers, body = call_app(self.adapter, path, **kwargs)
+        self.status = status
+        self.headers = headers
+        return json.loads(body.decode()) if status == 200 else body.decode()
+
+    def test_request_adapte(self):
+        @self.adapter.router.register('test.path')
+        def fn(context):
+            self.assertIsInstance(context.request, ASGIRequest)
+            return dict(data=[1, 2, 3])
+
+        self.assertEqual(self.fetch('/api/test.path'), dict(data=[1, 2, 3]))
+        self.assertEqual(self.headers['Content-Type'], 'application/json')
+
+        self.fetch('/api/not.exists')
+        self.assertEqual(self.status, 400)
+        self.fetch('/other/test.path')
+        self.assertEqual(self.status, 404)
+        self.fetch('/api/test.path', method='PUT')
+        self.assertEqual(self.status, 405)
+
+    def test_arguments_parse(self):
+        @self.adapter.router.register('test.path', [Int('argx'), Int('argy', default=5)])
+        def fn(context, args):
+            return {'data': args.argx * args.argy}
+
+        headers = {'Content-Type': 'application/json'}
+
+        # arguments in post body
+        self.assertEqual(
+            self.fetch('/api/test.path', method='POST', body=b'{"argx": 20}', headers=headers), {'data': 100})
+
+        # invalid binary bytes in post body
+        self.assertIn('arguments 中包含非法字符',
+                      self.fetch('/api/test.path', method='POST', body=b'abc\x89', headers=headers))
+        self.assertEqual(self.status, 400)
+
+        # arguments in post form data
+        body = urllib.parse.urlencode(dict(arguments='{"argx": 30}')).encode()
+        self.assertEqual(
+            self.fetch('/api/test.path', method='POST', body=body,
+                       headers={'Content-Type': 'application/x-www-form-urlencoded'}),
+            {'data': 150})
+
+        # arguments in url query string
+        self.assertEqual(self.fetch('/api/test.path', query_string='arguments={"argx":40}'), {'data': 200})
+
+        # 如果从多种渠道给出 arguments，只有其中一种会被使用
+        self.assertEqual(
+            self.fetch('/api/test.path', method='POST', body=b'{"argx": 1, "argy": 2}',
+                       query_string='arguments={"argx":50}', headers=headers),
+            {'data': 250})
+
+        self.fetch('/api/test.path', query_string='arguments=[1]')
+        self.assertEqual(self.status, 400)
+
+        # 参数值不合法
+        self.fetch('/api/test.path', query_string='arguments={"argx":"x"}')
+        self.assertEqual(self.status, 400)
+        self.fetch('/api/test.path')
+        self.assertEqual(self.status, 400)
+
+    def test_coroutine(self):
+        @self.adapter.router.register('test.async')
+        async def fn(context):
+            await asyncio.sleep(0)
+            return 'async result'
+
+        self.assertEqual(self.fetch('/api/test.async'), 'async result')
+
+    def test_custom_formatter(self):
+        def format(value, request):
+            request.set_header('Content-Type', 'text/plain')
+            return 'format result'
+
+        adapter = ASGIAdapter(output_formatter=format)
+
+        @adapter.router.register('test.path')
+        def fn(context):
+            return [1, 2, 3]
+
+        status, headers, body = call_app(adapter, '/test.path')
+        self.assertEqual(body, b'format result')
+        self.assertEqual(headers['Content-Type'], 'text/plain')
+
+    def test_rejected(self):
+        @self.adapter.router.register('test.limited', limiter=RouteLimiter(rate=1, burst=1))
+        def fn(context):
+            return True
+
+        self.assertEqual(self.fetch('/api/test.limited'), True)
+        self.fetch('/api/test.limited')
+        self.assertEqual(self.status, 429)
+
+    def test_timeout(self):
+        adapter = ASGIAdapter(timeout_header='X-Request-Timeout')
+
+        @adapter.router.register('test.sleep', [Float('seconds')])
+        async def fn(context, args):
+            await asyncio.sleep(args.seconds)
+            return True
+
+        status, headers, body = call_app(
+            adapter, '/test.sleep', query_string='arguments={"seconds":0.5}', headers={'X-Request-Timeout': '0.01'})
+        self.assertEqual(status, 504)
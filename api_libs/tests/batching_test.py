@@ -0,0 +1,155 @@
+from unittest import TestCase
+import asyncio
+from ..batching import Batch, BatchFailed
+from ..parameters import Int, Str, List, VerifyFailed
+from ..route import Router, Context
+
+
+class BatchingTestCase(TestCase):
+    def setUp(self):
+        self.router = Router()
+        self.bulk_calls = []
+
+        @self.router.register('user.get', [Int('id', min=1), Str('fields', required=False)],
+                              batch=Batch('user.get_many', max_size=3))
+        def get_user(context, args):
+            return dict(id=args.id, single=True)
+
+        @self.router.register('user.get_many', [List('ids', type=Int()), Str('fields', required=False)])
+        async def get_users(context, args):
+            self.bulk_calls.append((list(args.ids), args.get('fields')))
+            await asyncio.sleep(0)
+            return {id: dict(id=id, fields=args.get('fields')) if id != 404 else ValueError(id) for id in args.ids}
+
+        @self.router.register('item.get', [Int('id')], batch=Batch('item.get_many', key='id', bulk_key='item_ids'))
+        def get_item(context, args):
+            pass
+
+        @self.router.register('item.get_many', [List('item_ids', type=Int())])
+        def get_items(context, args):
+            if args.item_ids == [0]:
+                raise RuntimeError('bulk failed')
+            return [id * 10 for id in args.item_ids][:2]
+
+    def run_in_context(self, fn):
+        async def run():
+            return await fn(Context(self.router))
+        return asyncio.run(run())
+
+    def test_batch(self):
+        async def fn(context):
+            return await asyncio.gather(*[context.call_async('user.get', dict(id=id)) for id in [1, 2, 2, 3, 4, 1]])
+
+        results = self.run_in_context(fn)
+        self.assertEqual([result['id'] for result in results], [1, 2, 2, 3, 4, 1])
+        # 相同的调用只执行一次，每次批量调用最多 3 个 key
+        self.assertEqual(self.bulk_calls, [([1, 2, 3], None), ([4], None)])
+
+    def test_group_by_other_arguments(self):
+        async def fn(context):
+            return await asyncio.gather(
+                context.call_async('user.get', dict(id=1)),
+                context.call_async('user.get', dict(id=2, fields='name')),
+                context.call_async('user.get', dict(id=3)),
+                context.call_async('user.get', dict(id=1, fields='name')))
+
+        results = self.run_in_context(fn)
+        self.assertEqual(results[1], dict(id=2, fields='name'))
+        self.assertEqual(sorted(self.bulk_calls, key=str), [([1, 3], None), ([2, 1], 'name')])
+
+    def test_dedup_within_context(self):
+        async def fn(context):
+            first = await context.call_async('user.get', dict(id=1))
+            second = await context.call_async('user.get', dict(id=1))
+            return first, second
+
+        first, second = self.run_in_context(fn)
+        self.assertIs(first, second)
+        self.assertEqual(len(self.bulk_calls), 1)
+
+        # 不同的 context（请求）之间不共享结果
+        self.run_in_context(fn)
+        self.assertEqual(len(self.bulk_calls), 2)
+
+    def test_errors(self):
+        async def fn(context):
+            return await asyncio.gather(
+                context.call_async('user.get', dict(id=404)), context.call_async('user.get', dict(id=1)), return_exceptions=True)
+
+        results = self.run_in_context(fn)
+        self.assertIsInstance(results[0], ValueError)
+        self.assertEqual(results[1]['id'], 1)
+
+        # 参数不合法时直接抛出异常，不进入批量调用
+        with self.assertRaises(VerifyFailed):
+            self.run_in_context(lambda context: context.call_async('user.get', dict(id=0)))
+
+        with self.assertRaisesRegex(RuntimeError, 'bulk failed'):
+            self.run_in_context(lambda context: context.call_async('item.get', dict(id=0)))
+
+        # 批量 interface 返回的 list 长度不对
+        async def wrong_length(context):
+            return await asyncio.gather(*[context.call_async('item.get', dict(id=id)) for id in [1, 2, 3]])
+        with self.assertRaises(BatchFailed):
+            self.run_in_context(wrong_length)
+
+    def test_failed_not_cached(self):
+        async def fn(context):
+            with self.assertRaises(ValueError):
+                await context.call_async('user.get', dict(id=404))
+            # 失败的调用不会被记录，再次调用时会重新执行
+            with self.assertRaises(ValueError):
+                await context.call_async('user.get', dict(id=404))
+            with self.assertRaisesRegex(RuntimeError, 'bulk failed'):
+                await context.call_async('item.get', dict(id=0))
+            with self.assertRaisesRegex(RuntimeError, 'bulk failed'):
+                await context.call_async('item.get', dict(id=0))
+
+        self.run_in_context(fn)
+        self.assertEqual(self.bulk_calls, [([404], None), ([404], None)])
+
+    def test_end_request(self):
+        started = []
+
+        @self.router.register('slow.get', [Int('id')], batch=Batch('slow.get_many'))
+        def get_slow(context, args):
+            pass
+
+        @self.router.register('slow.get_many', [List('ids', type=Int())])
+        async def get_slows(context, args):
+            started.append(args.ids)
+            await asyncio.sleep(10)
+
+        async def fn(context):
+            pending = context.call_async('slow.get', dict(id=1))
+            waiter = asyncio.ensure_future(pending)
+            await asyncio.sleep(0.01)
+            self.assertEqual(started, [[1]])
+            # 请求结束后，还没完成的批量调用被取消，等待它的调用者也随之结束
+            context.end_request()
+            with self.assertRaises(asyncio.CancelledError):
+                await asyncio.wait_for(waiter, 1)
+
+        self.run_in_context(fn)
+
+    def test_list_result(self):
+        async def fn(context):
+            return await asyncio.gather(context.call_async('item.get', dict(id=1)), context.call_async('item.get', dict(id=2)))
+        self.assertEqual(self.run_in_context(fn), [10, 20])
+
+    def test_gather(self):
+        async def fn(context):
+            return await context.gather([('user.get', dict(id=id)) for id in [1, 2]])
+        self.assertEqual([result['id'] for result in self.run_in_context(fn)], [1, 2])
+        self.assertEqual(self.bulk_calls, [([1, 2], None)])
+
+    def test_not_batched(self):
+        # 没有正在运行的 event loop，或直接通过 router 调用时，不会被合并
+        self.assertEqual(Context(self.router).call('user.get', dict(id=1)), dict(id=1, single=True))
+        self.assertEqual(self.router.call('user.get', None, dict(id=1)), dict(id=1, single=True))
+
+        # 在 event loop 中通过 context.call() 发起的调用同样不会被合并，同步的调用者直接得到返回值
+        async def fn(context):
+            return context.call('user.get', dict(id=1))
+        self.assertEqual(self.run_in_context(fn), dict(id=1, single=True))
+        self.assertEqual(self.bulk_calls, [])
@@ -0,0 +1,127 @@
+from unittest import TestCase
+import asyncio
+import multiprocessing
+import time
+from ..cache import MISS, LocalCache, SharedMemoryCache
+from ..route import Router
+from ..parameters import Int
+
+
+class CacheTestMixin:
+    def test_get_set(self):
+        cache = self.get_cache()
+        self.assertIs(cache.get('a'), MISS)
+        self.assertTrue(cache.set('a', dict(x=[1, 2]), 10))
+        self.assertEqual(cache.get('a'), dict(x=[1, 2]))
+        cache.set('a', None, 10)
+        self.assertIsNone(cache.get('a'))
+
+        cache.delete('a')
+        self.assertIs(cache.get('a'), MISS)
+
+        cache.set('b', 1, 10)
+        cache.clear()
+        self.assertIs(cache.get('b'), MISS)
+
+    def test_ttl(self):
+        cache = self.get_cache()
+        cache.set('a', 1, 0.01)
+        self.assertEqual(cache.get('a'), 1)
+        time.sleep(0.02)
+        self.assertIs(cache.get('a'), MISS)
+
+    def test_eviction(self):
+        cache = self.get_cache()
+        for i in range(100):
+            cache.set(str(i), i, 10)
+        cached = [i for i in range(100) if cache.get(str(i)) is not MISS]
+        self.assertLess(len(cached), 100)
+        # 最后写入的值一定还在
+        self.assertIn(99, cached)
+
+    def test_router_cache(self):
+        calls = []
+        router = Router(cache=self.get_cache())
+
+        @router.register('test.sync', [Int('a')], cache_ttl=10)
+        def fn(context, args):
+            calls.append(args.a)
+            return args.a * 2
+
+        @router.register('test.async', [Int('a')], cache_ttl=10)
+        async def fn2(context, args):
+            calls.append(args.a)
+            return args.a * 3
+
+        self.assertEqual(router.call('test.sync', None, dict(a=1)), 2)
+        self.assertEqual(router.call('test.sync', None, dict(a=1)), 2)
+        self.assertEqual(router.call('test.sync', None, dict(a=2)), 4)
+        self.assertEqual(calls, [1, 2])
+
+        async def run():
+            return [await router.call('test.async', None, dict(a=5)) for _ in range(3)]
+        self.assertEqual(asyncio.run(run()), [15, 15, 15])
+        self.assertEqual(calls, [1, 2, 5])
+
+    def test_router_cache_failure(self):
+        # 无法被缓存的结果（例如 SharedMemoryCache 无法序列化的 lambda），或缓存本身出错，都不影响调用的结果
+        cache = self.get_cache()
+        router = Router(cache=cache)
+
+        @router.register('test.lambda', cache_ttl=10)
+        def fn(context):
+            return lambda: 1
+
+        @router.register('test.async_lambda', cache_ttl=10)
+        async def fn2(context):
+            return lambda: 2
+
+        self.assertEqual(router.call('test.lambda')(), 1)
+        self.assertEqual(asyncio.run(router.call('test.async_lambda'))(), 2)
+
+        @router.register('test.value', cache_ttl=10)
+        def fn3(context):
+            return 3
+
+        def broken_set(key, value, ttl):
+            raise RuntimeError('cache is down')
+        cache.set = broken_set
+        with self.assertLogs('api_libs.route'):
+            self.assertEqual(router.call('test.value'), 3)
+
+
+class LocalCacheTestCase(CacheTestMixin, TestCase):
+    def get_cache(self):
+        return LocalCache(max_entries=10)
+
+
+def _set_in_child(cache):
+    cache.set('from-child', 'child-value', 10)
+
+
+class SharedMemoryCacheTestCase(CacheTestMixin, TestCase):
+    def get_cache(self):
+        return SharedMemoryCache(slots=16, slot_size=256, ways=4)
+
+    def test_too_large(self):
+        cache = self.get_cache()
+        self.assertFalse(cache.set('a', 'x' * 1000, 10))
+        self.assertIs(cache.get('a'), MISS)
+
+    def test_invalid_ways(self):
+        self.assertRaises(ValueError, SharedMemoryCache, slots=512, ways=256)
+        self.assertRaises(ValueError, SharedMemoryCache, slots=16, ways=0)
+        self.assertEqual(SharedMemoryCache(slots=255, slot_size=64, ways=255).ways, 255)
+
+    def test_unpicklable(self):
+        cache = self.get_cache()
+        with self.assertLogs('api_libs.cache'):
+            self.assertFalse(cache.set('a', lambda: 1, 10))
+        self.assertIs(cache.get('a'), MISS)
+
+    def test_shared_between_processes(self):
+        cache = self.get_cache()
+        process = multiprocessing.get_context('fork').Process(target=_set_in_child, args=(cache,))
+        process.start()
+        process.join()
+        self.assertEqual(cache.get('from-child'), 'child-value')
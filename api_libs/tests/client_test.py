@@ -0,0 +1,142 @@
+from tornado.web import Application
+from tornado.testing import AsyncHTTPTestCase, gen_test
+import asyncio
+from unittest import TestCase
+from api_libs.adapters.tornado_adapter import TornadoAdapter
+from api_libs.admission import RouteLimiter
+from api_libs.client import APIClient, APICallFailed
+from api_libs.parameters import Int, Float
+
+
+class APIClientTestCase(AsyncHTTPTestCase):
+    def get_app(self):
+        self.adapter = TornadoAdapter()
+        self.ws_contexts = set()
+
+        @self.adapter.router.register('test.sum', [Int('a'), Int('b')])
+        def fn(context, args):
+            self.ws_contexts.add(id(context))
+            return args.a + args.b
+
+        @self.adapter.router.register('test.sleep', [Float('seconds')])
+        async def fn2(context, args):
+            await asyncio.sleep(args.seconds)
+            return True
+
+        @self.adapter.router.register('test.limited', limiter=RouteLimiter(rate=1, burst=1))
+        def fn3(context):
+            return 'ok'
+
+        return Application([
+            ('/api/(.+)', self.adapter.RequestHandler),
+            ('/api-ws', self.adapter.WebSocketHandler),
+        ])
+
+    def get_client(self, **kwargs):
+        return APIClient(self.get_url('/api/'), **kwargs)
+
+    @gen_test
+    async def test_call(self):
+        client = self.get_client(max_concurrency=4)
+        self.assertEqual(await client.call('test.sum', dict(a=1, b=2)), 3)
+        results = await client.call_many([('test.sum', dict(a=i, b=i)) for i in range(20)])
+        self.assertEqual(results, [i * 2 for i in range(20)])
+        # 连接被复用，连接数不会超过 max_concurrency
+        self.assertLessEqual(client.pool.created, 4)
+        await client.close()
+
+    @gen_test
+    async def test_errors(self):
+        client = self.get_client()
+        with self.assertRaises(APICallFailed) as cm:
+            await client.call('test.sum', dict(a='x', b=1))
+        self.assertEqual(cm.exception.status, 500)
+
+        results = await client.call_many([('test.limited', {}), ('test.limited', {})], return_exceptions=True)
+        self.assertEqual(results[0], 'ok')
+        self.assertEqual(results[1].status, 429)
+        await client.close()
+
+    @gen_test
+    async def test_timeout(self):
+        client = self.get_client(timeout=0.02)
+        with self.assertRaises(APICallFailed) as cm:
+            await client.call('test.sleep', dict(seconds=0.5))
+        self.assertIsNone(cm.exception.status)
+        await client.close()
+
+    @gen_test
+    async def test_websocket(self):
+        client = self.get_client(ws_url=self.get_url('/api-ws').replace('http', 'ws'))
+        results = await client.call_many([('test.sum', dict(a=i, b=1)) for i in range(10)])
+        self.assertEqual(results, [i + 1 for i in range(10)])
+        # 所有调用都通过同一个 WebSocket 连接进行，没有建立 HTTP 连接
+        self.assertEqual(client.pool.created, 0)
+        self.assertEqual(len(self.ws_contexts), 1)
+
+        with self.assertRaises(APICallFailed) as cm:
+            await client.call('test.not_exists')
+        self.assertEqual(cm.exception.status, 400)
+        await client.close()
+
+    @gen_test
+    async def test_websocket_fallback(self):
+        client = self.get_client(ws_url=self.get_url('/not-exists').replace('http', 'ws'))
+        self.assertEqual(await client.call('test.sum', dict(a=1, b=1)), 2)
+        self.assertIsNone(client.ws_url)
+        self.assertEqual(client.pool.created, 1)
+        await client.close()
+
+
+class APIClientRetryTestCase(TestCase):
+    '''用一个手写的 HTTP server 模拟 keep-alive 连接被服务端关闭的情况'''
+    def run_server(self, handle_second):
+        self.requests = 0
+
+        async def handle(reader, writer):
+            while True:
+                try:
+                    await reader.readuntil(b'\r\n\r\n')
+                    await reader.readexactly(len('{}'))
+                except asyncio.IncompleteReadError:
+                    writer.close()
+                    return
+                self.requests += 1
+                if self.requests == 2:
+                    handle_second(writer)
+                    writer.close()
+                    return
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: 1\r\n\r\n1')
+
+        async def run():
+            server = await asyncio.start_server(handle, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            client = APIClient('http://127.0.0.1:{}/api/'.format(port))
+            try:
+                results = []
+                for i in range(2):
+                    try:
+                        results.append(await client.call('test.path'))
+                    except APICallFailed as e:
+                        results.append(e)
+                return results, client.pool.created
+            finally:
+                await client.close()
+                server.close()
+                await server.wait_closed()
+        return asyncio.run(run())
+
+    def test_retry_empty_response(self):
+        # 复用的连接在返回任何数据前被关闭，换一个新连接重试
+        results, created = self.run_server(lambda writer: None)
+        self.assertEqual(results, [1, 1])
+        self.assertEqual(created, 2)
+        self.assertEqual(self.requests, 3)
+
+    def test_no_retry_incomplete_response(self):
+        # 已经收到了部分 response，服务端可能已执行了调用，不能重试
+        results, created = self.run_server(lambda writer: writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: 1\r\n'))
+        self.assertEqual(results[0], 1)
+        self.assertIsInstance(results[1], APICallFailed)
+        self.assertEqual(created, 1)
+        self.assertEqual(self.requests, 2)
@@ -0,0 +1,127 @@
+from unittest import TestCase
+import asyncio
+import os
+import threading
+import time
+from ..route import Router, RouteRegisterFailed
+from ..execution import THREAD, PROCESS, LoopLagMonitor
+from ..parameters import Int
+
+
+class ExecutorTestCase(TestCase):
+    def setUp(self):
+        self.router = Router(thread_pool_size=2, process_pool_size=1)
+
+    def tearDown(self):
+        self.router.executors.shutdown()
+
+    def test_thread(self):
+        @self.router.register('test.thread', [Int('a')], executor=THREAD)
+        def fn(context, args):
+            return threading.get_ident(), args.a * 2
+
+        async def run():
+            return await self.router.call('test.thread', None, dict(a=5))
+
+        thread_id, result = asyncio.run(run())
+        self.assertNotEqual(thread_id, threading.get_ident())
+        self.assertEqual(result, 10)
+
+    def test_thread_contextvars(self):
+        from ..tracing import Tracer, InMemoryExporter, current_span, activate, deactivate
+
+        @self.router.register('test.thread', executor=THREAD)
+        def fn(context):
+            return current_span()
+
+        exporter = InMemoryExporter()
+        root = Tracer(exporter).start_trace('request')
+
+        async def run():
+            token = activate(root)
+            try:
+                return await self.router.call('test.thread')
+            finally:
+                deactivate(token)
+
+        span = asyncio.run(run())
+        # 在线程池中执行的 interface 同样处于调用者的 span 之下
+        self.assertIsNotNone(span)
+        self.assertEqual((span.kind, span.name, span.parent_id), ('route', 'test.thread', root.span_id))
+
+    def test_thread_async_result(self):
+        @self.router.register('test.thread', executor=THREAD)
+        def fn(context):
+            async def later():
+                return 'async result'
+            return later()
+
+        async def run():
+            return await self.router.call('test.thread')
+
+        self.assertEqual(asyncio.run(run()), 'async result')
+
+    def test_thread_exception(self):
+        @self.router.register('test.thread', [Int('a')], executor=THREAD)
+        def fn(context, args):
+            return args.a
+
+        async def run(arguments):
+            return await self.router.call('test.thread', None, arguments)
+
+        from ..parameters import VerifyFailed
+        self.assertRaises(VerifyFailed, asyncio.run, run(dict(a='x')))
+
+    def test_process(self):
+        @self.router.register('test.process', [Int('a')], executor=PROCESS)
+        def fn(context, args):
+            return os.getpid(), context, args.a + 1
+
+        async def run():
+            return await self.router.call('test.process', self.router.context_cls(self.router), dict(a=1))
+
+        pid, context, result = asyncio.run(run())
+        self.assertNotEqual(pid, os.getpid())
+        # 即使调用者传入了 context，在进程池中执行的 interface 接收到的 context 也是 None
+        self.assertIsNone(context)
+        self.assertEqual(result, 2)
+
+    def test_illegal_executor(self):
+        def register():
+            @self.router.register('test.path', executor='gpu')
+            def fn(context):
+                pass
+        self.assertRaises(RouteRegisterFailed, register)
+
+    def test_blocking_stats(self):
+        @self.router.register('test.slow')
+        def fn(context):
+            time.sleep(0.01)
+
+        # 默认（没有指定 metrics 时）不记录
+        self.router.call('test.slow')
+        self.assertEqual(self.router.blocking_stats, {})
+
+        self.router.track_blocking = True
+        self.router.call('test.slow')
+        self.router.call('test.slow')
+        stats = self.router.blocking_stats['test.slow']
+        self.assertEqual(stats['count'], 2)
+        self.assertGreaterEqual(stats['max'], 0.01)
+
+
+class LoopLagMonitorTestCase(TestCase):
+    def test_lag(self):
+        monitor = LoopLagMonitor(interval=0.01)
+
+        async def run():
+            monitor.start()
+            await asyncio.sleep(0.02)
+            time.sleep(0.05)
+            await asyncio.sleep(0.02)
+            monitor.stop()
+
+        asyncio.run(run())
+        stats = monitor.stats()
+        self.assertGreater(stats['count'], 0)
+        self.assertGreaterEqual(stats['max'], 0.03)
@@ -0,0 +1,77 @@
+from unittest import TestCase
+import asyncio
+import json
+from ..loadtest import RouteMix, LoadTestFailed, run_loadtest, cpu_seconds, url_prefix
+from ..parameters import Int
+from ..route import Router
+
+
+def build_router():
+    router = Router()
+
+    @router.register('echo', [Int('x')])
+    def echo(context, args):
+        return args.x
+
+    @router.register('slow')
+    async def slow(context):
+        await asyncio.sleep(0.01)
+        return 'ok'
+
+    @router.register('fail')
+    def fail(context):
+        raise ValueError()
+
+    return router
+
+
+class RouteMixTestCase(TestCase):
+    def test_parse(self):
+        mix = RouteMix.parse(['echo:3={"x": 1}', 'slow', 'fail:0.5'])
+        self.assertEqual(mix.entries, [('echo', 3, dict(x=1)), ('slow', 1, {}), ('fail', 0.5, {})])
+        with self.assertRaises(LoadTestFailed):
+            RouteMix.parse(['echo=abc'])
+        with self.assertRaises(LoadTestFailed):
+            RouteMix.parse([])
+
+
+class LoadTestTestCase(TestCase):
+    def test_closed_loop(self):
+        mix = RouteMix.parse(['echo:2={"x": 1}', 'fail'])
+        report = run_loadtest(build_router(), mix, concurrency=4, duration=0.3, warmup=0.05, seed=1)
+        data = report.to_dict()
+        self.assertGreater(data['requests'], 20)
+        self.assertEqual(data['per_route']['fail']['errors'], report.errors[500])
+        self.assertAlmostEqual(data['error_rate'], 1 / 3, delta=0.15)
+        self.assertGreater(data['latency_ms']['p999'], 0)
+        self.assertLessEqual(data['latency_ms']['p50'], data['latency_ms']['p999'])
+        self.assertEqual(sum(count for _, _, count in data['histogram']), data['requests'])
+        self.assertEqual(len(report.cpu), 1)
+        json.dumps(data)
+        self.assertIn('p999', report.format())
+
+    def test_url_pattern(self):
+        report = run_loadtest(build_router(), RouteMix.parse(['echo={"x": 1}']), concurrency=2, duration=0.1, warmup=0,
+                              url_pattern=r'/v1\.0/(.+)')
+        self.assertGreater(report.requests, 0)
+        self.assertEqual(report.error_count, 0)
+
+        self.assertEqual(url_prefix(r'^/api/(.+)$'), '/api/')
+        with self.assertRaises(LoadTestFailed):
+            url_prefix(r'/(\w+)/(.+)')
+
+    def test_open_loop(self):
+        report = run_loadtest(build_router(), RouteMix.parse(['slow']), concurrency=50, duration=0.5, rate=100, warmup=0)
+        # open-loop 模式下，请求数由速率决定，与服务端的处理速度无关
+        self.assertAlmostEqual(report.requests, 50, delta=3)
+        self.assertEqual(report.error_count, 0)
+        self.assertGreaterEqual(report.latency.percentile(50), 10000)
+
+    def test_subprocess(self):
+        report = run_loadtest(build_router(), RouteMix.parse(['echo={"x": 1}']), concurrency=4, duration=0.3,
+                              processes=2, warmup=0.2)
+        self.assertGreater(report.requests, 20)
+        self.assertEqual(report.error_count, 0)
+        self.assertEqual(len(report.cpu), 2)
+        if cpu_seconds(1) is not None:
+            self.assertTrue(all(usage is not None for usage in report.cpu.values()))
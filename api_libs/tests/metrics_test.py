@@ -0,0 +1,102 @@
+from unittest import TestCase
+import asyncio
+from ..metrics import Histogram, RouterMetrics, UNKNOWN_ROUTE
+from ..route import Router, RouteCallFailed
+from ..parameters import Int, VerifyFailed
+from .asgi_adapter_test import call_app
+from ..adapters.asgi_adapter import ASGIAdapter
+
+
+class HistogramTestCase(TestCase):
+    def test_buckets(self):
+        # 相邻的 bucket 首尾相接，且每个值都落在自己所在 bucket 的范围内
+        last_upper = 0
+        for index in range(Histogram.bucket_index(1 << 20) + 1):
+            lower, upper = Histogram.bucket_bounds(index)
+            self.assertEqual(lower, last_upper)
+            last_upper = upper
+        for value in [0, 1, 15, 16, 17, 100, 1000, 123456]:
+            lower, upper = Histogram.bucket_bounds(Histogram.bucket_index(value))
+            self.assertTrue(lower <= value < upper)
+            self.assertLessEqual(upper - lower, max(1, value / 8))
+
+    def test_percentile_and_merge(self):
+        a, b = Histogram(), Histogram()
+        for value in range(1, 501):
+            a.record(value)
+        for value in range(501, 1001):
+            b.record(value)
+        a.merge(b)
+        self.assertEqual(a.count, 1000)
+        self.assertEqual(a.max, 1000)
+        self.assertAlmostEqual(a.percentile(50), 500, delta=500 / 8)
+        self.assertAlmostEqual(a.percentile(99), 990, delta=990 / 8)
+        self.assertEqual(a.percentile(100), 1000)
+        self.assertEqual(Histogram().percentile(50), 0)
+
+
+class RouterMetricsTestCase(TestCase):
+    def setUp(self):
+        self.metrics = RouterMetrics()
+        self.router = Router(metrics=self.metrics)
+
+    def test_counters(self):
+        @self.router.register('a', [Int('x')])
+        def fn(context, args):
+            return args.x
+
+        self.router.call('a', None, dict(x=1))
+        self.router.call('A', None, dict(x=2))
+        with self.assertRaises(VerifyFailed):
+            self.router.call('a', None, dict(x='abc'))
+        with self.assertRaises(RouteCallFailed):
+            self.router.call('not.exists')
+
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(snapshot['a']['calls'], 3)
+        self.assertEqual(snapshot['a']['errors'], dict(VerifyFailed=1))
+        self.assertEqual(snapshot['a']['latency']['count'], 3)
+        self.assertEqual(snapshot[UNKNOWN_ROUTE]['errors'], dict(RouteCallFailed=1))
+
+        self.metrics.reset()
+        self.assertEqual(self.metrics.snapshot(), {})
+
+    def test_async_and_nested(self):
+        @self.router.register('inner')
+        async def inner(context):
+            await asyncio.sleep(0.02)
+            raise ValueError()
+
+        @self.router.register('outer')
+        async def outer(context):
+            try:
+                await context.call('inner')
+            except ValueError:
+                pass
+            return 1
+
+        self.assertEqual(asyncio.run(self.router.call('outer')), 1)
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(snapshot['inner']['errors'], dict(ValueError=1))
+        self.assertEqual(snapshot['outer']['errors'], {})
+        # async interface 的耗时包含 coroutine 的执行时间，outer 的耗时包含 inner
+        self.assertGreaterEqual(snapshot['inner']['latency']['max'], 0.015)
+        self.assertGreaterEqual(snapshot['outer']['latency']['max'], snapshot['inner']['latency']['max'])
+
+    def test_prometheus(self):
+        @self.router.register('a')
+        def fn(context):
+            return 1
+
+        self.metrics.register_route(self.router, 'metrics')
+        self.router.call('a')
+        text = self.metrics.prometheus_text()
+        self.assertIn('api_libs_route_calls_total{route="a"} 1\n', text)
+        self.assertIn('api_libs_route_latency_seconds_bucket{route="a",le="+Inf"} 1\n', text)
+        self.assertIn('# TYPE api_libs_route_latency_seconds histogram\n', text)
+
+        adapter = ASGIAdapter(self.router, path_prefix='/api/')
+        status, headers, body = call_app(adapter, '/api/metrics')
+        self.assertEqual(status, 200)
+        self.assertTrue(headers['Content-Type'].startswith('text/plain'))
+        self.assertIn('api_libs_route_calls_total{route="a"} 1\n', body.decode())
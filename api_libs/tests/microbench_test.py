@@ -0,0 +1,58 @@
+from unittest import TestCase
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+from benchmarks.microbench import compare, main
+
+
+def report(**results):
+    return dict(meta={}, results={name: dict(min_ns=ns, median_ns=ns) for name, ns in results.items()})
+
+
+class CompareTestCase(TestCase):
+    def test_compare(self):
+        baseline = report(fast=100, slow=100, removed=100)
+        current = report(fast=105, slow=120, added=50)
+        rows = compare(current, baseline, threshold=0.1)
+        # 只比较两边都有的 case，按名称排序
+        self.assertEqual([row[0] for row in rows], ['fast', 'slow'])
+        self.assertEqual(rows[0], ('fast', 100, 105, 1.05, False))
+        self.assertEqual(rows[1][:3], ('slow', 100, 120))
+        self.assertTrue(rows[1][4])
+
+        # 刚好等于 threshold 不算 regression
+        self.assertFalse(compare(report(a=110), report(a=100), threshold=0.1)[0][4])
+        self.assertTrue(compare(report(a=111), report(a=100), threshold=0.1)[0][4])
+        self.assertEqual([row[4] for row in compare(current, baseline, threshold=0.5)], [False, False])
+
+
+class MainTestCase(TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def run_compare(self, baseline_ns):
+        path = os.path.join(self.output_dir, 'baseline.json')
+        with open(path, 'w') as f:
+            json.dump(report(**{'param.int.valid': baseline_ns}), f)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(io.StringIO()):
+            exit_code = main(['--filter', 'param.int.valid', '--repeat', '1', '--min-time', '0.001',
+                              '--compare', path, '--threshold', '0.1'])
+        return exit_code, output.getvalue()
+
+    def test_regression(self):
+        exit_code, output = self.run_compare(0.001)
+        self.assertEqual(exit_code, 1)
+        self.assertIn('REGRESSION', output)
+
+    def test_pass(self):
+        exit_code, output = self.run_compare(1e9)
+        self.assertEqual(exit_code, 0)
+        self.assertNotIn('REGRESSION', output)
+        self.assertIn('param.int.valid', output)
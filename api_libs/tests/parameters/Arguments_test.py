@@ -1,6 +1,6 @@
 from unittest import TestCase
-from api_libs.parameters import Arguments, VerifyFailed, Str, Int, Datetime
-from api_libs.parameters.Arguments import ArgumentsError
+from api_libs.parameters import Arguments, VerifyFailed, Str, Int, Datetime, Dict, List
+from api_libs.parameters.Arguments import ArgumentsError, TrustedArguments
 from datetime import datetime
 
 
@@ -76,3 +76,47 @@ class ArgumentsTestCase(TestCase):
         # 能正确地对 parameters 中未给出的部分进行放行
         self.assertEqual(arguments.p3, 1)
         self.assertTrue('p4' not in arguments)
+
+    def test_trusted(self):
+        parameters = [
+            Str('p1', max_len=6),
+            Datetime('p2'),
+            Int('p3', default=1),
+            Int('p4', required=False)
+        ]
+        arguments = Arguments(parameters, dict(p1='a<b', p2=100))
+        self.assertEqual(arguments.p1, 'a&lt;b')
+
+        # 不再执行转换类的 rule：已经转义过的字符串不会被重复转义
+        trusted = Arguments.from_trusted(parameters, arguments)
+        self.assertIsInstance(trusted, Arguments)
+        self.assertEqual(trusted, arguments)
+        self.assertEqual(Arguments.from_trusted([Str('p1')], dict(p1=' a ')).p1, ' a ')
+
+        # 仍然可能不满足的检查照常进行
+        self.assertRaises(VerifyFailed, Arguments.from_trusted, parameters, dict(p1='abc'))
+        self.assertRaises(VerifyFailed, Arguments.from_trusted, parameters, dict(p1=None, p2=datetime.now()))
+        self.assertRaises(VerifyFailed, Arguments.from_trusted, parameters, dict(p1='a' * 7, p2=datetime.now()))
+        self.assertRaises(VerifyFailed, Arguments.from_trusted, [Int('p1', min=0)], dict(p1=-1))
+        self.assertRaises(ArgumentsError, Arguments.from_trusted, parameters, dict(arguments, p5=1))
+
+        # Dict、List 的子项同样以 trusted 的方式检查
+        nested = [Dict('d', format=[Str('s', max_len=6)]), List('l', type=Str(max_len=6))]
+        trusted = Arguments.from_trusted(nested, dict(d=dict(s='a&lt;b'), l=['a&lt;b']))
+        self.assertEqual((trusted.d.s, trusted.l), ('a&lt;b', ['a&lt;b']))
+        self.assertRaises(VerifyFailed, Arguments.from_trusted, nested, dict(d=dict(s='a' * 7), l=[]))
+
+        # regex 作用于转义之前的值：正常检查能通过的值，trusted 时同样能通过
+        regex_parameters = [Str('s', regex=r'^[^&;]*$', not_regex=r'&lt;')]
+        formatted = Arguments(regex_parameters, dict(s='x<y'))
+        self.assertEqual(formatted.s, 'x&lt;y')
+        self.assertEqual(Arguments.from_trusted(regex_parameters, formatted).s, 'x&lt;y')
+        self.assertEqual(TrustedArguments(formatted, verify=True).build(regex_parameters).s, 'x&lt;y')
+        self.assertRaises(VerifyFailed, Arguments, regex_parameters, dict(s='x&y'))
+        self.assertRaises(VerifyFailed, Arguments.from_trusted, regex_parameters, dict(s='x&amp;y'))
+        self.assertEqual(Arguments.from_trusted([Str('s', regex='^$')], dict(s='')).s, '')
+
+        # verify=True（调试模式）时，额外检查参数值是否已经是格式化之后的类型，同样不会重复转义
+        self.assertEqual(TrustedArguments(arguments, verify=True).build(parameters).p1, 'a&lt;b')
+        self.assertRaises(VerifyFailed, TrustedArguments(dict(p1='ab', p2=100), verify=True).build, parameters)
+        self.assertEqual(TrustedArguments(dict(p1='ab', p2=100), verify=False).build(parameters).p2, 100)
@@ -0,0 +1,94 @@
+from unittest import TestCase
+import json
+from api_libs.parameters import Int, Float, Decimal, Str, Bool, Object, Datetime, Date, List, Dict, CanHas, CanNotHas, \
+    Arguments, VerifyFailed, ArgumentsError
+from api_libs.parameters.generator import PayloadGenerator, GenerateFailed, INVALID_KINDS
+from api_libs.route import Router
+
+
+PARAMETERS = [
+    Int('id', min=1, max=100, nozero=True),
+    Float('score', min=-1.5, max=1.5),
+    Decimal('price', min=0, max=10),
+    Str('email', regex=r'^[\w.+-]+@[\w-]+\.(com|net)$'),
+    Str('color', choices=['red', 'green']),
+    Str('name', min_len=2, max_len=5),
+    Str('code', regex=r'(?=.*\d)^\w{4,8}$'),
+    Bool('flag', required=False, nullable=True),
+    List('tags', type=Str(max_len=5), min_len=1, max_len=3),
+    Dict('info', format=[Int('age', min=0), Datetime('at'), Date('day'), Object('extra', type=dict), CanHas('any'),
+                         CanNotHas('never')]),
+]
+
+
+class PayloadGeneratorTestCase(TestCase):
+    def test_valid_arguments(self):
+        generator = PayloadGenerator(seed=1)
+        for _ in range(50):
+            arguments = generator.valid_arguments(PARAMETERS)
+            Arguments(PARAMETERS, arguments)
+            json.dumps(arguments)
+            self.assertNotIn('never', arguments['info'])
+
+    def test_seed(self):
+        self.assertEqual(
+            [PayloadGenerator(seed=7).valid_arguments(PARAMETERS) for _ in range(3)],
+            [PayloadGenerator(seed=7).valid_arguments(PARAMETERS) for _ in range(3)])
+
+    def test_size_knobs(self):
+        generator = PayloadGenerator(seed=1, max_items=2, max_str_len=3, optional_rate=0, null_rate=1)
+        parameters = [List('items', type=Str()), Int('optional', required=False), Str('nullable', nullable=True)]
+        for _ in range(20):
+            arguments = generator.valid_arguments(parameters)
+            self.assertLessEqual(len(arguments['items']), 2)
+            self.assertTrue(all(1 <= len(item) <= 3 for item in arguments['items']))
+            self.assertNotIn('optional', arguments)
+            self.assertIsNone(arguments['nullable'])
+
+    def test_regex_string(self):
+        generator = PayloadGenerator(seed=1)
+        for pattern in [r'^(ab|cd)+\1[^a-z]{3}\s\W$', r'^\d{3}-\d{4}$', r'^[A-Z][a-z]*?\.?$', r'x(?P<g>y)(?P=g)']:
+            for _ in range(20):
+                self.assertRegex(generator.regex_string(pattern), pattern)
+
+    def test_invalid_arguments(self):
+        generator = PayloadGenerator(seed=1)
+        kinds = set()
+        for _ in range(200):
+            arguments, reason = generator.invalid_arguments(PARAMETERS)
+            with self.assertRaises((VerifyFailed, ArgumentsError)):
+                Arguments(PARAMETERS, arguments)
+            kinds.add(reason.split(': ')[1])
+        self.assertEqual(kinds, set(INVALID_KINDS))
+
+    def test_invalid_kinds(self):
+        generator = PayloadGenerator(seed=1)
+        for _ in range(20):
+            arguments, reason = generator.invalid_arguments(PARAMETERS, kinds=['max'])
+            self.assertIn(reason, ['id: max', 'score: max', 'price: max'])
+
+        with self.assertRaises(GenerateFailed):
+            generator.invalid_arguments([Str('a')], kinds=['regex'])
+
+    def test_unsatisfiable(self):
+        with self.assertRaises(GenerateFailed):
+            PayloadGenerator(seed=1).valid_arguments([Str('a', regex=r'^a$', min_len=2)])
+
+    def test_route_arguments(self):
+        router = Router()
+
+        @router.register('user.create', [Str('name', max_len=10), Int('age', min=0)])
+        def create(context, args):
+            return args
+
+        @router.register('ping')
+        def ping(context):
+            return 'pong'
+
+        generator = PayloadGenerator(seed=1)
+        arguments = generator.route_arguments(router, 'User.Create')
+        self.assertEqual(router.call('user.create', None, arguments), arguments)
+        self.assertEqual(generator.route_arguments(router, 'ping'), {})
+        self.assertEqual(generator.route_arguments(router, 'ping', valid=False), ({'__unexpected__': 1}, ': unexpected'))
+        with self.assertRaises(GenerateFailed):
+            generator.route_arguments(router, 'not.exists')
@@ -0,0 +1,62 @@
+from unittest import TestCase
+import json
+from api_libs.parameters import Int, Str, List, Dict, Parameter, VerifyFailed
+from api_libs.parameters.profiling import validation_profiler
+from api_libs.route import Router
+
+
+class ValidationProfilerTestCase(TestCase):
+    def setUp(self):
+        self.router = Router()
+
+        @self.router.register('test.path', [
+            Str('name', regex=r'^\w+$'),
+            List('tags', type=Str(max_len=10)),
+            Dict('info', format=[Int('age', min=0)]),
+        ])
+        def fn(context, args):
+            return args
+
+        self.original_verify = Parameter.verify
+        validation_profiler.reset()
+        validation_profiler.enable()
+
+    def tearDown(self):
+        validation_profiler.disable()
+        validation_profiler.reset()
+
+    def test_profile(self):
+        arguments = dict(name='abc', tags=['a', 'b'], info=dict(age=1))
+        self.assertEqual(self.router.call('test.path', None, arguments), arguments)
+        with self.assertRaises(VerifyFailed):
+            self.router.call('test.path', None, dict(arguments, name='a b'))
+
+        items = {(item['route'], item['parameter'], item['rule']): item for item in validation_profiler.report(None)}
+        self.assertEqual(items[('test.path', 'name', 'regex')]['calls'], 2)
+        self.assertEqual(items[('test.path', 'name', 'required')]['calls'], 2)
+        self.assertEqual(items[('test.path', 'tags[]', 'max_len')]['calls'], 2)
+        self.assertEqual(items[('test.path', 'info.age', 'min')]['calls'], 1)
+        # Dict 的 format rule 的 total 包含子项的检查，self 不包含
+        info_format = items[('test.path', 'info', 'format')]
+        self.assertLess(info_format['self'], info_format['total'])
+
+        report = validation_profiler.report(top=3, sort_by='self')
+        self.assertEqual(len(report), 3)
+        self.assertGreaterEqual(report[0]['self'], report[1]['self'])
+
+        table = validation_profiler.format_report(top=5).splitlines()
+        self.assertEqual(len(table), 6)
+        self.assertTrue(table[0].startswith('route'))
+        self.assertEqual(len(json.loads(validation_profiler.format_report(top=5, format='json'))), 5)
+
+    def test_disable(self):
+        self.assertIsNot(Parameter.verify, self.original_verify)
+        validation_profiler.disable()
+        self.assertIs(Parameter.verify, self.original_verify)
+
+        self.router.call('test.path', None, dict(name='abc', tags=[], info=dict(age=1)))
+        self.assertEqual(validation_profiler.report(), [])
+
+    def test_without_router(self):
+        Int('a').verify(dict(a=1))
+        self.assertEqual(set((item['route'], item['parameter']) for item in validation_profiler.report()), {(None, 'a')})
@@ -0,0 +1,143 @@
+from unittest import TestCase
+from tornado.testing import AsyncHTTPTestCase
+from tornado.web import Application
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+from api_libs.adapters.tornado_adapter import TornadoAdapter, TornadoContext
+from api_libs.parameters import Int, Str
+from api_libs.recording import TrafficRecorder, read_records, replay, summarize, compare_reports, main
+from api_libs.route import Router
+
+
+def build_router(context_cls=TornadoContext):
+    router = Router(context_cls)
+
+    @router.register('login', [Str('user'), Str('password')])
+    def login(context, args):
+        return args.user
+
+    @router.register('slow', [Int('ms')])
+    async def slow(context, args):
+        await asyncio.sleep(args.ms / 1000)
+        return 'ok'
+
+    @router.register('fail')
+    def fail(context):
+        raise ValueError()
+
+    return router
+
+
+class TrafficRecorderTestCase(AsyncHTTPTestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.output_dir, 'traffic.jsonl')
+        self.recorder = TrafficRecorder(
+            self.path, redact_keys=['Password'],
+            redact=lambda route_path, arguments: None if route_path == 'slow' and arguments['ms'] > 100 else arguments)
+        super().setUp()
+
+    def tearDown(self):
+        super().tearDown()
+        self.recorder.close()
+        shutil.rmtree(self.output_dir)
+
+    def get_app(self):
+        adapter = TornadoAdapter(build_router(), recorder=self.recorder)
+        return Application([('/api/(.+)', adapter.RequestHandler)])
+
+    def call(self, path, arguments):
+        return self.fetch('/api/' + path, method='POST', body=json.dumps(arguments),
+                          headers={'Content-Type': 'application/json'})
+
+    def test_record(self):
+        self.assertEqual(self.call('login', dict(user='u', password='secret')).code, 200)
+        self.assertEqual(self.call('slow', dict(ms=20)).code, 200)
+        self.assertEqual(self.call('slow', dict(ms=200)).code, 200)     # 被 redact 函数排除
+        self.assertEqual(self.call('fail', {}).code, 500)
+        self.recorder.close()
+
+        records = list(read_records(self.path))
+        self.assertEqual([(route, status, arguments) for _, route, _, status, arguments in records], [
+            ('login', 200, dict(user='u', password='***')),
+            ('slow', 200, dict(ms=20)),
+            ('fail', 500, {}),
+        ])
+        self.assertGreaterEqual(records[1][2], 20)
+        self.assertLessEqual(records[0][0], records[1][0])
+
+    def test_max_bytes(self):
+        self.recorder.max_bytes = 150
+        for _ in range(5):
+            self.call('slow', dict(ms=1))
+        self.recorder.close()
+        self.assertTrue(self.recorder.full)
+        self.assertLessEqual(os.path.getsize(self.path), 150)
+        self.assertEqual(len(list(read_records(self.path))), self.recorder.recorded)
+
+    def test_sampling(self):
+        self.recorder.routes = {'login'}
+        self.call('slow', dict(ms=1))
+        self.recorder.sample_rate = 0
+        self.call('login', dict(user='u', password='p'))
+        self.recorder.close()
+        self.assertFalse(os.path.exists(self.path))
+
+
+class ReplayTestCase(TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.output_dir, 'traffic.jsonl')
+        recorder = TrafficRecorder(self.path)
+        for i in range(10):
+            recorder.write(1000 + i * 0.02, 'slow', 100, 200, json.dumps(dict(ms=5)))
+        recorder.write(1000.2, 'fail', 1, 500, '{}')
+        recorder.close()
+        # 不完整的最后一行
+        with open(self.path, 'a') as f:
+            f.write('[1000.3,"slow"')
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_replay_router(self):
+        report = replay(self.path, build_router(), speed=2)
+        self.assertEqual(report.requests, 11)
+        self.assertEqual(report.errors, {'ValueError': 1})
+        # 按 2 倍速回放，0.2 秒的记录需要约 0.1 秒
+        self.assertGreaterEqual(report.duration, 0.1)
+        data = report.to_dict()
+        self.assertGreaterEqual(data['per_route']['slow']['latency_ms']['p50'], 5)
+
+    def test_replay_adapter(self):
+        report = replay(self.path, TornadoAdapter(build_router()), speed=0, concurrency=4, limit=5)
+        self.assertEqual(report.requests, 5)
+        self.assertEqual(report.error_count, 0)
+
+        # 回放客户端按 url_pattern 拼出请求的 URL
+        report = replay(self.path, TornadoAdapter(build_router()), speed=0, limit=5, url_pattern=r'/v1\.0/(.+)')
+        self.assertEqual(report.error_count, 0)
+
+    def test_summarize_and_compare(self):
+        recorded = summarize(self.path).to_dict()
+        self.assertEqual(recorded['requests'], 11)
+        self.assertEqual(recorded['errors'], {'500': 1})
+        self.assertAlmostEqual(recorded['per_route']['slow']['latency_ms']['p50'], 100, delta=1)
+
+        replayed = replay(self.path, build_router(), speed=0).to_dict()
+        rows = compare_reports(recorded, replayed, threshold=0.1)
+        self.assertEqual({(route, percentile) for route, percentile, *_ in rows},
+                         {(route, p) for route in [None, 'slow', 'fail'] for p in ['p50', 'p90', 'p99', 'p999']})
+        # 回放时 slow 只需要约 5ms，比录制时记录的 100ms 快得多
+        slow_p50 = [row for row in rows if row[:2] == ('slow', 'p50')][0]
+        self.assertLess(slow_p50[4], 1)
+        self.assertFalse(slow_p50[5])
+        self.assertTrue(compare_reports(replayed, recorded, threshold=0.1)[0][5])
+
+    def test_cli(self):
+        baseline = os.path.join(self.output_dir, 'baseline.json')
+        self.assertEqual(main(['summary', self.path, '--output', baseline]), 0)
+        self.assertEqual(main(['compare', baseline, baseline]), 0)
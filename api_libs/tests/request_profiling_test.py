@@ -0,0 +1,91 @@
+from tornado.web import Application
+from tornado.testing import AsyncHTTPTestCase
+import os
+import pstats
+import shutil
+import tempfile
+import time
+from api_libs.adapters.tornado_adapter import TornadoAdapter
+from api_libs.request_profiling import RequestProfiler, CPROFILE, SAMPLING
+
+
+def busy_loop(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class RequestProfilerTestCase(AsyncHTTPTestCase):
+    mode = SAMPLING
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.profiler = RequestProfiler(self.output_dir, mode=self.mode, header='X-API-Profile', token='secret')
+        self.adapter = TornadoAdapter(profiler=self.profiler)
+
+        @self.adapter.router.register('test.busy')
+        def busy(context):
+            busy_loop(0.05)
+            return 1
+
+        @self.adapter.router.register('test.other')
+        def other(context):
+            return 2
+        super().setUp()
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.output_dir)
+
+    def get_app(self):
+        return Application([('/(.+)', self.adapter.RequestHandler)])
+
+    def files(self):
+        return sorted(os.listdir(self.output_dir))
+
+    def test_header(self):
+        self.fetch('/test.busy')
+        self.fetch('/test.busy', headers={'X-API-Profile': 'wrong'})
+        self.assertEqual(self.files(), [])
+
+        resp = self.fetch('/test.busy', headers={'X-API-Profile': 'secret'})
+        self.assertEqual(resp.body, b'1')
+        files = self.files()
+        self.assertEqual(len(files), 1)
+        self.assertTrue(files[0].startswith('test.busy-'))
+        self.check_output(os.path.join(self.output_dir, files[0]))
+
+    def check_output(self, path):
+        self.assertTrue(path.endswith('.collapsed'))
+        with open(path) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(any('busy_loop' in line for line in lines))
+        for line in lines:
+            stack, count = line.rsplit(' ', 1)
+            self.assertGreater(int(count), 0)
+
+    def test_toggle(self):
+        # route path 不区分大小写
+        self.profiler.profile_next('Test.Busy')
+        self.fetch('/test.other')
+        self.assertEqual(self.files(), [])
+        self.fetch('/test.busy')
+        self.fetch('/test.busy')
+        self.assertEqual(len(self.files()), 1)
+
+        self.profiler.set_sample_rate('TEST.other', 1)
+        self.fetch('/test.other')
+        self.fetch('/test.other')
+        self.assertEqual(len([name for name in self.files() if name.startswith('test.other-')]), 2)
+        self.profiler.set_sample_rate('test.other', 0)
+        self.fetch('/test.other')
+        self.assertEqual(len(self.files()), 3)
+
+
+class CProfileTestCase(RequestProfilerTestCase):
+    mode = CPROFILE
+
+    def check_output(self, path):
+        self.assertTrue(path.endswith('.pstats'))
+        stats = pstats.Stats(path)
+        self.assertTrue(any(func[2] == 'busy_loop' for func in stats.stats))
@@ -1,6 +1,8 @@
 from unittest import TestCase
+import asyncio
+import time
 from ..route import Router, Context, RouteRegisterFailed, RouteCallFailed
-from ..parameters import Str
+from ..parameters import Str, Int
 from ..interface import interface
 
 
@@ -160,3 +162,248 @@ class RouterTestCase(TestCase):
             router.call('test.path', 5),
             25
         )
+
+    def test_coalesce(self):
+        calls = []
+
+        @self.router.register('test.coalesce', [Str('arg1')], coalesce=True)
+        async def fn(context, args):
+            calls.append(args.arg1)
+            await asyncio.sleep(0.01)
+            return args.arg1 + '-result'
+
+        async def run():
+            return await asyncio.gather(
+                *[self.router.call('test.coalesce', None, dict(arg1='a')) for _ in range(5)],
+                self.router.call('test.coalesce', None, dict(arg1='b')))
+
+        self.assertEqual(asyncio.run(run()), ['a-result'] * 5 + ['b-result'])
+        self.assertEqual(calls, ['a', 'b'])
+        self.assertEqual(self.router._inflight_calls, {})
+
+        # 调用结束后，再次调用会重新执行 interface
+        asyncio.run(run())
+        self.assertEqual(calls, ['a', 'b', 'a', 'b'])
+
+    def test_coalesce_exception(self):
+        calls = []
+
+        @self.router.register('test.coalesce', coalesce=True)
+        async def fn(context):
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            raise ValueError('failed')
+
+        async def run():
+            return await asyncio.gather(
+                *[self.router.call('test.coalesce') for _ in range(3)], return_exceptions=True)
+
+        results = asyncio.run(run())
+        self.assertEqual(len(calls), 1)
+        for result in results:
+            self.assertIsInstance(result, ValueError)
+
+    def test_coalesce_cancel(self):
+        events = []
+
+        @self.router.register('test.coalesce', coalesce=True)
+        async def fn(context):
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                events.append('cancelled')
+                raise
+            return 'result'
+
+        async def run():
+            tasks = [asyncio.ensure_future(self.router.call('test.coalesce')) for _ in range(2)]
+            await asyncio.sleep(0.01)
+            # 只有一个调用者被 cancel 时，共享的调用继续执行
+            tasks[0].cancel()
+            await asyncio.sleep(0.01)
+            self.assertEqual(events, [])
+            self.assertEqual(len(self.router._inflight_calls), 1)
+
+            # 最后一个调用者也被 cancel 后，共享的调用被 cancel
+            tasks[1].cancel()
+            await asyncio.sleep(0.01)
+            self.assertEqual(events, ['cancelled'])
+            self.assertEqual(self.router._inflight_calls, {})
+
+        asyncio.run(run())
+
+    def test_coalesce_disabled(self):
+        calls = []
+
+        @self.router.register('test.path')
+        async def fn(context):
+            calls.append(1)
+            await asyncio.sleep(0.01)
+
+        async def run():
+            await asyncio.gather(*[self.router.call('test.path') for _ in range(3)])
+
+        asyncio.run(run())
+        self.assertEqual(len(calls), 3)
+
+    def test_deadline(self):
+        from ..route import DeadlineExceeded
+
+        @self.router.register('test.outer')
+        def fn(context):
+            self.assertGreater(context.remaining(), 0)
+            result = context.call('test.inner')
+            time.sleep(0.02)
+            context.call('test.inner')
+            return result
+
+        @self.router.register('test.inner')
+        def fn2(context):
+            return context.deadline
+
+        context = Context(self.router)
+        self.assertIsNone(context.remaining())
+        context.set_timeout(0.01)
+        self.assertRaises(DeadlineExceeded, self.router.call, 'test.outer', context)
+
+    def test_context_gather(self):
+        from ..route import DeadlineExceeded
+        running = []
+        max_running = []
+
+        @self.router.register('test.sleep', [Int('ms')])
+        async def sleep(context, args):
+            running.append(args.ms)
+            max_running.append(len(running))
+            try:
+                await asyncio.sleep(args.ms / 1000)
+            finally:
+                running.remove(args.ms)
+            return args.ms
+
+        @self.router.register('test.sync')
+        def sync(context):
+            return context
+
+        @self.router.register('test.fail')
+        async def fail(context):
+            raise ValueError('fail')
+
+        async def gather(calls, timeout=None, **kwargs):
+            context = Context(self.router)
+            if timeout is not None:
+                context.set_timeout(timeout)
+            return await context.gather(calls, **kwargs), context
+
+        started = time.perf_counter()
+        results, context = asyncio.run(gather([('test.sleep', dict(ms=60)), ('test.sleep', dict(ms=50)), 'test.sync']))
+        self.assertEqual(results, [60, 50, context])
+        # 依次调用需要 110ms
+        self.assertLess(time.perf_counter() - started, 0.09)
+
+        max_running.clear()
+        results, _ = asyncio.run(gather([('test.sleep', dict(ms=i)) for i in range(1, 7)], max_concurrency=2))
+        self.assertEqual(results, list(range(1, 7)))
+        self.assertEqual(max(max_running), 2)
+
+        with self.assertRaises(ValueError):
+            asyncio.run(gather([('test.sleep', dict(ms=100)), 'test.fail']))
+        results, _ = asyncio.run(gather([('test.sleep', dict(ms=1)), 'test.fail'], return_exceptions=True))
+        self.assertEqual(results[0], 1)
+        self.assertIsInstance(results[1], ValueError)
+
+        # 共享 context 的截止时间
+        results, _ = asyncio.run(gather(
+            [('test.sleep', dict(ms=1)), ('test.sleep', dict(ms=200))], timeout=0.03, return_exceptions=True))
+        self.assertEqual(results[0], 1)
+        self.assertIsInstance(results[1], DeadlineExceeded)
+        self.assertEqual(running, [])
+        with self.assertRaises(DeadlineExceeded):
+            asyncio.run(gather([('test.sleep', dict(ms=200))], timeout=0.01))
+
+        self.assertEqual(asyncio.run(Context(self.router).call_async('test.sleep', dict(ms=1))), 1)
+        self.assertEqual(asyncio.run(gather([]))[0], [])
+
+    def test_context_memoize(self):
+        calls = []
+
+        @self.router.register('test.permission', [Str('name')], memoize=True)
+        def permission(context, args):
+            calls.append(args.name)
+            return dict(name=args.name)
+
+        @self.router.register('test.config', memoize=True)
+        async def config(context):
+            calls.append('config')
+            await asyncio.sleep(0)
+            return dict(debug=True)
+
+        @self.router.register('test.fail', memoize=True)
+        async def fail(context):
+            calls.append('fail')
+            raise ValueError('fail')
+
+        context = Context(self.router)
+        first = context.call('test.permission', dict(name='a'))
+        self.assertIs(context.call('test.permission', dict(name='a')), first)
+        context.call('test.permission', dict(name='b'))
+        self.assertEqual(calls, ['a', 'b'])
+
+        # 每个 context 有各自的记录
+        Context(self.router).call('test.permission', dict(name='a'))
+        self.assertEqual(calls, ['a', 'b', 'a'])
+
+        context.clear_memo('test.permission')
+        context.call('test.permission', dict(name='a'))
+        self.assertEqual(calls, ['a', 'b', 'a', 'a'])
+
+        async def run():
+            context = Context(self.router)
+            results = await asyncio.gather(context.call('test.config'), context.call('test.config'))
+            results.append(await context.call('test.config'))
+            # 失败的调用不会被记录
+            for _ in range(2):
+                with self.assertRaises(ValueError):
+                    await context.call('test.fail')
+            return results
+
+        calls.clear()
+        results = asyncio.run(run())
+        self.assertEqual(results, [dict(debug=True)] * 3)
+        self.assertEqual(calls, ['config', 'fail', 'fail'])
+
+    def test_context_trusted_call(self):
+        from decimal import Decimal as PyDecimal
+        from ..parameters import Decimal, VerifyFailed
+
+        @self.router.register('test.price', [Str('name'), Decimal('price', min=0)], trusted=True)
+        def price(context, args):
+            return args
+
+        @self.router.register('test.untrusted', [Str('name')])
+        def untrusted(context, args):
+            return args
+
+        @self.router.register('test.outer', [Str('name'), Decimal('price')])
+        def outer(context, args):
+            return context.call('test.price', args, trusted=True)
+
+        # 外层已经转义过的字符串不会被再次转义
+        self.assertEqual(self.router.call('test.outer', None, dict(name='a&b', price='1.5')),
+                         dict(name='a&amp;b', price=PyDecimal('1.5')))
+
+        context = Context(self.router)
+        # 不再执行转换类的 rule，但 min 等检查照常进行
+        with self.assertRaises(VerifyFailed):
+            context.call('test.price', dict(name='x', price=PyDecimal(-1)), trusted=True)
+        with self.assertRaises(VerifyFailed):
+            context.call('test.price', dict(name='x'), trusted=True)
+        with self.assertRaises(RouteCallFailed):
+            context.call('test.untrusted', dict(name='x'), trusted=True)
+        self.assertEqual(context.call('test.price', dict(name='x', price=1), trusted=True).price, 1)
+
+        # 调试模式下还会检查参数值是否已经是格式化之后的类型，转义过的字符串同样不会被重复转义
+        self.router.verify_trusted = True
+        with self.assertRaises(VerifyFailed):
+            context.call('test.price', dict(name='x', price=1), trusted=True)
+        self.assertEqual(self.router.call('test.outer', None, dict(name='a<b', price='1')).name, 'a&lt;b')
@@ -0,0 +1,143 @@
+from unittest import TestCase
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+import urllib.request
+from ..route import Router
+from ..parameters import Str, List, Dict
+from .. import serving
+from ..serving import warmup, Supervisor, ServeFailed, describe_exit_status
+
+
+SERVER_SCRIPT = textwrap.dedent('''
+    import asyncio, os, sys
+    from api_libs.route import Router
+    from api_libs.parameters import Float
+    from api_libs.serving import serve
+
+    router = Router()
+
+    @router.register('pid')
+    def pid(context):
+        return os.getpid()
+
+    @router.register('sleep', [Float('seconds')])
+    async def sleep(context, args):
+        await asyncio.sleep(args.seconds)
+        return 'slept'
+
+    serve(router, int(sys.argv[1]), address='127.0.0.1', processes=2, reuse_port=sys.argv[2] == '1')
+''')
+
+
+class WarmupTestCase(TestCase):
+    def test_warmup(self):
+        router = Router()
+        str_param = Str(regex=r'^a+$')
+        dict_param = Dict('b', format=[Str('c', not_regex=r'x')])
+
+        @router.register('test.path', [List('a', type=str_param), dict_param])
+        def fn(context, args):
+            return args
+
+        warmup(router)
+        self.assertEqual(list(str_param._patterns), ['regex'])
+        self.assertEqual(list(dict_param.specs['format'][0]._patterns), ['not_regex'])
+
+
+class ServeTestCase(TestCase):
+    def get_free_port(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        return port
+
+    def fetch(self, port, path, arguments=None):
+        request = urllib.request.Request(
+            'http://127.0.0.1:{}/api/{}'.format(port, path), data=json.dumps(arguments or {}).encode(),
+            headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return json.loads(response.read().decode())
+
+    def run_server(self, reuse_port):
+        port = self.get_free_port()
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+        proc = subprocess.Popen([sys.executable, '-c', SERVER_SCRIPT, str(port), '1' if reuse_port else '0'], env=env)
+        try:
+            for _ in range(100):
+                try:
+                    self.fetch(port, 'pid')
+                    break
+                except OSError:
+                    time.sleep(0.05)
+
+            pids = set(self.fetch(port, 'pid') for _ in range(20))
+            self.assertNotIn(proc.pid, pids)
+
+            # 关闭服务时，正在处理中的请求会被处理完
+            result = {}
+
+            def slow_request():
+                result['value'] = self.fetch(port, 'sleep', dict(seconds=0.5))
+            thread = threading.Thread(target=slow_request)
+            thread.start()
+            time.sleep(0.2)
+            proc.send_signal(signal.SIGTERM)
+            thread.join()
+            self.assertEqual(result['value'], 'slept')
+            self.assertEqual(proc.wait(timeout=10), 0)
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+
+    def test_serve(self):
+        self.run_server(reuse_port=False)
+
+    def test_serve_reuse_port(self):
+        self.run_server(reuse_port=True)
+
+
+class SupervisorTestCase(TestCase):
+    def test_describe_exit_status(self):
+        self.assertEqual(describe_exit_status(3 << 8), 'exit code 3')
+        self.assertEqual(describe_exit_status(signal.SIGKILL), 'signal {}'.format(signal.SIGKILL))
+
+    def test_too_many_restarts(self):
+        read_fd, write_fd = os.pipe()
+        supervisor = Supervisor(2, {}, max_restarts=2)
+
+        def run_worker(worker_id):
+            # 报告子进程中的信号处理函数与 children 的状态
+            os.write(write_fd, '{} {} {}\n'.format(
+                worker_id, signal.getsignal(signal.SIGTERM) == signal.SIG_DFL, len(supervisor.children)).encode())
+            if worker_id == 0:
+                raise RuntimeError('crashed')
+            time.sleep(30)
+
+        original = serving.run_worker, signal.getsignal(signal.SIGTERM), signal.getsignal(signal.SIGINT)
+        serving.run_worker = run_worker
+        started = time.monotonic()
+        try:
+            with self.assertLogs('api_libs.serving'):
+                self.assertRaises(ServeFailed, supervisor.run)
+        finally:
+            serving.run_worker = original[0]
+            signal.signal(signal.SIGTERM, original[1])
+            signal.signal(signal.SIGINT, original[2])
+            os.close(write_fd)
+
+        # 一直在运行的 worker 1 也被结束并回收了，而不是等到它自己退出
+        self.assertLess(time.monotonic() - started, 10)
+        self.assertEqual(supervisor.children, {})
+        with os.fdopen(read_fd) as f:
+            reports = [line.split() for line in f.read().splitlines()]
+        self.assertEqual(len(reports), 4)
+        self.assertEqual(sorted(report[0] for report in reports), ['0', '0', '0', '1'])
+        self.assertTrue(all(report[1:] == ['True', '0'] for report in reports))
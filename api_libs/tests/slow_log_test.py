@@ -0,0 +1,123 @@
+from unittest import TestCase
+from tornado.testing import AsyncHTTPTestCase
+from tornado.web import Application
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+from api_libs.adapters.tornado_adapter import TornadoAdapter, TornadoContext
+from api_libs.parameters import Int, Str, CanHas
+from api_libs.route import Router
+from api_libs.slow_log import SlowRequestLog, summarize_arguments
+
+
+def build_router():
+    router = Router(TornadoContext)
+
+    @router.register('slow', [Int('ms'), Str('password', required=False), CanHas('payload', required=False)])
+    async def slow(context, args):
+        await asyncio.sleep(args.ms / 1000)
+        return await context.call('nested', dict(ms=args.ms))
+
+    @router.register('nested', [Int('ms')])
+    async def nested(context, args):
+        await asyncio.sleep(args.ms / 1000)
+        return 'x' * 100
+
+    @router.register('fast')
+    def fast(context):
+        return 'ok'
+
+    return router
+
+
+class SummarizeArgumentsTestCase(TestCase):
+    def test_summarize(self):
+        arguments = dict(
+            name='a' * 20, Password='secret', items=list(range(5)), info=dict(token='t', n=1), obj=object())
+        summary = summarize_arguments(arguments, ['password', 'TOKEN'], max_string_length=5, max_items=4)
+        self.assertEqual(summary['name'], 'aaaaa...(20 chars)')
+        self.assertEqual(summary['Password'], '***')
+        self.assertEqual(summary['items'], [0, 1, 2, 3, '...(1 more)'])
+        self.assertEqual(summary['info'], {'token': '***', 'n': 1})
+        self.assertEqual(summary['...'], '1 more')
+        self.assertNotIn('obj', summary)
+
+        summary = summarize_arguments(dict(data=['x' * 50] * 10), max_length=100)
+        self.assertEqual(summary[:100], json.dumps(dict(data=['x' * 50] * 10))[:100])
+        self.assertTrue(summary.endswith('chars)'))
+
+
+class SlowRequestLogTestCase(TestCase):
+    def test_rate_limit(self):
+        output_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(output_dir, 'slow.jsonl')
+            slow_log = SlowRequestLog(threshold=0.1, route_thresholds={'Special': 1}, path=path, max_per_second=2)
+            self.assertFalse(slow_log.observe('a', 0.05))
+            self.assertFalse(slow_log.observe('special', 0.5))
+            results = [slow_log.observe('a', 0.2) for _ in range(5)]
+            self.assertEqual(results, [True, True, False, False, False])
+            time.sleep(0.6)
+            self.assertTrue(slow_log.observe('a', 0.2))
+            slow_log.close()
+
+            with open(path) as f:
+                entries = [json.loads(line) for line in f]
+            self.assertEqual([entry['dropped'] for entry in entries], [0, 0, 3])
+            self.assertEqual(entries[0]['duration_ms'], 200)
+        finally:
+            shutil.rmtree(output_dir)
+
+
+class TornadoAdapterSlowLogTestCase(AsyncHTTPTestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.output_dir, 'slow.jsonl')
+        self.slow_log = SlowRequestLog(threshold=0.02, path=self.path, redact_keys=['password'], max_string_length=10)
+        super().setUp()
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.output_dir)
+
+    def get_app(self):
+        adapter = TornadoAdapter(build_router(), slow_log=self.slow_log)
+        return Application([('/api/(.+)', adapter.RequestHandler)])
+
+    def call(self, path, arguments):
+        return self.fetch('/api/' + path, method='POST', body=json.dumps(arguments),
+                          headers={'Content-Type': 'application/json'})
+
+    def entries(self):
+        self.slow_log.close()
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_slow_request(self):
+        resp = self.call('slow', dict(ms=15, password='secret', payload='p' * 100))
+        self.assertEqual(resp.code, 200)
+        self.call('fast', {})
+
+        entries = self.entries()
+        self.assertEqual(len(entries), 1)
+        entry = entries[0]
+        self.assertEqual(entry['route'], 'slow')
+        self.assertEqual(entry['status'], 200)
+        self.assertGreaterEqual(entry['duration_ms'], 30)
+        self.assertEqual(entry['response_size'], len(resp.body))
+        self.assertEqual(entry['arguments'], dict(ms=15, password='***', payload='pppppppppp...(100 chars)'))
+        self.assertEqual(set(entry['phases']), {'parse', 'validate', 'execute', 'serialize'})
+        self.assertGreaterEqual(entry['phases']['execute'], 30)
+        self.assertGreaterEqual(entry['nested']['nested']['execute'], 15)
+
+    def test_error(self):
+        self.slow_log.threshold = 0
+        self.call('slow', dict(ms='x'))
+        entries = self.entries()
+        self.assertEqual(entries[0]['status'], 500)
+        self.assertIsNone(entries[0]['response_size'])
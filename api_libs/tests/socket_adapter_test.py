@@ -0,0 +1,136 @@
+from unittest import TestCase
+import asyncio
+import os
+import tempfile
+from api_libs.adapters.socket_adapter import SocketAdapter, SocketClient, SocketContext, RemoteCallFailed, \
+    write_frame
+from api_libs.parameters import Float
+
+
+class SocketAdapterTestCase(TestCase):
+    def setUp(self):
+        self.adapter = SocketAdapter(max_concurrency=8)
+        self.contexts = set()
+
+        @self.adapter.router.register('test.sleep', [Float('seconds')])
+        async def fn(context, args):
+            self.assertIsInstance(context, SocketContext)
+            self.contexts.add(id(context))
+            await asyncio.sleep(args.seconds)
+            return args.seconds
+
+        self.counter_calls = 0
+
+        @self.adapter.router.register('test.counter', memoize=True)
+        def counter(context):
+            self.counter_calls += 1
+            return self.counter_calls
+
+        @self.adapter.router.register('test.outer')
+        def outer(context):
+            return [context.call('test.counter'), context.call('test.counter')]
+
+        @self.adapter.router.register('test.fail')
+        def fn2(context):
+            raise ValueError('failed')
+
+    def run_with_client(self, test, unix=False):
+        async def run():
+            if unix:
+                path = os.path.join(tempfile.mkdtemp(), 'api.sock')
+                server = await self.adapter.start_unix_server(path)
+                client = await SocketClient.connect_unix(path)
+            else:
+                server = await self.adapter.start_server('127.0.0.1', 0)
+                client = await SocketClient.connect('127.0.0.1', server.sockets[0].getsockname()[1])
+            try:
+                return await test(client)
+            finally:
+                await client.close()
+                server.close()
+                await server.wait_closed()
+        return asyncio.run(run())
+
+    def test_pipelined_calls(self):
+        async def test(client):
+            order = []
+
+            async def call(seconds):
+                result = await client.call('test.sleep', dict(seconds=seconds))
+                order.append(result)
+                return result
+
+            results = await asyncio.gather(call(0.05), call(0), call(0.02))
+            self.assertEqual(results, [0.05, 0, 0.02])
+            # 结果按完成的先后顺序返回
+            self.assertEqual(order, [0, 0.02, 0.05])
+
+        self.run_with_client(test)
+        self.assertEqual(len(self.contexts), 1)
+
+    def test_memo_per_message(self):
+        async def test(client):
+            return [await client.call('test.outer'), await client.call('test.outer')]
+        # 同一条消息中的调用共享 memoize 的结果，不同消息之间不共享
+        self.assertEqual(self.run_with_client(test), [[1, 1], [2, 2]])
+
+    def test_unix_socket(self):
+        async def test(client):
+            return await client.call('test.sleep', dict(seconds=0))
+        self.assertEqual(self.run_with_client(test, unix=True), 0)
+
+    def test_errors(self):
+        async def test(client):
+            with self.assertRaises(RemoteCallFailed) as cm:
+                await client.call('test.not_exists')
+            self.assertEqual(cm.exception.status, 400)
+
+            with self.assertRaises(RemoteCallFailed) as cm:
+                await client.call('test.fail')
+            self.assertEqual(cm.exception.status, 500)
+
+            # 格式不合法的消息不会导致连接断开
+            write_frame(client.writer, b'abc')
+            self.assertEqual(await client.call('test.sleep', dict(seconds=0)), 0)
+
+        self.run_with_client(test)
+
+    def test_peer_disconnected(self):
+        class BrokenWriter:
+            '''写出时对方已断开连接的 writer'''
+            def is_closing(self):
+                return False
+
+            def write(self, data):
+                pass
+
+            async def drain(self):
+                raise ConnectionResetError('reset by peer')
+
+            def close(self):
+                pass
+
+        async def run():
+            writer = BrokenWriter()
+            # 服务端：回复无法送达时直接丢弃，不抛出异常
+            await self.adapter._call(
+                writer, SocketContext(self.adapter.router, writer), 1, 'test.sleep', dict(seconds=0))
+
+            # 客户端：以 RemoteCallFailed 的形式抛出
+            client = SocketClient(asyncio.StreamReader(), writer)
+            with self.assertRaises(RemoteCallFailed) as cm:
+                await client.call('test.sleep', dict(seconds=0))
+            self.assertIsNone(cm.exception.status)
+            client._read_task.cancel()
+
+        asyncio.run(run())
+
+    def test_frame_too_large(self):
+        self.adapter.max_frame_size = 10
+
+        async def test(client):
+            with self.assertRaises(RemoteCallFailed) as cm:
+                await client.call('test.sleep', dict(seconds=0))
+            self.assertIsNone(cm.exception.status)
+
+        self.run_with_client(test)
@@ -0,0 +1,87 @@
+from unittest import TestCase
+import asyncio
+from .. import timing
+from ..route import Router
+from ..parameters import Int, VerifyFailed
+
+
+class PhaseTimerTestCase(TestCase):
+    def setUp(self):
+        self.router = Router()
+
+        @self.router.register('inner', [Int('x')])
+        def inner(context, args):
+            return args.x
+
+        @self.router.register('outer')
+        async def outer(context):
+            await asyncio.sleep(0.01)
+            return context.call('inner', dict(x=1)) + context.call('inner', dict(x=2))
+
+    def run_with_timer(self, fn):
+        timer = timing.PhaseTimer('outer')
+        token = timing.activate(timer)
+        try:
+            return fn(), timer
+        finally:
+            timing.deactivate(token)
+
+    def test_phases(self):
+        result, timer = self.run_with_timer(lambda: asyncio.run(self.router.call('outer')))
+        self.assertEqual(result, 3)
+        totals = timer.totals()
+        self.assertEqual([(route, phase) for route, phase, _ in totals], [
+            ('outer', 'validate'), ('inner', 'validate'), ('inner', 'execute'), ('outer', 'execute')])
+        # 同一个 route 的同一个阶段会被合并
+        self.assertEqual(len(timer.phases), 6)
+        self.assertGreaterEqual(totals[3][2], 0.01)
+
+        header = timer.server_timing()
+        self.assertTrue(header.startswith('validate;dur='))
+        self.assertIn(', validate;desc="inner";dur=', header)
+
+    def test_failed_validation(self):
+        def call():
+            with self.assertRaises(VerifyFailed):
+                self.router.call('inner', None, dict(x='abc'))
+        _, timer = self.run_with_timer(call)
+        self.assertEqual([(route, phase) for route, phase, _ in timer.phases], [('inner', 'validate')])
+
+    def test_disabled(self):
+        self.assertIsNone(timing.current_timer())
+        self.assertEqual(self.router.call('inner', None, dict(x=1)), 1)
+
+
+class AllocationTrackerTestCase(TestCase):
+    def test_allocations(self):
+        router = Router()
+
+        @router.register('alloc', [Int('size')])
+        def alloc(context, args):
+            temp = bytearray(args.size)     # 只在执行期间存在
+            del temp
+            return bytearray(args.size // 10)
+
+        tracker = timing.AllocationTracker.create('alloc')
+        self.assertIsNotNone(tracker)
+        # 同一时间只能有一个 tracker
+        self.assertIsNone(timing.AllocationTracker.create('alloc'))
+        token = timing.activate(tracker)
+        tracker.start()
+        try:
+            result = router.call('alloc', None, dict(size=1000000))
+        finally:
+            tracker.stop()
+            timing.deactivate(token)
+
+        allocations = {(route, phase): (peak, retained) for route, phase, peak, retained in tracker.allocation_totals()}
+        peak, retained = allocations[('alloc', 'execute')]
+        self.assertGreaterEqual(peak, 1000000)
+        self.assertTrue(100000 <= retained < 200000)
+        self.assertLess(allocations[('alloc', 'validate')][0], 100000)
+        self.assertGreaterEqual(tracker.peak_bytes, 1000000)
+        self.assertGreaterEqual(tracker.retained_bytes, 100000)
+        self.assertEqual(len(result), 100000)
+
+        self.assertIsNotNone(timing.AllocationTracker.create('alloc'))
+        timing.AllocationTracker._active = False
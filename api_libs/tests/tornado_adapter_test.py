@@ -1,13 +1,18 @@
 from tornado.web import Application
-from tornado.testing import AsyncHTTPTestCase
+from tornado.testing import AsyncHTTPTestCase, gen_test
+from tornado.websocket import websocket_connect
 from tornado.httpclient import AsyncHTTPClient
 import tornado
 import json
+import asyncio
 import re
 import urllib.parse
-from api_libs.adapters.tornado_adapter import TornadoAdapter
-from api_libs.parameters import Int
+from api_libs.adapters.tornado_adapter import TornadoAdapter, TornadoContext
+from api_libs.parameters import Int, Float
 from api_libs.route import Router, Context
+from api_libs.admission import RouteLimiter
+from api_libs.metrics import RouterMetrics
+from api_libs.timing import AllocationTracker
 
 
 class BaseTestCase(AsyncHTTPTestCase):
@@ -218,3 +223,221 @@ class TornadoAdapterCustomRouterTestCase(BaseTestCase):
 
         resp = self.fetch('/test.path.2')
         self.assertEqual(self.parse_resp(resp), True)
+
+
+class TornadoAdapterAdmissionTestCase(BaseTestCase):
+    def get_adapter(self):
+        adapter = TornadoAdapter()
+
+        @adapter.router.register('test.limited', limiter=RouteLimiter(rate=1, burst=1))
+        def fn(context):
+            return True
+
+        return adapter
+
+    def test_rejected(self):
+        resp = self.fetch('/test.limited')
+        self.assertEqual(self.parse_resp(resp), True)
+
+        resp = self.fetch('/test.limited')
+        self.assertEqual(resp.code, 429)
+
+
+class TornadoAdapterDeadlineTestCase(BaseTestCase):
+    def get_adapter(self):
+        self.events = []
+        adapter = TornadoAdapter(default_timeout=1, timeout_header='X-Request-Timeout', cancel_on_close=True)
+
+        @adapter.router.register('test.sleep', [Float('seconds')])
+        async def fn(context, args):
+            self.events.append(context.remaining())
+            try:
+                await asyncio.sleep(args.seconds)
+            except asyncio.CancelledError:
+                self.events.append('cancelled')
+                raise
+            return True
+
+        return adapter
+
+    def fetch_sleep(self, seconds, **kwargs):
+        return self.fetch('/test.sleep?arguments={"seconds":%s}' % seconds, **kwargs)
+
+    def test_default_timeout(self):
+        resp = self.fetch_sleep(0)
+        self.assertEqual(self.parse_resp(resp), True)
+        self.assertLessEqual(self.events[0], 1)
+
+    def test_timeout_header(self):
+        resp = self.fetch_sleep(0.5, headers={'X-Request-Timeout': '0.05'})
+        self.assertEqual(resp.code, 504)
+        self.assertEqual(self.events[1], 'cancelled')
+
+        resp = self.fetch_sleep(0, headers={'X-Request-Timeout': 'abc'})
+        self.assertEqual(resp.code, 400)
+
+    def test_cancel_on_close(self):
+        # 客户端等待超时后会主动断开连接
+        self.assertRaises(Exception, self.fetch_sleep, 0.5, request_timeout=0.05)
+        self.io_loop.run_sync(lambda: asyncio.sleep(0.05))
+        self.assertEqual(self.events[-1], 'cancelled')
+
+
+class TornadoAdapterWebSocketTestCase(BaseTestCase):
+    def get_adapter(self):
+        adapter = TornadoAdapter(ws_max_concurrency=self.max_concurrency)
+        self.contexts = set()
+
+        @adapter.router.register('test.sleep', [Float('seconds')])
+        async def fn(context, args):
+            self.contexts.add(id(context))
+            await asyncio.sleep(args.seconds)
+            return args.seconds
+
+        @adapter.router.register('test.fail')
+        def fn2(context):
+            raise ValueError('failed')
+
+        return adapter
+
+    max_concurrency = 16
+
+    def get_app(self):
+        return Application([
+            ('/ws', self.adapter.WebSocketHandler),
+        ])
+
+    async def call_all(self, messages):
+        conn = await websocket_connect(self.get_url('/ws').replace('http', 'ws'))
+        for message in messages:
+            conn.write_message(json.dumps(message))
+        responses = []
+        for _ in messages:
+            responses.append(json.loads(await conn.read_message()))
+        conn.close()
+        return responses
+
+    @gen_test
+    async def test_multiplex(self):
+        responses = await self.call_all([
+            dict(id=1, path='test.sleep', arguments=dict(seconds=0.05)),
+            dict(id=2, path='test.sleep', arguments=dict(seconds=0)),
+            dict(id=3, path='test.not_exists'),
+            dict(id=4, path='test.fail'),
+            dict(id=5, path='test.sleep', arguments=dict(seconds='abc')),
+            'abc',
+        ])
+        responses = {response['id']: response for response in responses}
+        self.assertEqual(responses[2], dict(id=2, result=0))
+        self.assertEqual(responses[1], dict(id=1, result=0.05))
+        self.assertEqual(responses[3]['status'], 400)
+        self.assertEqual(responses[4]['status'], 500)
+        self.assertEqual(responses[5]['status'], 400)
+        self.assertEqual(responses[None]['status'], 400)
+        # 同一个连接上的调用共享同一个 context
+        self.assertEqual(len(self.contexts), 1)
+
+
+class TornadoAdapterWebSocketConcurrencyTestCase(TornadoAdapterWebSocketTestCase):
+    max_concurrency = 1
+
+    @gen_test
+    async def test_multiplex(self):
+        responses = await self.call_all([
+            dict(id=1, path='test.sleep', arguments=dict(seconds=0.05)),
+            dict(id=2, path='test.sleep', arguments=dict(seconds=0)),
+        ])
+        # 并发数为 1 时，调用会一个接一个地执行
+        self.assertEqual([response['id'] for response in responses], [1, 2])
+
+
+class TornadoAdapterPhaseTimingTestCase(BaseTestCase):
+    def get_adapter(self):
+        self.reports = []
+        self.metrics = RouterMetrics()
+        return TornadoAdapter(
+            Router(TornadoContext, metrics=self.metrics), server_timing=True,
+            phase_hook=lambda req_handler, route_path, timer: self.reports.append((route_path, timer)))
+
+    def test_server_timing(self):
+        @self.adapter.router.register('test.inner', [Int('x')])
+        def inner(context, args):
+            return args.x
+
+        @self.adapter.router.register('test.outer')
+        async def outer(context):
+            await asyncio.sleep(0.01)
+            return context.call('test.inner', dict(x=1))
+
+        resp = self.fetch('/test.outer')
+        self.assertEqual(self.parse_resp(resp), 1)
+        entries = [entry.split(';') for entry in resp.headers['Server-Timing'].split(', ')]
+        names = [entry[0] if len(entry) == 2 else entry[0] + ';' + entry[1] for entry in entries]
+        self.assertEqual(names, [
+            'parse', 'validate', 'validate;desc="test.inner"', 'execute;desc="test.inner"', 'execute', 'serialize'])
+        execute = dict(entries[4:5])
+        self.assertGreaterEqual(float(execute['execute'][len('dur='):]), 10)
+
+        route_path, timer = self.reports[0]
+        self.assertEqual(route_path, 'test.outer')
+        self.assertEqual(timer.route, 'test.outer')
+
+        phases = self.metrics.snapshot()
+        self.assertEqual(sorted(phases['test.outer']['phases']), ['execute', 'parse', 'serialize', 'validate'])
+        self.assertEqual(sorted(phases['test.inner']['phases']), ['execute', 'validate'])
+
+    def test_failed_request(self):
+        @self.adapter.router.register('test.path', [Int('x')])
+        def fn(context, args):
+            return args.x
+
+        resp = self.fetch('/test.path?arguments=' + urllib.parse.quote(json.dumps(dict(x='abc'))))
+        self.assertEqual(resp.code, 500)
+        # 请求失败时，phase_hook 依然会被调用
+        route_path, timer = self.reports[0]
+        self.assertEqual([phase for _, phase, _ in timer.phases], ['parse', 'validate'])
+
+
+class TornadoAdapterAllocationTestCase(BaseTestCase):
+    def get_adapter(self):
+        self.metrics = RouterMetrics()
+        self.reports = []
+        return TornadoAdapter(
+            Router(TornadoContext, metrics=self.metrics), allocation_sample_rate=1,
+            phase_hook=lambda req_handler, route_path, timer: self.reports.append(timer))
+
+    def test_allocations(self):
+        @self.adapter.router.register('test.path')
+        def fn(context):
+            return ['{:0100}'.format(i) for i in range(10000)]
+
+        resp = self.fetch('/test.path')
+        self.assertEqual(len(self.parse_resp(resp)), 10000)
+        self.assertIsInstance(self.reports[0], AllocationTracker)
+
+        allocations = self.metrics.snapshot()['test.path']['allocations']
+        self.assertEqual(sorted(allocations), ['execute', 'parse', 'request', 'serialize', 'validate'])
+        self.assertGreater(allocations['execute']['peak_max'], 1000000)
+        self.assertGreater(allocations['serialize']['peak_max'], 1000000)
+        self.assertIn('api_libs_route_phase_peak_bytes_count{route="test.path",phase="execute"} 1',
+                      self.metrics.prometheus_text())
+
+    def test_setup_failed(self):
+        @self.adapter.router.register('test.path')
+        def fn(context):
+            return 1
+
+        def start_span(req_handler, route_path):
+            raise ValueError('span failed')
+        self.adapter.tracer = object()
+        self.adapter.start_span = start_span
+
+        resp = self.fetch('/test.path')
+        self.assertEqual(resp.code, 500)
+        # 准备工作出错时，tracker 依然会被结束，不会一直占用 tracemalloc
+        self.assertFalse(AllocationTracker._active)
+
+        self.adapter.tracer = None
+        resp = self.fetch('/test.path')
+        self.assertEqual(self.parse_resp(resp), 1)
+        self.assertIsInstance(self.reports[-1], AllocationTracker)
@@ -0,0 +1,204 @@
+from unittest import TestCase
+from tornado.testing import AsyncHTTPTestCase, gen_test
+from tornado.web import Application
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+from api_libs import tracing
+from api_libs.client import APIClient
+from api_libs.adapters.tornado_adapter import TornadoAdapter, TornadoContext
+from api_libs.parameters import Int, VerifyFailed
+from api_libs.route import Router
+from api_libs.tracing import Tracer, Span, InMemoryExporter, FileExporter, parse_traceparent, current_span
+
+TRACE_ID = '0af7651916cd43dd8448eb211c80319c'
+PARENT_ID = 'b7ad6b7169203331'
+
+
+def build_router(context_cls=None):
+    router = Router(context_cls)
+
+    @router.register('outer', [Int('x')])
+    def outer(context, args):
+        return context.call('inner', dict(x=args.x)) + 1
+
+    @router.register('inner', [Int('x', min=0)])
+    def inner(context, args):
+        return args.x
+
+    @router.register('async_outer')
+    async def async_outer(context):
+        await asyncio.sleep(0)
+        return await context.call('async_inner') + context.call('inner', dict(x=1))
+
+    @router.register('async_inner')
+    async def async_inner(context):
+        return 1
+
+    return router
+
+
+class TraceparentTestCase(TestCase):
+    def test_parse(self):
+        self.assertEqual(parse_traceparent('00-{}-{}-01'.format(TRACE_ID, PARENT_ID)), (TRACE_ID, PARENT_ID, True))
+        self.assertEqual(parse_traceparent('00-{}-{}-00'.format(TRACE_ID.upper(), PARENT_ID)), (TRACE_ID, PARENT_ID, False))
+        for value in ['', 'abc', 'ff-{}-{}-01'.format(TRACE_ID, PARENT_ID), '00-{}-{}-01'.format('0' * 32, PARENT_ID)]:
+            self.assertIsNone(parse_traceparent(value))
+
+
+class RouterTracingTestCase(TestCase):
+    def setUp(self):
+        self.exporter = InMemoryExporter()
+        self.tracer = Tracer(self.exporter)
+        self.router = build_router()
+
+    def trace(self, fn):
+        root = self.tracer.start_trace('test')
+        token = tracing.activate(root)
+        try:
+            return fn()
+        finally:
+            tracing.deactivate(token)
+            root.finish()
+
+    def spans(self):
+        return {(span.kind, span.name): span for span in self.exporter.spans}
+
+    def test_nested_calls(self):
+        self.assertEqual(self.trace(lambda: self.router.call('outer', None, dict(x=1))), 2)
+        self.assertEqual(len(self.exporter.spans), 5)
+        root = self.exporter.spans[-1]
+        self.assertIsNone(root.parent_id)
+        self.assertTrue(all(span.trace_id == root.trace_id for span in self.exporter.spans))
+
+        spans = self.spans()
+        outer, inner = spans[('route', 'outer')], spans[('route', 'inner')]
+        self.assertEqual(outer.parent_id, root.span_id)
+        self.assertEqual(inner.parent_id, outer.span_id)
+        self.assertNotIn('nested', outer.attributes)
+        self.assertTrue(inner.attributes['nested'])
+        validate_parents = {span.parent_id for span in self.exporter.spans if span.kind == 'validate'}
+        self.assertEqual(validate_parents, {outer.span_id, inner.span_id})
+        self.assertGreaterEqual(outer.duration, inner.duration)
+
+    def test_async_nested_calls(self):
+        result = self.trace(lambda: asyncio.run(self.router.call('async_outer')))
+        self.assertEqual(result, 2)
+        spans = self.spans()
+        outer = spans[('route', 'async_outer')]
+        self.assertEqual(spans[('route', 'async_inner')].parent_id, outer.span_id)
+        self.assertEqual(spans[('route', 'inner')].parent_id, outer.span_id)
+
+    def test_error(self):
+        with self.assertRaises(VerifyFailed):
+            self.trace(lambda: self.router.call('outer', None, dict(x=-1)))
+        spans = self.spans()
+        self.assertIn('VerifyFailed', spans[('route', 'inner')].error)
+        self.assertIn('VerifyFailed', spans[('route', 'outer')].error)
+        self.assertIsNone(spans[('route', 'outer')].attributes.get('nested'))
+
+    def test_not_traced(self):
+        self.assertEqual(self.router.call('outer', None, dict(x=1)), 2)
+        self.assertIsNone(current_span())
+        self.tracer.sample_rate = 0
+        self.assertIsNone(self.tracer.start_trace('test'))
+        self.assertEqual(self.exporter.spans, [])
+
+
+class TornadoAdapterTracingTestCase(AsyncHTTPTestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.exporter = InMemoryExporter()
+        self.tracer = Tracer(self.exporter)
+        super().setUp()
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.output_dir)
+
+    def get_app(self):
+        adapter = TornadoAdapter(build_router(TornadoContext), tracer=self.tracer)
+        return Application([('/api/(.+)', adapter.RequestHandler)])
+
+    def call(self, path, arguments, headers=None):
+        return self.fetch('/api/' + path, method='POST', body=json.dumps(arguments),
+                          headers=dict({'Content-Type': 'application/json'}, **(headers or {})))
+
+    def test_request_span(self):
+        resp = self.call('outer', dict(x=1), {'traceparent': '00-{}-{}-01'.format(TRACE_ID, PARENT_ID)})
+        self.assertEqual(resp.body, b'2')
+        server = self.exporter.spans[-1]
+        self.assertEqual(server.kind, 'server')
+        self.assertEqual(server.name, 'POST outer')
+        self.assertEqual((server.trace_id, server.parent_id), (TRACE_ID, PARENT_ID))
+        self.assertEqual(server.attributes['http.status_code'], 200)
+        self.assertEqual([span.name for span in self.exporter.spans if span.kind == 'route'], ['inner', 'outer'])
+
+    def test_sampling(self):
+        # 上游没有采样此请求
+        self.call('outer', dict(x=1), {'traceparent': '00-{}-{}-00'.format(TRACE_ID, PARENT_ID)})
+        self.tracer.sample_rate = 0
+        self.call('outer', dict(x=1))
+        self.assertEqual(self.exporter.spans, [])
+
+        self.tracer.respect_parent = False
+        self.tracer.sample_rate = 1
+        self.call('outer', dict(x=1), {'traceparent': '00-{}-{}-00'.format(TRACE_ID, PARENT_ID)})
+        self.assertEqual(len(self.exporter.spans), 5)
+
+    def test_error_status(self):
+        self.call('outer', dict(x=-1))
+        server = self.exporter.spans[-1]
+        self.assertEqual(server.attributes['http.status_code'], 500)
+        self.assertIsNotNone(server.error)
+
+    @gen_test
+    async def test_client_propagation(self):
+        root = Tracer(InMemoryExporter()).start_trace('client')
+        token = tracing.activate(root)
+        client = APIClient(self.get_url('/api/'))
+        try:
+            self.assertEqual(await client.call('outer', dict(x=1)), 2)
+        finally:
+            tracing.deactivate(token)
+            await client.close()
+        server = self.exporter.spans[-1]
+        self.assertEqual((server.trace_id, server.parent_id), (root.trace_id, root.span_id))
+
+    def test_file_exporter(self):
+        path = os.path.join(self.output_dir, 'spans.jsonl')
+        self.tracer.exporter = FileExporter(path)
+        self.call('outer', dict(x=1))
+        self.tracer.exporter.close()
+        with open(path) as f:
+            spans = [json.loads(line) for line in f]
+        self.assertEqual([span['kind'] for span in spans], ['validate', 'validate', 'route', 'route', 'server'])
+        self.assertGreater(spans[-1]['duration_ms'], 0)
+
+    def test_file_exporter_buffer(self):
+        path = os.path.join(self.output_dir, 'buffered.jsonl')
+        exporter = FileExporter(path, buffer_size=1000)
+        span = Span(None, 'test.path', 'route', TRACE_ID, PARENT_ID)
+        span.duration = 0.001
+
+        async def run():
+            # 缓冲区没满时不会写入文件
+            exporter.export([span])
+            self.assertFalse(os.path.exists(path))
+            # 缓冲区满了之后，在线程池中写入
+            exporter.export([span] * 20)
+            for _ in range(100):
+                if os.path.exists(path) and os.path.getsize(path):
+                    break
+                await asyncio.sleep(0.01)
+
+        asyncio.run(run())
+        exporter.flush()
+        with open(path) as f:
+            self.assertEqual(len(f.read().splitlines()), 21)
+        exporter.export([span])
+        exporter.close()
+        with open(path) as f:
+            self.assertEqual(len(f.read().splitlines()), 22)
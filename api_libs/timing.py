@@ -0,0 +1,244 @@
+'''
+记录一次请求中各阶段的耗时：
+
+* parse: adapter 从 HTTP 请求中解析出 arguments（`TornadoAdapter.extract_arguments()`）
+* validate: interface 根据参数定义检查 arguments、构建 `Arguments` 对象
+* execute: interface 函数本身的执行，对于 async interface 是从调用到 coroutine 执行完毕的时间
+* serialize: adapter 通过 output_formatter 把返回值转换成输出内容
+
+只有在当前请求启用了 `PhaseTimer` 时才会记录（见 `TornadoAdapter` 的 server_timing、phase_hook 参数），
+没有启用时，每次调用只多出一次 ContextVar 的读取。
+
+通过 `Context.call()` 发起的嵌套调用，其 validate / execute 阶段会记在被调用的 route 名下；
+注意外层 interface 的 execute 阶段包含了嵌套调用的时间。
+
+`AllocationTracker` 是 PhaseTimer 的子类，除了耗时之外，还会通过 tracemalloc 记录各阶段分配的内存。
+'''
+import contextvars
+import inspect
+import time
+import tracemalloc
+from . import tracing
+
+__all__ = ['PhaseTimer', 'AllocationTracker', 'current_timer']
+
+
+_current_timer = contextvars.ContextVar('api_libs_phase_timer', default=None)
+# 当前正在被调用的 route，由 Router 设置，用于把 interface 中记录的阶段归到对应的 route 名下
+# （参数检查的 profiling 也会用到它，见 `api_libs.parameters.profiling`）
+_current_route = contextvars.ContextVar('api_libs_phase_route', default=None)
+
+
+def current_timer():
+    '''返回当前请求启用的 PhaseTimer，没有启用时返回 None'''
+    return _current_timer.get()
+
+
+def current_route():
+    '''返回当前正在被调用的 route。只有在启用了 PhaseTimer 或参数检查 profiling 时才会被记录，否则为 None'''
+    return _current_route.get()
+
+
+def activate(timer):
+    '''为当前请求（当前的 asyncio task 及它之后创建的 task）启用 timer，返回用于 deactivate() 的 token'''
+    return _current_timer.set(timer)
+
+
+def deactivate(token):
+    _current_timer.reset(token)
+
+
+def call_in_route(route, fn, *args, **kwargs):
+    '''调用 fn，期间记录的阶段都归到 route 名下'''
+    token = _current_route.set(route)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _current_route.reset(token)
+
+
+class PhaseTimer:
+    '''
+    Attributes:
+
+    * route: 此次请求所调用的 route
+    * phases: [(route, phase, seconds), ...]，按记录的顺序排列。
+      route 为 None 的是请求本身的阶段（parse、serialize），它们属于 self.route
+    '''
+    def __init__(self, route=None):
+        self.route = route
+        self.phases = []
+
+    def start(self):
+        '''请求开始处理时调用'''
+        pass
+
+    def stop(self):
+        '''请求处理完毕时调用'''
+        pass
+
+    def begin(self):
+        '''标记一个阶段的开始，返回值需传给 add()'''
+        return time.perf_counter()
+
+    def add(self, phase, started, route=None):
+        '''记录一个从 started（begin() 的返回值）开始、到现在结束的阶段'''
+        self.phases.append((route, phase, time.perf_counter() - started))
+
+    def track(self, phase, route, fn, *args, **kwargs):
+        '''调用 fn 并把它记录为一个阶段。若 fn 返回 coroutine / future，会在它执行完毕时再记录'''
+        started = self.begin()
+        try:
+            ret_val = fn(*args, **kwargs)
+        except Exception:
+            self.add(phase, started, route)
+            raise
+        if inspect.isawaitable(ret_val):
+            return self._track_async(phase, route, started, ret_val)
+        self.add(phase, started, route)
+        return ret_val
+
+    async def _track_async(self, phase, route, started, awaitable):
+        try:
+            return await awaitable
+        finally:
+            self.add(phase, started, route)
+
+    def totals(self):
+        '''把同一个 route 的同一个阶段合并起来，返回 [(route, phase, seconds), ...]，按首次出现的顺序排列'''
+        totals = {}
+        for route, phase, seconds in self.phases:
+            key = (route if route is not None else self.route, phase)
+            totals[key] = totals.get(key, 0) + seconds
+        return [(route, phase, seconds) for (route, phase), seconds in totals.items()]
+
+    def server_timing(self):
+        '''生成 Server-Timing HTTP Header 的值，例如：
+
+            parse;dur=0.052, validate;dur=0.210, execute;dur=12.503, validate;desc="user.get";dur=0.101, ...
+
+        dur 的单位是毫秒。此次请求所调用的 route 的阶段不带 desc，嵌套调用的阶段通过 desc 注明 route'''
+        entries = []
+        for route, phase, seconds in self.totals():
+            if route is None or route == self.route:
+                entries.append('{};dur={:.3f}'.format(phase, seconds * 1000))
+            else:
+                entries.append('{};desc="{}";dur={:.3f}'.format(
+                    phase, route.replace('\\', '\\\\').replace('"', '\\"'), seconds * 1000))
+        return ', '.join(entries)
+
+
+def record_interface_call(fn, sort_out_arguments, arguments, kwargs, *fn_args):
+    '''供 interface 使用：分别记录 validate 和 execute 两个阶段。
+    当前请求被追踪时（见 `api_libs.tracing`），参数检查还会被记录为一个 validate span'''
+    timer = _current_timer.get()
+    route = _current_route.get()
+    started = timer.begin() if timer is not None else None
+    try:
+        if tracing.current_span() is not None:
+            sorted_args = tracing.trace_call('validate', 'validate', sort_out_arguments, arguments, kwargs)
+        else:
+            sorted_args = sort_out_arguments(arguments, kwargs)
+    finally:
+        if timer is not None:
+            timer.add('validate', started, route)
+    if timer is None:
+        return fn(*fn_args, **sorted_args)
+    return timer.track('execute', route, fn, *fn_args, **sorted_args)
+
+
+class _AllocationMark:
+    def __init__(self, started, start_bytes):
+        self.started = started
+        self.start_bytes = start_bytes
+        self.peak_bytes = start_bytes
+
+
+class AllocationTracker(PhaseTimer):
+    '''在记录各阶段耗时的同时，通过 tracemalloc 记录各阶段的内存分配情况
+
+    tracemalloc 会显著拖慢整个进程，因此只应对抽样选出的少数请求使用（见 `TornadoAdapter` 的 allocation_sample_rate 参数）。
+    tracemalloc 统计的是整个进程的内存分配，同一时间只允许有一个 AllocationTracker 在工作（见 `create()`），
+    但是 event loop 中并发处理的其他请求分配的内存也会被计算进去。
+
+    Attributes:
+
+    * allocations: [(route, phase, peak_bytes, retained_bytes), ...]。
+      peak_bytes 是阶段执行期间内存用量比阶段开始时最多高出多少，retained_bytes 是阶段结束时比开始时多出的内存
+      （可能为负数）。与耗时一样，外层阶段包含了嵌套在其中的阶段
+    * peak_bytes / retained_bytes: 整个请求的内存峰值增量与保留量
+    '''
+    _active = False
+
+    @classmethod
+    def create(cls, route=None):
+        '''若当前没有其他 AllocationTracker 在工作，返回一个新的 tracker，否则返回 None'''
+        if cls._active:
+            return None
+        cls._active = True
+        return cls(route)
+
+    def __init__(self, route=None):
+        super().__init__(route)
+        self.allocations = []
+        self.peak_bytes = 0
+        self.retained_bytes = 0
+        self._open_marks = []
+        self._started_tracing = False
+        self._request_mark = None
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._request_mark = self.begin()
+
+    def stop(self):
+        try:
+            if self._request_mark is None:
+                # start() 没有成功完成
+                return
+            mark = self._end(self._request_mark)
+            self.peak_bytes = mark.peak_bytes - mark.start_bytes
+            self.retained_bytes = tracemalloc.get_traced_memory()[0] - mark.start_bytes
+        finally:
+            if self._started_tracing:
+                tracemalloc.stop()
+            type(self)._active = False
+
+    def begin(self):
+        current, peak = tracemalloc.get_traced_memory()
+        # reset_peak() 会清除尚未结束的外层阶段所关心的峰值，所以先把目前为止的峰值计入它们
+        for mark in self._open_marks:
+            mark.peak_bytes = max(mark.peak_bytes, peak)
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        # Python 3.9 之前没有 reset_peak()，此时峰值是从开始追踪以来的最大值，可能偏大
+        mark = _AllocationMark(time.perf_counter(), current)
+        self._open_marks.append(mark)
+        return mark
+
+    def _end(self, mark):
+        peak = tracemalloc.get_traced_memory()[1]
+        for open_mark in self._open_marks:
+            open_mark.peak_bytes = max(open_mark.peak_bytes, peak)
+        self._open_marks.remove(mark)
+        return mark
+
+    def add(self, phase, started, route=None):
+        mark = self._end(started)
+        super().add(phase, mark.started, route)
+        self.allocations.append((
+            route, phase, mark.peak_bytes - mark.start_bytes, tracemalloc.get_traced_memory()[0] - mark.start_bytes))
+
+    def allocation_totals(self):
+        '''与 `totals()` 类似，把同一个 route 的同一个阶段合并起来，返回 [(route, phase, peak_bytes, retained_bytes), ...]。
+        合并时 peak_bytes 取最大值，retained_bytes 相加'''
+        totals = {}
+        for route, phase, peak_bytes, retained_bytes in self.allocations:
+            key = (route if route is not None else self.route, phase)
+            if key in totals:
+                peak_bytes = max(peak_bytes, totals[key][0])
+                retained_bytes += totals[key][1]
+            totals[key] = (peak_bytes, retained_bytes)
+        return [(route, phase, peak_bytes, retained_bytes) for (route, phase), (peak_bytes, retained_bytes) in totals.items()]
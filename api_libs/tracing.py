@@ -0,0 +1,280 @@
+'''
+分布式追踪：把一次请求拆分成若干 span，记录 adapter 处理请求、router 调用各个 interface（包括通过 `Context.call()`
+发起的嵌套调用）以及参数检查各自的起止时间与父子关系。
+
+    exporter = FileExporter('/var/log/api-spans.jsonl')
+    tracer = Tracer(exporter, sample_rate=0.01)
+    adapter = TornadoAdapter(router, tracer=tracer)
+
+* 请求带有 W3C Trace Context 格式的 ``traceparent`` Header 时，span 会沿用其中的 trace id，并以其中的 span 为父 span；
+  respect_parent=True（默认）时，是否采样也由 Header 中的 sampled 标记决定。
+  在被追踪的请求中通过 `api_libs.client.APIClient` 调用其他服务时，会自动附带 traceparent Header
+* 没有被采样的请求不会创建任何 span，此时 router 与 interface 每次调用只多出一次 ContextVar 的读取
+* 一个 trace 中的 span 会在根 span（adapter 处理请求的 span）结束时一起交给 exporter；
+  在这之后才结束的 span（例如请求返回后仍在运行的后台任务）会单独交给 exporter
+* exporter 是任何拥有 ``export(spans)`` 方法的对象，spans 是 `Span` 的列表。export() 在 event loop 线程中被调用，
+  不应执行耗时的操作；它抛出的异常会被记录到日志中，不会影响请求的处理
+
+span 的 kind：
+
+* server: adapter 处理一个 HTTP 请求
+* route: router 调用一个 interface，name 为 route 名称；嵌套调用的 attributes 中 nested 为 True
+* validate: interface 检查参数、构建 `Arguments` 对象
+'''
+import asyncio
+import contextvars
+import inspect
+import json
+import logging
+import random
+import re
+import threading
+import time
+
+__all__ = ['Tracer', 'Span', 'InMemoryExporter', 'FileExporter', 'current_span']
+
+logger = logging.getLogger(__name__)
+
+
+_current_span = contextvars.ContextVar('api_libs_trace_span', default=None)
+
+_TRACEPARENT_PATTERN = re.compile(r'^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+
+def current_span():
+    '''返回当前正在进行中的 span，当前请求没有被追踪时返回 None'''
+    return _current_span.get()
+
+
+def activate(span):
+    '''把 span 设为当前的 span（对当前的 asyncio task 及它之后创建的 task 有效），返回用于 deactivate() 的 token'''
+    return _current_span.set(span)
+
+
+def deactivate(token):
+    _current_span.reset(token)
+
+
+def parse_traceparent(value):
+    '''解析 traceparent Header，返回 (trace_id, parent_span_id, sampled)，格式不合法时返回 None'''
+    match = _TRACEPARENT_PATTERN.match(value.strip().lower()) if value else None
+    if match is None:
+        return None
+    version, trace_id, span_id, flags = match.groups()
+    if version == 'ff' or trace_id == '0' * 32 or span_id == '0' * 16:
+        return None
+    return trace_id, span_id, bool(int(flags, 16) & 1)
+
+
+class _Trace:
+    '''同一个 trace 中、尚未交给 exporter 的 span'''
+    def __init__(self, exporter):
+        self.exporter = exporter
+        self.finished = []
+        self.exported = False
+        self.root = None
+
+
+class Span:
+    '''
+    Attributes:
+
+    * name / kind: span 的名称与种类
+    * trace_id / span_id / parent_id: 十六进制字符串，parent_id 为 None 代表这是 trace 中的第一个 span
+    * start_time: 开始的时间（unix 时间戳）
+    * duration: 持续的时间（秒），尚未结束时为 None
+    * attributes: dict，附加的信息
+    * error: 导致 span 失败的异常的描述，没有失败时为 None
+    '''
+    def __init__(self, trace, name, kind, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = '{:016x}'.format(random.getrandbits(64))
+        self.parent_id = parent_id
+        self.start_time = time.time()
+        self.duration = None
+        self.attributes = attributes or {}
+        self.error = None
+        self._trace = trace
+        self._started = time.perf_counter()
+
+    def child(self, name, kind, attributes=None):
+        '''创建一个以当前 span 为父 span 的新 span'''
+        return Span(self._trace, name, kind, self.trace_id, self.span_id, attributes)
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_error(self, error):
+        self.error = '{}: {}'.format(type(error).__name__, error) if isinstance(error, BaseException) else str(error)
+
+    def finish(self):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._started
+        trace = self._trace
+        if trace.exported:
+            _export(trace.exporter, [self])
+            return
+        trace.finished.append(self)
+        if self is trace.root:
+            trace.exported = True
+            _export(trace.exporter, trace.finished)
+            trace.finished = []
+
+    def traceparent(self):
+        '''生成传给下游服务的 traceparent Header 的值'''
+        return '00-{}-{}-01'.format(self.trace_id, self.span_id)
+
+    def to_dict(self):
+        return dict(
+            name=self.name, kind=self.kind, trace_id=self.trace_id, span_id=self.span_id, parent_id=self.parent_id,
+            start_time=self.start_time, duration_ms=None if self.duration is None else self.duration * 1000,
+            attributes=self.attributes, error=self.error,
+        )
+
+
+def _export(exporter, spans):
+    try:
+        exporter.export(spans)
+    except Exception:
+        logger.exception('export span 失败')
+
+
+class Tracer:
+    def __init__(self, exporter, sample_rate=1.0, respect_parent=True):
+        '''
+        :arg exporter: 接收已结束的 span 的对象，见 `InMemoryExporter`、`FileExporter`
+        :arg float sample_rate: 没有 traceparent Header（或 respect_parent=False）时，追踪这个比例（0 ~ 1）的请求。
+          可以在运行时修改
+        :arg bool respect_parent: 请求带有 traceparent Header 时，是否按照其中的 sampled 标记决定是否追踪
+        '''
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.respect_parent = respect_parent
+
+    def start_trace(self, name, traceparent=None, kind='server', attributes=None):
+        '''开始追踪一个请求，返回根 span；此请求没有被采样时返回 None
+
+        :arg string traceparent: 请求中的 traceparent Header 的值'''
+        parent = parse_traceparent(traceparent) if traceparent is not None else None
+        if parent is not None and self.respect_parent:
+            sampled = parent[2]
+        else:
+            sampled = self.sample_rate >= 1 or random.random() < self.sample_rate
+        if not sampled:
+            return None
+        trace_id = parent[0] if parent is not None else '{:032x}'.format(random.getrandbits(128))
+        trace = _Trace(self.exporter)
+        trace.root = Span(trace, name, kind, trace_id, parent[1] if parent is not None else None, attributes)
+        return trace.root
+
+
+def trace_call(kind, name, fn, *args, **kwargs):
+    '''在当前 span 之下创建一个子 span，并在这个 span 中调用 fn（期间它是当前的 span）。
+    若 fn 返回 coroutine / future，会在它执行完毕时才结束 span，执行期间它同样是当前的 span'''
+    parent = _current_span.get()
+    span = parent.child(name, kind)
+    if kind == 'route' and parent.kind == 'route':
+        span.set_attribute('nested', True)
+    token = _current_span.set(span)
+    try:
+        ret_val = fn(*args, **kwargs)
+    except Exception as e:
+        span.set_error(e)
+        span.finish()
+        raise
+    finally:
+        _current_span.reset(token)
+    if inspect.isawaitable(ret_val):
+        return _trace_async(span, ret_val)
+    span.finish()
+    return ret_val
+
+
+async def _trace_async(span, awaitable):
+    token = _current_span.set(span)
+    try:
+        return await awaitable
+    except BaseException as e:
+        span.set_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.finish()
+
+
+class InMemoryExporter:
+    '''把 span 保存在内存中，一般用于测试'''
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        with self._lock:
+            self.spans.extend(spans)
+
+    def clear(self):
+        with self._lock:
+            self.spans = []
+
+
+class FileExporter:
+    '''把 span 以 JSON Lines 的格式（每行一个 `Span.to_dict()`）追加写入本地文件。
+
+    export() 只把 span 放入内存中的缓冲区，缓冲的内容超过 buffer_size 个字符后，才在线程池中写入文件，
+    不会在 event loop 中执行磁盘 I/O。进程退出前应调用 close()（或 flush()），把缓冲区中剩下的 span 写入文件
+    '''
+    def __init__(self, path, buffer_size=64 * 1024):
+        self.path = path
+        self.buffer_size = buffer_size
+        self._file = None
+        self._buffer = []
+        self._buffered = 0
+        self._writing = False
+        self._lock = threading.Lock()           # 保护缓冲区
+        self._file_lock = threading.Lock()      # 保护文件
+
+    def export(self, spans):
+        lines = ''.join(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + '\n' for span in spans)
+        with self._lock:
+            self._buffer.append(lines)
+            self._buffered += len(lines)
+            if self._buffered < self.buffer_size or self._writing:
+                return
+            self._writing = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 不在 event loop 中时，直接写入
+            self._write()
+        else:
+            loop.run_in_executor(None, self._write)
+
+    def _write(self, flush=False):
+        with self._file_lock:
+            with self._lock:
+                lines = ''.join(self._buffer)
+                self._buffer = []
+                self._buffered = 0
+                self._writing = False
+            try:
+                if lines and self._file is None:
+                    self._file = open(self.path, 'a')
+                if self._file is not None:
+                    self._file.write(lines)
+                    if flush:
+                        self._file.flush()
+            except OSError:
+                logger.exception('无法写入 span: %s', self.path)
+
+    def flush(self):
+        self._write(flush=True)
+
+    def close(self):
+        self._write()
+        with self._file_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
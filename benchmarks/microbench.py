@@ -0,0 +1,350 @@
+'''
+api_libs 核心路径的 microbenchmark：各类 Parameter 的检查、Arguments 的构建、Router / Context 的调用分发，
+以及在本机回环地址上通过 TornadoAdapter 发起的完整请求。
+
+    python -m benchmarks.microbench                                   # 运行全部 case，输出文本表格
+    python -m benchmarks.microbench --filter param.str --repeat 10    # 只运行名称中包含 param.str 的 case
+    python -m benchmarks.microbench --output result.json              # 把结果以 JSON 格式写入文件
+    python -m benchmarks.microbench --save-baseline baseline.json     # 把本次结果保存为 baseline
+    python -m benchmarks.microbench --compare baseline.json --threshold 0.1
+    python -m benchmarks.microbench --router myapp.api:router        # 额外为 router 中的每个 route 生成 case
+
+每个 case 会先自动确定循环次数（使单轮耗时不少于 --min-time 秒），再重复运行 --repeat 轮，
+记录每次调用的平均耗时（纳秒）的最小值和中位数。
+与 baseline 比较时使用最小值：它受机器上其他负载的干扰最小。
+比 baseline 慢了超过 threshold（比例）的 case 会被列为 regression，此时程序以 exit code 1 退出，便于在 CI 中使用。
+
+指定 --router 时，会根据各 route 的参数定义（见 `api_libs.parameters.generator`）生成参数值，
+为每个 route 注册 route.<path>.valid 和 route.<path>.invalid 两个 case。生成时使用固定的 seed，每次运行的输入都相同。
+'''
+import argparse
+import asyncio
+import datetime
+import inspect
+import itertools
+import json
+import platform
+import statistics
+import sys
+import timeit
+from api_libs.parameters import Int, Float, Decimal, Str, Bool, Object, Datetime, Date, List, Dict, \
+    CanHas, CanNotHas, Arguments, VerifyFailed, ArgumentsError
+from api_libs import APILibError
+from api_libs.loadtest import load_target
+from api_libs.parameters.generator import PayloadGenerator, GenerateFailed
+from api_libs.route import Router, Context
+
+
+CASES = {
+    # name: 要计时的无参数函数
+}
+
+
+def case(name):
+    def wrapper(fn):
+        CASES[name] = fn
+        return fn
+    return wrapper
+
+
+def verify_case(name, param, arguments, valid=True):
+    '''注册一个检查单个 parameter 的 case。valid=False 时，参数值应该无法通过检查'''
+    if valid:
+        CASES[name] = lambda: param.verify(arguments)
+        return
+
+    def verify_invalid():
+        try:
+            param.verify(arguments)
+        except VerifyFailed:
+            return
+        raise AssertionError('{} 的参数值应该无法通过检查'.format(name))
+    CASES[name] = verify_invalid
+
+
+# ===== 各类 Parameter =====
+
+verify_case('param.int.valid', Int('a', min=0, max=100), dict(a=50))
+verify_case('param.int.invalid', Int('a', min=0, max=100), dict(a='50'), valid=False)
+verify_case('param.float.valid', Float('a', min=0), dict(a=1.5))
+verify_case('param.float.invalid', Float('a', min=0), dict(a=-1.5), valid=False)
+verify_case('param.decimal.valid', Decimal('a'), dict(a='123.456'))
+verify_case('param.decimal.invalid', Decimal('a'), dict(a='abc'), valid=False)
+verify_case('param.str.short', Str('a', max_len=20), dict(a='hello, world'))
+verify_case('param.str.long', Str('a'), dict(a='<p>' + 'x' * 10000 + '</p>'))
+verify_case('param.str.regex', Str('a', regex=r'^[\w.+-]+@[\w-]+\.[\w.]+$'), dict(a='someone@example.com'))
+verify_case('param.str.regex_invalid', Str('a', regex=r'^[\w.+-]+@[\w-]+\.[\w.]+$'), dict(a='someone'), valid=False)
+verify_case('param.str.choices', Str('a', choices=['red', 'green', 'blue']), dict(a='green'))
+verify_case('param.bool.valid', Bool('a'), dict(a=True))
+verify_case('param.bool.invalid', Bool('a'), dict(a='true'), valid=False)
+verify_case('param.object.valid', Object('a', type=dict), dict(a={}))
+verify_case('param.datetime.valid', Datetime('a'), dict(a=1500000000))
+verify_case('param.datetime.invalid', Datetime('a'), dict(a='2017-07-14'), valid=False)
+verify_case('param.date.valid', Date('a'), dict(a=1500000000))
+verify_case('param.list.small', List('a', type=Int()), dict(a=list(range(10))))
+verify_case('param.list.large', List('a', type=Int(), max_len=10000), dict(a=list(range(1000))))
+verify_case('param.list.invalid', List('a', type=Int()), dict(a=list(range(999)) + ['x']), valid=False)
+verify_case('param.dict.small', Dict('a', format=[Int('x'), Str('y')]), dict(a=dict(x=1, y='y')))
+verify_case('param.dict.invalid', Dict('a', format=[Int('x'), Str('y')]), dict(a=dict(x=1, z='z')), valid=False)
+verify_case('param.canhas', CanHas('a'), dict(a=object()))
+verify_case('param.cannothas', CanNotHas('a'), dict())
+verify_case('param.missing.invalid', Int('a'), dict(), valid=False)
+
+
+# ===== Arguments =====
+
+WIDE_PARAMETERS = [Int('int{}'.format(i)) for i in range(25)] + [Str('str{}'.format(i)) for i in range(25)]
+WIDE_ARGUMENTS = dict(
+    {'int{}'.format(i): i for i in range(25)},
+    **{'str{}'.format(i): 'value {}'.format(i) for i in range(25)})
+
+
+def build_deep(depth):
+    '''构建 depth 层嵌套的 Dict，以及与之对应的参数值'''
+    param, value = Int('leaf'), 1
+    arguments = dict(leaf=value)
+    parameters = [param]
+    for level in range(depth):
+        name = 'level{}'.format(level)
+        parameters = [Dict(name, format=parameters + [Str('label')])]
+        arguments = {name: dict(arguments, label=name)}
+    return parameters, arguments
+
+
+DEEP_PARAMETERS, DEEP_ARGUMENTS = build_deep(8)
+
+
+@case('arguments.wide')
+def arguments_wide():
+    Arguments(WIDE_PARAMETERS, WIDE_ARGUMENTS)
+
+
+@case('arguments.deep')
+def arguments_deep():
+    Arguments(DEEP_PARAMETERS, DEEP_ARGUMENTS)
+
+
+@case('arguments.unexpected')
+def arguments_unexpected():
+    try:
+        Arguments(WIDE_PARAMETERS, dict(WIDE_ARGUMENTS, extra=1))
+    except ArgumentsError:
+        return
+    raise AssertionError('多余的参数应该无法通过检查')
+
+
+# ===== Router / Context =====
+
+router = Router(Context)
+
+
+@router.register('bench.noop')
+def noop(context):
+    return None
+
+
+@router.register('bench.args', [Int('id'), Str('name')])
+def with_args(context, args):
+    return args.id
+
+
+@router.register('bench.nested')
+def nested(context):
+    return context.call('bench.args', dict(id=1, name='x'))
+
+
+@router.register('bench.async')
+async def async_noop(context):
+    return None
+
+
+case('router.call.noop')(lambda: router.call('bench.noop'))
+case('router.call.args')(lambda: router.call('bench.args', None, dict(id=1, name='x')))
+case('router.call.nested')(lambda: router.call('bench.nested'))
+
+
+_loop = None
+
+
+def run_async(coro):
+    global _loop
+    if _loop is None:
+        _loop = asyncio.new_event_loop()
+    return _loop.run_until_complete(coro)
+
+
+case('router.call.async')(lambda: run_async(router.call('bench.async')))
+
+
+# ===== TornadoAdapter =====
+
+_tornado = {}
+
+
+def tornado_request():
+    if not _tornado:
+        run_async(start_tornado())
+    run_async(_tornado['fetch']())
+
+
+async def start_tornado():
+    from tornado.httpclient import AsyncHTTPClient
+    from tornado.httpserver import HTTPServer
+    from tornado.netutil import bind_sockets
+    from tornado.web import Application
+    from api_libs.adapters.tornado_adapter import TornadoAdapter
+
+    adapter = TornadoAdapter(router)
+    sockets = bind_sockets(0, '127.0.0.1')
+    HTTPServer(Application([('/api/(.+)', adapter.RequestHandler)])).add_sockets(sockets)
+    url = 'http://127.0.0.1:{}/api/bench.args'.format(sockets[0].getsockname()[1])
+    client = AsyncHTTPClient()
+    body = json.dumps(dict(id=1, name='x'))
+
+    async def fetch():
+        await client.fetch(url, method='POST', body=body, headers={'Content-Type': 'application/json'})
+    _tornado['fetch'] = fetch
+
+
+case('tornado.request')(tornado_request)
+
+
+# ===== 根据参数定义自动生成的 case =====
+
+def add_router_cases(target_router, seed=0, samples=20):
+    '''为 target_router 中的每个 route 注册 valid / invalid 两个 case。
+    每个 case 轮流使用预先生成的 samples 组参数值。无法生成参数值或调用出错的 route 会被跳过
+
+    :return: 注册的 case 名称列表'''
+    generator = PayloadGenerator(seed=seed)
+    names = []
+    for path in sorted(target_router.interfaces):
+        try:
+            valid = [generator.route_arguments(target_router, path) for _ in range(samples)]
+            invalid = [generator.route_arguments(target_router, path, valid=False)[0] for _ in range(samples)]
+        except GenerateFailed as e:
+            print('跳过 {}: {}'.format(path, e), file=sys.stderr)
+            continue
+
+        valid_fn = route_case(target_router, path, valid, expect_error=False)
+        invalid_fn = route_case(target_router, path, invalid, expect_error=True)
+        try:
+            valid_fn()
+            invalid_fn()
+        except Exception as e:
+            print('跳过 {}: {!r}'.format(path, e), file=sys.stderr)
+            continue
+        for name, fn in [('route.{}.valid'.format(path), valid_fn), ('route.{}.invalid'.format(path), invalid_fn)]:
+            CASES[name] = fn
+            names.append(name)
+    return names
+
+
+def route_case(target_router, path, payloads, expect_error):
+    payloads = itertools.cycle(payloads)
+
+    def call():
+        try:
+            ret_val = target_router.call(path, None, next(payloads))
+            if inspect.isawaitable(ret_val):
+                run_async(ret_val)
+        except APILibError:
+            if expect_error:
+                return
+            raise
+        if expect_error:
+            raise AssertionError('{} 的参数值应该无法通过检查'.format(path))
+    return call
+
+
+# ===== 运行与比较 =====
+
+def measure(fn, repeat, min_time):
+    '''返回 dict(min_ns, median_ns, loops, repeat)：每次调用的平均耗时'''
+    fn()    # 预热，并提前暴露 case 本身的错误
+    timer = timeit.Timer(fn)
+    loops = 1
+    while True:
+        elapsed = timer.timeit(loops)
+        if elapsed >= min_time:
+            break
+        loops = max(loops * 2, int(loops * min_time / max(elapsed, 1e-9) * 1.1))
+    samples = [timer.timeit(loops) / loops * 1e9 for _ in range(repeat)]
+    return dict(min_ns=min(samples), median_ns=statistics.median(samples), loops=loops, repeat=repeat)
+
+
+def run(names, repeat, min_time):
+    results = {}
+    for name in names:
+        results[name] = measure(CASES[name], repeat, min_time)
+        print('{:<28} {:>12.0f} ns/op   (median {:.0f})'.format(
+            name, results[name]['min_ns'], results[name]['median_ns']), file=sys.stderr)
+    return dict(
+        meta=dict(
+            python=platform.python_version(),
+            implementation=platform.python_implementation(),
+            machine=platform.machine(),
+            time=datetime.datetime.now().isoformat(timespec='seconds'),
+        ),
+        results=results,
+    )
+
+
+def compare(report, baseline, threshold):
+    '''与 baseline 进行比较，返回 [(name, baseline_ns, current_ns, ratio, is_regression), ...]'''
+    rows = []
+    for name, result in sorted(report['results'].items()):
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        ratio = result['min_ns'] / base['min_ns']
+        rows.append((name, base['min_ns'], result['min_ns'], ratio, ratio > 1 + threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filter', default='', help='只运行名称中包含此字符串的 case')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.1, help='每轮至少运行多少秒')
+    parser.add_argument('--output', help='把结果以 JSON 格式写入此文件，为 - 时输出到 stdout')
+    parser.add_argument('--save-baseline', help='把结果保存为 baseline 文件')
+    parser.add_argument('--compare', help='与此 baseline 文件进行比较')
+    parser.add_argument('--threshold', type=float, default=0.1, help='比 baseline 慢多少（比例）算作 regression')
+    parser.add_argument('--list', action='store_true', help='列出所有 case 的名称')
+    parser.add_argument('--router', help='module:attribute，为这个 Router 中的每个 route 生成 case')
+    parser.add_argument('--seed', type=int, default=0, help='--router 生成参数值时使用的随机数种子')
+    options = parser.parse_args(argv)
+
+    if options.router:
+        add_router_cases(load_target(options.router), options.seed)
+
+    names = [name for name in CASES if options.filter in name]
+    if options.list:
+        print('\n'.join(names))
+        return 0
+
+    report = run(names, options.repeat, options.min_time)
+    for path in [options.output, options.save_baseline]:
+        if path == '-':
+            print(json.dumps(report, indent=2))
+        elif path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+        rows = compare(report, baseline, options.threshold)
+        regressions = [row for row in rows if row[4]]
+        for name, base_ns, current_ns, ratio, is_regression in rows:
+            print('{:<28} {:>12.0f} -> {:>12.0f} ns/op   {:+7.1%}{}'.format(
+                name, base_ns, current_ns, ratio - 1, '   REGRESSION' if is_regression else ''))
+        if regressions:
+            print('{} 个 case 比 baseline 慢了超过 {:.0%}'.format(len(regressions), options.threshold))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+'''
+在本机回环地址上对比 SocketAdapter 与 TornadoAdapter 的吞吐量和延迟。
+
+    python -m benchmarks.socket_vs_tornado --calls 5000 --concurrency 32
+
+两个 adapter 绑定同一个 router，对相同的 route 发起相同数量的调用。
+'''
+import argparse
+import asyncio
+import json
+import time
+from tornado.httpclient import AsyncHTTPClient
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+from tornado.web import Application
+from api_libs.adapters.tornado_adapter import TornadoAdapter
+from api_libs.adapters.socket_adapter import SocketAdapter, SocketClient
+from api_libs.parameters import Str, List, Int
+from api_libs.route import Router, Context
+
+
+ROUTES = {
+    'echo': dict(text='hello, world'),
+    'sum': dict(numbers=list(range(100))),
+}
+
+
+def build_router():
+    # 两个 adapter 的 context data 类型不同，这里的 interface 都不依赖 context，用最基础的 Context 即可
+    router = Router(Context)
+
+    @router.register('echo', [Str('text')])
+    def echo(context, args):
+        return args.text
+
+    @router.register('sum', [List('numbers', type=Int())])
+    def sum_numbers(context, args):
+        return sum(args.numbers)
+
+    return router
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))
+    return sorted_values[index]
+
+
+async def drive(call, route, calls, concurrency):
+    latencies = []
+    queue = iter(range(calls))
+
+    async def worker():
+        for _ in queue:
+            started = time.perf_counter()
+            await call(route, ROUTES[route])
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return dict(
+        calls=calls,
+        throughput=calls / elapsed,
+        p50_ms=percentile(latencies, 50) * 1000,
+        p99_ms=percentile(latencies, 99) * 1000,
+    )
+
+
+async def bench_tornado(router, calls, concurrency):
+    adapter = TornadoAdapter(router)
+    sockets = bind_sockets(0, '127.0.0.1')
+    port = sockets[0].getsockname()[1]
+    server = HTTPServer(Application([('/api/(.+)', adapter.RequestHandler)]))
+    server.add_sockets(sockets)
+    client = AsyncHTTPClient(max_clients=concurrency)
+
+    async def call(route, arguments):
+        response = await client.fetch(
+            'http://127.0.0.1:{}/api/{}'.format(port, route), method='POST', body=json.dumps(arguments),
+            headers={'Content-Type': 'application/json'})
+        return json.loads(response.body)
+
+    try:
+        return {route: await drive(call, route, calls, concurrency) for route in ROUTES}
+    finally:
+        server.stop()
+
+
+async def bench_socket(router, calls, concurrency):
+    adapter = SocketAdapter(router, max_concurrency=concurrency)
+    server = await adapter.start_server('127.0.0.1', 0)
+    client = await SocketClient.connect('127.0.0.1', server.sockets[0].getsockname()[1])
+    try:
+        return {route: await drive(client.call, route, calls, concurrency) for route in ROUTES}
+    finally:
+        await client.close()
+        server.close()
+        await server.wait_closed()
+
+
+async def main(calls, concurrency):
+    router = build_router()
+    results = dict(
+        tornado=await bench_tornado(router, calls, concurrency),
+        socket=await bench_socket(router, calls, concurrency),
+    )
+    for adapter_name, routes in results.items():
+        for route, result in routes.items():
+            print('{:<8} {:<6} {:>10.0f} calls/s   p50 {:>7.3f} ms   p99 {:>7.3f} ms'.format(
+                adapter_name, route, result['throughput'], result['p50_ms'], result['p99_ms']))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    options = parser.parse_args()
+    asyncio.run(main(options.calls, options.concurrency))
@@ -18,12 +18,16 @@ setup(
     packages=['api_libs', "api_libs.adapters", "api_libs.parameters"],
     zip_safe=False,
     platforms='any',
+    python_requires='>=3.7',
     keywords=['api', 'tornado'],
     classifiers=[
         'Intended Audience :: Developers',
         'License :: OSI Approved :: MIT License',
         'Operating System :: OS Independent',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
     ],
 )